@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import City, User, Type, Service, Result, Appointment, Lab, UserRating, Notification
+from .models import City, User, Type, Service, Result, Appointment, Lab, UserRating, Notification, LabOpeningHours
 
 
 @admin.register(City)
@@ -47,8 +47,14 @@ class PatientAdmin(admin.ModelAdmin):
 # admin.site.register(Patient, PatientAdmin)
 
 
+class LabOpeningHoursInline(admin.TabularInline):
+    model = LabOpeningHours
+    extra = 0
+
+
 @admin.register(Lab)
 class LabAdmin(admin.ModelAdmin):
+    inlines = [LabOpeningHoursInline]
     fieldsets = (
         (None, {
             'fields': ['city', 'name', 'password', 'address', 'phone_number', 'email', 'website']
@@ -61,6 +67,10 @@ class LabAdmin(admin.ModelAdmin):
     list_filter = ['name', 'city']
     search_fields = ("name__startswith",)
 
+    def get_queryset(self, request):
+        # the search vector is rebuilt on save, see lab_saved
+        return super().get_queryset(request).defer('search_vector')
+
 
 # admin.site.register(Lab, LabAdmin)
 
@@ -152,14 +162,14 @@ class NotificationAdmin(admin.ModelAdmin):
     fieldsets = (
         (None, {
             'fields': ['notification_lab', 'notification_user', 'notification_appointment', 'message', 'is_confirmed',
-                       'is_declined']
+                       'is_declined', 'is_read']
         }),
     )
 
     list_display = ['notification_lab', 'notification_user', 'notification_appointment', 'message', 'is_confirmed',
-                    'is_declined']
+                    'is_declined', 'is_read']
     empty_value_display = '-empty-'
     list_filter = ['notification_lab', 'notification_user', 'notification_appointment', 'is_confirmed',
-                   'is_declined']
+                   'is_declined', 'is_read']
 
 # admin.site.register(Notification, NotificationAdmin)
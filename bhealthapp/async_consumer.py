@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pika
+from django.conf import settings
+from django.db import close_old_connections, connections
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+from bhealthapp.rabbitmq import get_rabbitmq_parameters
+
+logger = logging.getLogger(__name__)
+
+
+async def call(method, **kwargs):
+    """
+    Awaits a pika channel method that reports completion through `callback`.
+    """
+    future = asyncio.get_running_loop().create_future()
+    method(callback=lambda frame: future.done() or future.set_result(frame), **kwargs)
+    return await future
+
+
+async def open_rabbitmq_channel():
+    loop = asyncio.get_running_loop()
+    opened = loop.create_future()
+
+    def on_open_error(connection, error):
+        opened.set_exception(error if isinstance(error, Exception) else pika.exceptions.AMQPConnectionError(error))
+
+    AsyncioConnection(get_rabbitmq_parameters(), on_open_callback=opened.set_result,
+                      on_open_error_callback=on_open_error, custom_ioloop=loop)
+    connection = await opened
+
+    channel_opened = loop.create_future()
+    connection.channel(on_open_callback=channel_opened.set_result)
+    return await channel_opened
+
+
+class DeliveryTracker:
+    """
+    Acks deliveries whose batches finish out of order. One multi-ack covers every
+    delivery up to the oldest one still in flight; rejected deliveries are nacked
+    on their own.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.pending = deque()
+        self.done = set()
+        self.rejected = set()
+
+    def delivered(self, delivery_tag):
+        self.pending.append(delivery_tag)
+
+    def settle(self, delivery_tags, rejected):
+        for delivery_tag in rejected:
+            self.channel.basic_nack(delivery_tag=delivery_tag, requeue=False)
+        self.rejected.update(rejected)
+        self.done.update(delivery_tags)
+
+        ack = None
+        while self.pending and self.pending[0] in self.done:
+            delivery_tag = self.pending.popleft()
+            self.done.discard(delivery_tag)
+            if delivery_tag in self.rejected:
+                self.rejected.discard(delivery_tag)
+            else:
+                ack = delivery_tag
+
+        if ack is not None:
+            self.channel.basic_ack(delivery_tag=ack, multiple=True)
+
+
+class AsyncConsumerEngine:
+    """
+    Runs batch consumers on one asyncio loop over non-blocking AMQP connections. Each
+    queue gets its own channel and keeps up to `concurrency` batches in flight; the
+    ORM work of a batch runs in a thread pool, so a slow database write no longer
+    holds back the batches behind it.
+
+    Give consumers a prefetch_count of at least batch_size * concurrency, otherwise
+    the broker stops delivering before all slots are busy.
+    """
+
+    def __init__(self, consumers, channel_factory=open_rabbitmq_channel, concurrency=None):
+        self.consumers = consumers
+        self.channel_factory = channel_factory
+        self.concurrency = concurrency or settings.CONSUMER_ASYNC_CONCURRENCY
+        self.workers = self.concurrency * len(consumers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='consumer')
+        self.stopping = False
+
+    def start(self):
+        asyncio.run(self.main())
+
+    async def main(self):
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stop)
+
+        try:
+            await self.run()
+        finally:
+            await loop.run_in_executor(None, self.shutdown)
+
+    def stop(self):
+        """
+        Stops consuming once the batches in flight were handled.
+        """
+        self.stopping = True
+
+    async def run(self):
+        await asyncio.gather(*(self.consume(consumer) for consumer in self.consumers))
+        for consumer in self.consumers:
+            logger.info('%s', consumer.metrics)
+
+    async def consume(self, consumer):
+        loop = asyncio.get_running_loop()
+        channel = await self.channel_factory()
+        closed = asyncio.Event()
+        channel.add_on_close_callback(lambda channel, reason: closed.set())
+
+        await call(channel.queue_declare, queue=consumer.queue)
+        await call(channel.basic_qos, prefetch_count=consumer.prefetch_count)
+
+        deliveries = asyncio.Queue()
+        tracker = DeliveryTracker(channel)
+
+        def on_message(channel, method, properties, body):
+            tracker.delivered(method.delivery_tag)
+            deliveries.put_nowait((method, properties, body))
+
+        channel.basic_consume(consumer.queue, on_message_callback=on_message)
+        slots = asyncio.Semaphore(self.concurrency)
+        in_flight = set()
+
+        try:
+            while not self.stopping and not closed.is_set():
+                batch = await self.next_batch(consumer, deliveries)
+                if not batch:
+                    if consumer.exit_when_idle and not in_flight:
+                        break
+                    continue
+
+                await slots.acquire()
+                task = loop.create_task(self.handle(consumer, batch, tracker, slots))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+            if in_flight:
+                await asyncio.wait(in_flight)
+        finally:
+            # Deliveries that were not handled yet are redelivered by the broker.
+            if not closed.is_set():
+                channel.connection.close()
+
+        if closed.is_set() and not self.stopping and not consumer.exit_when_idle:
+            raise pika.exceptions.AMQPConnectionError(f'Channel for {consumer.queue} closed')
+
+    async def next_batch(self, consumer, deliveries):
+        loop = asyncio.get_running_loop()
+        try:
+            batch = [await asyncio.wait_for(deliveries.get(), consumer.batch_timeout)]
+        except asyncio.TimeoutError:
+            return []
+
+        deadline = loop.time() + consumer.batch_timeout
+        while len(batch) < consumer.batch_size:
+            if not deliveries.empty():
+                batch.append(deliveries.get_nowait())
+                continue
+            try:
+                batch.append(await asyncio.wait_for(deliveries.get(), deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def handle(self, consumer, batch, tracker, slots):
+        try:
+            rejected = await asyncio.get_running_loop().run_in_executor(self.executor, self.process, consumer, batch)
+            tracker.settle([method.delivery_tag for method, properties, body in batch], rejected)
+            consumer.record(batch, len(rejected))
+        finally:
+            slots.release()
+
+    @staticmethod
+    def process(consumer, batch):
+        close_old_connections()
+        return consumer.process(batch)
+
+    def shutdown(self):
+        """
+        Closes the database connection of every executor thread and stops the pool.
+        """
+        barrier = threading.Barrier(self.workers)
+
+        def close():
+            barrier.wait()
+            connections.close_all()
+
+        for future in [self.executor.submit(close) for _ in range(self.workers)]:
+            future.result()
+        self.executor.shutdown()
@@ -1,116 +1,204 @@
-import json
+import logging
+import time
 
-import pika
 from django.conf import settings
+from django.db import transaction
+
+from bhealthapp import event_schema, notification_stream
+from bhealthapp.models import Appointment, Notification
+from bhealthapp.rabbitmq import get_rabbitmq_connection
+
+logger = logging.getLogger(__name__)
+
+
+class ConsumerMetrics:
+    def __init__(self, queue):
+        self.queue = queue
+        self.started = time.monotonic()
+        self.messages = 0
+        self.batches = 0
+        self.failed = 0
+        self.lag = 0.0
+
+    def record(self, batch, failed=0):
+        self.batches += 1
+        self.messages += len(batch)
+        self.failed += failed
+
+        timestamps = [properties.timestamp for method, properties, body in batch if properties.timestamp]
+        self.lag = time.time() - min(timestamps) if timestamps else 0.0
+
+    @property
+    def throughput(self):
+        return self.messages / max(time.monotonic() - self.started, 1e-9)
+
+    def __str__(self):
+        return f'{self.queue}: {self.messages} messages in {self.batches} batches, {self.failed} failed, ' \
+               f'{self.throughput:.1f} msg/s, lag {self.lag:.0f}s'
+
+
+class BatchConsumer:
+    """
+    Consumes `queue` in batches. Up to `prefetch_count` unacknowledged messages are
+    delivered ahead, a batch is handled once `batch_size` messages arrived or the queue
+    was idle for `batch_timeout` seconds, and the whole batch is acked at once.
+
+    A batch that fails is retried one message at a time, so a single bad message is
+    rejected without dropping the rest.
+    """
+    queue = None
+
+    def __init__(self, connection_factory=get_rabbitmq_connection, prefetch_count=None, batch_size=None,
+                 batch_timeout=None, report_interval=60, exit_when_idle=False):
+        self.connection_factory = connection_factory
+        self.prefetch_count = prefetch_count or settings.CONSUMER_PREFETCH_COUNT
+        self.batch_size = min(batch_size or settings.CONSUMER_BATCH_SIZE, self.prefetch_count)
+        self.batch_timeout = settings.CONSUMER_BATCH_TIMEOUT if batch_timeout is None else batch_timeout
+        self.report_interval = report_interval
+        self.exit_when_idle = exit_when_idle
+        self.metrics = ConsumerMetrics(self.queue)
+        self.channel = None
+        self.stopping = False
+        self._last_report = time.monotonic()
+
+    def handle_batch(self, bodies):
+        raise NotImplementedError
 
-from bhealthapp.models import Result, Appointment, Notification, Lab, User
-
-
-class NewResultConsumer:
-    def __init__(self):
-        self.connection = pika.BlockingConnection(pika.ConnectionParameters(host=settings.CELERY_BROKER_URL))
-        self.channel = self.connection.channel()
-
-        self.channel.queue_declare(queue='results')
-        self.channel.basic_consume(queue='results', on_message_callback=self.process_notification)
-
-    def process_notification(self, channel, method, properties, body):
-        notification_data = json.loads(body)
-        notification_type = notification_data['type']
-        notification_payload = notification_data['data']
-
-        if notification_type == 'result_created':
-            appointments = list(Appointment.objects.filter(pk=notification_payload[0]['pk']))
-            notification_message = f'Result added for appointment(s) {", ".join([str(appointment) for appointment in appointments])}'
-
-            # Create new notification
-            notification = Notification.objects.create(
-                notification_lab=appointments[0].lab,
-                notification_user=appointments[0].patient,
-                notification_appointment=appointments[0],
-                message=notification_message,
+    def start(self):
+        connection = self.connection_factory()
+        self.channel = connection.channel()
+        self.channel.queue_declare(queue=self.queue)
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+
+        batch = []
+        try:
+            for method, properties, body in self.channel.consume(self.queue, inactivity_timeout=self.batch_timeout):
+                if method is not None:
+                    batch.append((method, properties, body))
+                if batch and (method is None or len(batch) >= self.batch_size or self.stopping):
+                    self.flush(batch)
+                    batch = []
+                if self.stopping or (method is None and self.exit_when_idle):
+                    break
+        finally:
+            # Messages of an unfinished batch are redelivered by the broker.
+            connection.close()
+
+    def stop(self):
+        """
+        Stops consuming after the batch in progress was handled. Safe to call from a
+        signal handler.
+        """
+        self.stopping = True
+
+    def flush(self, batch):
+        rejected = self.process(batch)
+
+        if not rejected:
+            self.channel.basic_ack(delivery_tag=batch[-1][0].delivery_tag, multiple=True)
+        else:
+            for method, properties, body in batch:
+                if method.delivery_tag in rejected:
+                    self.channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                else:
+                    self.channel.basic_ack(delivery_tag=method.delivery_tag)
+
+        self.record(batch, len(rejected))
+
+    def process(self, batch):
+        """
+        Handles a batch and returns the delivery tags of the messages that have to be
+        rejected. Does not touch the channel, so it can run on any thread.
+        """
+        try:
+            with transaction.atomic():
+                self.handle_batch([body for method, properties, body in batch])
+            return set()
+        except Exception:
+            logger.exception('Batch of %d messages from %s failed, retrying one by one.', len(batch), self.queue)
+
+        rejected = set()
+        for method, properties, body in batch:
+            try:
+                with transaction.atomic():
+                    self.handle_batch([body])
+            except Exception:
+                logger.exception('Rejecting message from %s: %r', self.queue, body)
+                rejected.add(method.delivery_tag)
+
+        return rejected
+
+    def record(self, batch, failed):
+        self.metrics.record(batch, failed)
+        if time.monotonic() - self._last_report >= self.report_interval:
+            self._last_report = time.monotonic()
+            logger.info('%s', self.metrics)
+
+
+class NotificationConsumer(BatchConsumer):
+    """
+    Turns every event into a Notification for the appointment it references. The
+    appointments of a batch are loaded with one query and the notifications written
+    with one bulk insert, counted as unread for their user and lab and announced to the
+    open notification streams.
+    """
+    event_type = None
+
+    def notification_message(self, event, appointment):
+        raise NotImplementedError
+
+    def parse(self, body):
+        event = event_schema.decode(body)
+        if not isinstance(event, self.event_type):
+            raise event_schema.EventDecodeError(f'Unexpected {type(event).__name__} on {self.queue}')
+        return event
+
+    def handle_batch(self, bodies):
+        events = [self.parse(body) for body in bodies]
+        appointments = Appointment.objects.in_bulk([event.appointment_id for event in events])
+
+        notifications = []
+        for event in events:
+            appointment = appointments.get(event.appointment_id)
+            if appointment is None:
+                logger.warning('Skipping %s message for missing appointment %s', self.queue, event.appointment_id)
+                continue
+
+            notifications.append(Notification(
+                notification_lab_id=appointment.lab_appointment_id,
+                notification_user_id=appointment.patient_id,
+                notification_appointment=appointment,
+                message=self.notification_message(event, appointment),
                 is_confirmed=False,
                 is_declined=False
-            )
-
-        channel.basic_ack(delivery_tag=method.delivery_tag)
-
-    def start_consuming(self):
-        self.channel.start_consuming()
+            ))
 
+        Notification.objects.bulk_create_unread(notifications)
+        notification_stream.publish(notifications)
 
-consumer = NewResultConsumer()
 
+class NewResultConsumer(NotificationConsumer):
+    queue = event_schema.ResultCreated.queue
+    event_type = event_schema.ResultCreated
 
-class RequestConsumer:
-    def __init__(self):
-        self.connection = pika.BlockingConnection(pika.ConnectionParameters(host=settings.CELERY_BROKER_URL))
-        self.channel = self.connection.channel()
+    def notification_message(self, event, appointment):
+        return f'Result added for appointment(s) {appointment}'
 
-        self.channel.queue_declare(queue='requests')
-        self.channel.basic_consume(queue='requests', on_message_callback=self.process_request)
 
-    def process_request(self, channel, method, properties, body):
-        request_data = json.loads(body)
-        lab_id = request_data['lab_id']
-        service_name = request_data['service_name']
-        date = request_data['date']
+class RequestConsumer(NotificationConsumer):
+    queue = event_schema.AppointmentRequested.queue
+    event_type = event_schema.AppointmentRequested
 
-        # Send notification to the lab
-        lab = Lab.objects.get(id=lab_id)
-        user = User.objects.get(id=lab.user_id)
-        appointment = Appointment.objects.create(lab=lab, service_name=service_name, date=date)
-        notification_message = f'New request for {service_name} on {date}'
-        notification = Notification.objects.create(
-            notification_lab=lab,
-            notification_user=user,
-            notification_appointment=appointment,
-            message=notification_message,
-            is_confirmed=False,
-            is_declined=False
-        )
+    def notification_message(self, event, appointment):
+        return f'New request for {event.service_name} on {event.date}'
 
-        channel.basic_ack(delivery_tag=method.delivery_tag)
 
-    def start_consuming(self):
-        self.channel.start_consuming()
+class AppointmentUpdatesConsumer(NotificationConsumer):
+    queue = event_schema.AppointmentUpdated.queue
+    event_type = event_schema.AppointmentUpdated
 
+    def notification_message(self, event, appointment):
+        return f'Appointment request updated, please confirm or decline: {appointment}'
 
-consumer = RequestConsumer()
 
-class AppointmentUpdatesConsumer:
-    def __init__(self):
-        self.connection = pika.BlockingConnection(
-            pika.ConnectionParameters(settings.RABBITMQ_HOST)
-        )
-        self.channel = self.connection.channel()
-        self.channel.queue_declare(queue='appointment_updates')
-        self.channel.basic_consume(
-            queue='appointment_updates', on_message_callback=self.callback, auto_ack=True
-        )
-
-    def start(self):
-        print('Appointment updates consumer started...')
-        self.channel.start_consuming()
-
-    def callback(self, ch, method, properties, body):
-        print('Received appointment update:', body)
-        appointment_id = body.split(': ')[1]
-        appointment = Appointment.objects.get(pk=appointment_id)
-        # Send notification to the user
-        notification_message = f'Appointment request updated, please confirm or decline: {appointment}'
-        notification = Notification.objects.create(
-
-            notification_lab=appointment.lab_appointment,
-            notification_user=appointment.patient,
-            notification_appointment=appointment,
-            message=notification_message,
-            is_confirmed=False,
-            is_declined=False
-        )
-        print(f'Notification sent to {appointment.patient.email}')
-
-
-if __name__ == '__main__': # check this part
-    consumer = AppointmentUpdatesConsumer()
-    consumer.start()
\ No newline at end of file
+CONSUMERS = {consumer.queue: consumer for consumer in (NewResultConsumer, RequestConsumer, AppointmentUpdatesConsumer)}
@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Lab, User, Appointment, Result, UserRating, City, Service
+from .serializers import LabViewSerializer, PatientViewSerializer, AppointmentViewSerializer, ResultViewSerializer
+
+logger = logging.getLogger(__name__)
+
+# Part of every key, bumped when the layout of the cached entries changes.
+ENTRY_FORMAT = 2
+
+# WeRecommendView caches the top labs of each ranking
+WE_RECOMMEND_RANKINGS = ('five_stars', 'average', 'volume')
+WE_RECOMMEND_CACHE_KEY = 'we_recommend:{}'
+WE_RECOMMEND_CACHE_TIMEOUT = 60 * 60
+
+
+class CacheMetrics:
+    """
+    Hits and misses per model in this process, logged every `report_interval` seconds.
+    """
+
+    def __init__(self, report_interval=300):
+        self.report_interval = report_interval
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.reported = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, label, hit):
+        with self._lock:
+            (self.hits if hit else self.misses)[label] += 1
+            due = time.monotonic() - self.reported >= self.report_interval
+            if due:
+                self.reported = time.monotonic()
+        if due:
+            logger.info('Detail cache %s', self)
+
+    def hit_rate(self, label):
+        total = self.hits[label] + self.misses[label]
+        return self.hits[label] / total if total else 0.0
+
+    def __str__(self):
+        return ', '.join(f'{label}: {self.hits[label]} hits, {self.misses[label]} misses '
+                         f'({self.hit_rate(label):.0%})' for label in sorted({*self.hits, *self.misses}))
+
+
+class DetailCache:
+    """
+    Read-through cache of serialized detail payloads, keyed by model, primary key and
+    serializer. Bump a serializer's `cache_version` attribute when its output changes.
+
+    Entries are deleted after the transaction that changed the object commits, so a
+    reader can not put the old payload back in between.
+    """
+
+    def __init__(self, alias='default', timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+        self.serializers = defaultdict(list)
+        self.metrics = CacheMetrics()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def register(self, model, serializer_class):
+        self.serializers[model].append(serializer_class)
+
+    def key(self, model, pk, serializer_class):
+        version = getattr(serializer_class, 'cache_version', 1)
+        return f'detail:{ENTRY_FORMAT}:{model._meta.label_lower}:{pk}:{serializer_class.__name__}:{version}'
+
+    def get_or_load(self, model, pk, serializer_class, load, last_modified):
+        """
+        Returns (data, modified, hit). On a miss `load(pk)` fetches the instance, it may
+        raise model.DoesNotExist, and `last_modified(instance)` is stored with the payload
+        so conditional requests are answered without loading it again. Raises django
+        ValidationError for a malformed pk.
+        """
+        pk = model._meta.pk.to_python(pk)
+        key = self.key(model, pk, serializer_class)
+
+        entry = self.cache.get(key)
+        hit = entry is not None
+        self.metrics.record(model._meta.label_lower, hit)
+        if not hit:
+            instance = load(pk)
+            entry = {'data': dict(serializer_class(instance).data), 'modified': last_modified(instance)}
+            timeout = settings.DETAIL_CACHE_TIMEOUT if self.timeout is None else self.timeout
+            self.cache.set(key, entry, timeout)
+
+        return entry['data'], entry['modified'], hit
+
+    def invalidate(self, model, pks):
+        keys = [self.key(model, pk, serializer_class) for pk in pks for serializer_class in self.serializers[model]]
+        if keys:
+            transaction.on_commit(lambda: self.cache.delete_many(keys))
+
+
+detail_cache = DetailCache()
+detail_cache.register(Lab, LabViewSerializer)
+detail_cache.register(User, PatientViewSerializer)
+detail_cache.register(Appointment, AppointmentViewSerializer)
+detail_cache.register(Result, ResultViewSerializer)
+
+
+def invalidate_recommendations():
+    keys = [WE_RECOMMEND_CACHE_KEY.format(rank_by) for rank_by in WE_RECOMMEND_RANKINGS]
+    # after commit, a request ranking the labs before it would cache the old ratings again
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_appointments(**lookup):
+    detail_cache.invalidate(Appointment, list(Appointment.objects.filter(**lookup).values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=Lab)
+@receiver(post_delete, sender=Lab)
+def lab_changed(sender, instance, **kwargs):
+    detail_cache.invalidate(Lab, [instance.pk])
+    # appointment payloads embed their lab
+    invalidate_appointments(lab_appointment_id=instance.pk)
+
+
+@receiver(post_save, sender=UserRating)
+@receiver(post_delete, sender=UserRating)
+def lab_rating_changed(sender, instance, **kwargs):
+    # the lab payload embeds its rating summary, the rankings are built from the ratings
+    detail_cache.invalidate(Lab, [instance.lab_id])
+    invalidate_recommendations()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    detail_cache.invalidate(User, [instance.pk])
+    # appointment payloads embed their patient
+    invalidate_appointments(patient_id=instance.pk)
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def city_changed(sender, instance, **kwargs):
+    # lab and profile payloads embed their city
+    detail_cache.invalidate(Lab, list(Lab.objects.filter(city_id=instance.pk).values_list('pk', flat=True)))
+    detail_cache.invalidate(User, list(User.objects.filter(city_id=instance.pk).values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def service_changed(sender, instance, **kwargs):
+    # appointment payloads embed their service
+    invalidate_appointments(service_appointment_id=instance.pk)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def appointment_changed(sender, instance, **kwargs):
+    detail_cache.invalidate(Appointment, [instance.pk])
+    # result payloads embed their appointment
+    detail_cache.invalidate(Result, list(Result.objects.filter(appointment_id=instance.pk).values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=Result)
+@receiver(post_delete, sender=Result)
+def result_changed(sender, instance, **kwargs):
+    detail_cache.invalidate(Result, [instance.pk])
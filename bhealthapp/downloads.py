@@ -0,0 +1,107 @@
+import os
+import re
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(storage, key):
+    """
+    Strong ETag built like nginx's (hex mtime and size), so it stays the same whether
+    Django or nginx sends the bytes. Clients may only resume ranged downloads against a
+    strong validator, blobs are content-addressed and never rewritten in place.
+    """
+    modified = storage.get_modified_time(key)
+    return quote_etag(f'{int(modified.timestamp()):x}-{storage.size(key):x}'), modified
+
+
+def parse_range(header, size):
+    """
+    Returns the (start, end) byte positions of a single range request, None to send
+    the whole file, or False when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if match is None or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if start == '':
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_range(file, start, end):
+    file.seek(start)
+    remaining = end - start + 1
+    try:
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def serve_file(request, field_file, content_type='application/pdf'):
+    """
+    Sends a stored file after the caller authorized the request. Depending on
+    RESULT_DOWNLOAD_BACKEND the bytes come from nginx (X-Accel-Redirect), a presigned
+    S3 URL, or are streamed by Django itself with Range support.
+    """
+    storage, key = field_file.storage, field_file.name
+    filename = os.path.basename(key)
+    backend = settings.RESULT_DOWNLOAD_BACKEND
+
+    if backend == 's3':
+        client = storage.bucket.meta.client
+        url = client.generate_presigned_url('get_object', ExpiresIn=settings.RESULT_DOWNLOAD_URL_EXPIRE, Params={
+            'Bucket': storage.bucket_name,
+            'Key': storage._normalize_name(key),
+            'ResponseContentDisposition': f'inline; filename="{filename}"',
+        })
+        response = HttpResponseRedirect(url)
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+    etag, modified = file_etag(storage, key)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    if backend == 'x-accel':
+        # nginx answers Range and conditional requests for the internal location itself.
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.RESULT_DOWNLOAD_ACCEL_PREFIX + key
+    else:
+        size = storage.size(key)
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(iter_range(storage.open(key, 'rb'), start, end), content_type=content_type,
+                                         status=206 if byte_range else 200)
+        response['Content-Length'] = end - start + 1
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified.timestamp())
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    response['Cache-Control'] = 'private'
+    return response
@@ -0,0 +1,102 @@
+"""
+Typed events exchanged over RabbitMQ and the msgpack codec shared by producers and
+consumers.
+
+An event is encoded as a msgpack array ``[type_code, version, *fields]``. Fields are
+only ever appended: a decoder fills fields missing from older producers with their
+defaults and ignores trailing fields added by newer ones. Messages published before
+this schema existed (JSON documents and plain strings) decode as version 0.
+"""
+import json
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+import msgpack
+from django.utils.dateparse import parse_datetime
+
+SCHEMA_VERSION = 1
+CONTENT_TYPE = 'application/x-msgpack'
+LEGACY_UPDATE_PREFIX = b'Appointment request updated: '
+
+
+class AppointmentRequested(NamedTuple):
+    appointment_id: int
+    lab_id: int
+    patient_id: int
+    service_name: str
+    date: Optional[datetime] = None
+
+    type_code = 1
+    queue = 'requests'
+
+
+class AppointmentUpdated(NamedTuple):
+    appointment_id: int
+    status: Optional[int] = None
+    date: Optional[datetime] = None
+
+    type_code = 2
+    queue = 'appointment_updates'
+
+
+class ResultCreated(NamedTuple):
+    appointment_id: int
+    result_id: Optional[int] = None
+
+    type_code = 3
+    queue = 'results'
+
+
+EVENT_TYPES = {event_type.type_code: event_type for event_type in (AppointmentRequested, AppointmentUpdated,
+                                                                    ResultCreated)}
+
+
+class EventDecodeError(ValueError):
+    pass
+
+
+def encode(event):
+    return msgpack.packb([event.type_code, SCHEMA_VERSION, *event], datetime=True)
+
+
+def decode(body):
+    if isinstance(body, str):
+        body = body.encode()
+
+    try:
+        message = msgpack.unpackb(body, timestamp=3)
+    except (ValueError, msgpack.UnpackException):
+        return decode_legacy(body)
+    if not isinstance(message, list) or len(message) < 2:
+        return decode_legacy(body)
+
+    type_code, version, *fields = message
+    if type_code not in EVENT_TYPES:
+        raise EventDecodeError(f'Unknown event type {type_code} (schema version {version})')
+
+    event_type = EVENT_TYPES[type_code]
+    fields = fields[:len(event_type._fields)]
+    if len(fields) < len(event_type._fields) - len(event_type._field_defaults):
+        raise EventDecodeError(f'{event_type.__name__} is missing fields')
+
+    return event_type(*fields)
+
+
+def decode_legacy(body):
+    """
+    Decodes the ad-hoc JSON and string messages producers sent before SCHEMA_VERSION 1.
+    """
+    if body.startswith(LEGACY_UPDATE_PREFIX):
+        try:
+            return AppointmentUpdated(int(body[len(LEGACY_UPDATE_PREFIX):]))
+        except ValueError:
+            raise EventDecodeError(f'Invalid appointment update {body!r}')
+
+    try:
+        message = json.loads(body)
+        if message.get('type') == 'result_created':
+            return ResultCreated(json.loads(message['data'])[0]['pk'])
+        return AppointmentRequested(message['id'], message['lab_id'], message['patient_id'], message['service_name'],
+                                    parse_datetime(message['date']) if message.get('date') else None)
+    except (ValueError, AttributeError, LookupError, TypeError):
+        raise EventDecodeError(f'Unrecognized message {body[:64]!r}')
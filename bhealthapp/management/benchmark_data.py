@@ -0,0 +1,58 @@
+from datetime import timedelta
+from typing import List, NamedTuple
+
+from bhealthapp.models import Country, City, User, Lab, Type, Service, Appointment
+
+
+class BenchmarkData(NamedTuple):
+    country: Country
+    city: City
+    service_type: Type
+    services: List[Service]
+    labs: List[Lab]
+    patients: List[User]
+
+    def delete(self):
+        """
+        Deletes the generated rows and the appointments of the generated labs, for commands
+        that have to commit them. Rows referencing those appointments, like notifications,
+        have to be deleted first.
+        """
+        Appointment.objects.filter(lab_appointment__in=self.labs).delete()
+        User.objects.filter(pk__in=[patient.pk for patient in self.patients]).delete()
+        Lab.objects.filter(pk__in=[lab.pk for lab in self.labs]).delete()
+        Service.objects.filter(pk__in=[service.pk for service in self.services]).delete()
+        self.service_type.delete()
+        self.city.delete()
+        self.country.delete()
+
+
+def create_benchmark_data(name='Benchmark', labs=1, patients=1, services=1, **patient_fields):
+    """
+    Creates the country, city, service type, services, labs and patients the benchmark
+    commands generate their appointments around. Rows are bulk created, no post_save
+    receivers run for them. `patient_fields` are set on every patient.
+    """
+    prefix = name.lower().replace(' ', '_')
+    country = Country.objects.create(name=f'{name} Country')
+    city = City.objects.create(name=f'{name} City', country=country, postal_code=71000)
+    service_type = Type.objects.create(name=f'{name} Type')
+
+    return BenchmarkData(
+        country=country,
+        city=city,
+        service_type=service_type,
+        services=Service.objects.bulk_create([
+            Service(name=f'{name} Service {i}', duration=timedelta(minutes=30), type=service_type)
+            for i in range(services)
+        ]),
+        labs=Lab.objects.bulk_create([
+            Lab(city=city, name=f'{name} Lab {i}', address=f'{name} Address', email=f'{prefix}_lab_{i}@bench.local')
+            for i in range(labs)
+        ], batch_size=1000),
+        patients=User.objects.bulk_create([
+            User(username=f'{prefix}_{i}', name='Name', surname='Surname', email=f'{prefix}_{i}@bench.local', city=city,
+                 **patient_fields)
+            for i in range(patients)
+        ], batch_size=1000),
+    )
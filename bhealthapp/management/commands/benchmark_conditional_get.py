@@ -0,0 +1,78 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from bhealthapp.management.benchmark_data import create_benchmark_data
+from bhealthapp.models import Appointment, Notification
+from bhealthapp.views import LabView, UpcomingAppointmentsLabView, NotificationListView
+
+
+class Command(BaseCommand):
+    help = 'Measures a poll answered with the full payload against one answered 304 from If-None-Match, ' \
+           'for --polls polls of LabView, a page of the lab appointment timeline and a page of notifications ' \
+           '(rolled back afterwards).'
+
+    factory = APIRequestFactory()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=200)
+        parser.add_argument('--appointments', type=int, default=500)
+        parser.add_argument('--page-size', type=int, default=12)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            lab, patient = self.create_data(options['appointments'])
+            page = {'page_size': options['page_size'], 'pagination': 'cursor'}
+
+            for name, view, params in (
+                ('lab detail', LabView, {'pk': lab.pk}),
+                ('lab timeline', UpcomingAppointmentsLabView, {'lab': lab.pk, **page}),
+                ('notifications', NotificationListView, {'notification_user': patient.pk, **page}),
+            ):
+                self.report(name, view, params, options['polls'])
+
+            transaction.set_rollback(True)
+
+    def create_data(self, count):
+        data = create_benchmark_data()
+        lab, patient, service = data.labs[0], data.patients[0], data.services[0]
+
+        now = timezone.now()
+        appointments = Appointment.objects.bulk_create([
+            Appointment(lab_appointment=lab, service_appointment=service, patient=patient,
+                        date=now + timedelta(hours=i + 1), status=Appointment.STATUS_CONFIRMED)
+            for i in range(count)
+        ])
+        Notification.objects.bulk_create([
+            Notification(notification_lab=lab, notification_user=patient, notification_appointment=appointment)
+            for appointment in appointments
+        ])
+        return lab, patient
+
+    def poll(self, view, params, **headers):
+        start = time.perf_counter()
+        response = view.as_view(throttle_classes=[])(self.factory.get('/', params, **headers))
+        if hasattr(response, 'render'):
+            response.render()
+        return time.perf_counter() - start, response
+
+    def report(self, name, view, params, polls):
+        etag = self.poll(view, params)[1]['ETag']
+
+        results = {}
+        for label, headers in (('full', {}), ('304', {'HTTP_IF_NONE_MATCH': etag})):
+            timings = []
+            for _ in range(polls):
+                elapsed, response = self.poll(view, params, **headers)
+                timings.append(elapsed)
+            results[label] = (statistics.median(timings), len(response.content), response.status_code)
+
+        (full_time, full_bytes, _), (conditional_time, conditional_bytes, status) = results['full'], results['304']
+        self.stdout.write(f'{name}: full {full_time * 1000:.2f}ms / {full_bytes:,} bytes, '
+                          f'{status} {conditional_time * 1000:.2f}ms / {conditional_bytes:,} bytes, '
+                          f'{1 - conditional_time / full_time:.0%} less time per poll')
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from bhealthapp.async_consumer import AsyncConsumerEngine
+from bhealthapp.consumer import AppointmentUpdatesConsumer
+from bhealthapp.management.benchmark_data import create_benchmark_data
+from bhealthapp.models import Appointment, Notification
+from bhealthapp.rabbitmq import RabbitMQPublisher
+from bhealthapp.rabbitmq_standin import InMemoryBroker
+
+
+class SlowDatabaseConsumer(AppointmentUpdatesConsumer):
+    latency = 0.0
+
+    def handle_batch(self, bodies):
+        # Stands in for the network round trip to a database on another host.
+        time.sleep(self.latency)
+        super().handle_batch(bodies)
+
+
+class Command(BaseCommand):
+    help = 'Compares messages/sec of the blocking consumer and the asyncio consumer engine against an in-memory ' \
+           'broker. The executor threads need committed rows, so the generated data is deleted afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--db-latency', type=float, default=0.01,
+                            help='Seconds of simulated database latency per batch.')
+
+    def handle(self, *args, **options):
+        SlowDatabaseConsumer.latency = options['db_latency']
+        data = create_benchmark_data('Benchmark Consumer', patients=100)
+        appointments = self.create_appointments(data)
+        try:
+            for engine in ('blocking', 'asyncio'):
+                self.report(engine, appointments, options)
+        finally:
+            Notification.objects.filter(notification_appointment__in=appointments).delete()
+            data.delete()
+
+    def consumer(self, broker, options, prefetch_count):
+        return SlowDatabaseConsumer(connection_factory=broker.connect, prefetch_count=prefetch_count,
+                                    batch_size=options['batch_size'], batch_timeout=0.05, exit_when_idle=True)
+
+    def report(self, engine, appointments, options):
+        broker = InMemoryBroker()
+        publisher = RabbitMQPublisher(connection_factory=broker.connect, pool_size=1)
+        publisher.publish_batch('appointment_updates', [
+            f'Appointment request updated: {appointments[i % len(appointments)].id}' for i in range(options['messages'])
+        ], queue_name='appointment_updates')
+
+        start = time.perf_counter()
+        if engine == 'blocking':
+            consumer = self.consumer(broker, options, options['batch_size'])
+            consumer.start()
+        else:
+            consumer = self.consumer(broker, options, options['batch_size'] * options['concurrency'])
+            runner = AsyncConsumerEngine([consumer], channel_factory=broker.open_async_channel,
+                                         concurrency=options['concurrency'])
+            asyncio.run(runner.run())
+            runner.shutdown()
+        elapsed = time.perf_counter() - start
+
+        created = Notification.objects.filter(notification_appointment__in=appointments).count()
+        assert broker.acked == options['messages'] == created, (broker.acked, created)
+        Notification.objects.filter(notification_appointment__in=appointments).delete()
+
+        self.stdout.write(f'{engine}: {options["messages"]} messages in {elapsed:.2f}s '
+                          f'({options["messages"] / elapsed:,.0f} msg/s)')
+
+    def create_appointments(self, data):
+        now = timezone.now()
+        return Appointment.objects.bulk_create([
+            Appointment(lab_appointment=data.labs[0], service_appointment=data.services[0], patient=patient,
+                        date=now + timedelta(days=1), status=Appointment.STATUS_CONFIRMED)
+            for patient in data.patients
+        ])
@@ -0,0 +1,65 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers import serialize
+from django.utils import timezone
+
+from bhealthapp import event_schema
+from bhealthapp.models import Appointment
+
+
+class Command(BaseCommand):
+    help = 'Compares payload size and encode/decode throughput of the msgpack event schema with the JSON and ' \
+           'string messages it replaced. Uses unsaved model instances, no database access.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        appointment = Appointment(id=123456, lab_appointment_id=1234, service_appointment_id=42, patient_id=98765,
+                                  city_appointment='Sarajevo', date=now, status=Appointment.STATUS_PENDING)
+
+        legacy = {
+            'appointment_requested': (
+                lambda: json.dumps({'id': appointment.id, 'lab_id': appointment.lab_appointment_id,
+                                    'patient_id': appointment.patient_id, 'service_name': 'Complete blood count',
+                                    'date': str(appointment.date)}),
+                lambda body: json.loads(body),
+            ),
+            'appointment_updated': (
+                lambda: f'Appointment request updated: {appointment.id}',
+                lambda body: int(body.split(': ')[1]),
+            ),
+            'result_created': (
+                lambda: json.dumps({'type': 'result_created', 'data': serialize('json', [appointment])}),
+                lambda body: json.loads(json.loads(body)['data'])[0]['pk'],
+            ),
+        }
+        events = {
+            'appointment_requested': event_schema.AppointmentRequested(
+                appointment.id, appointment.lab_appointment_id, appointment.patient_id, 'Complete blood count', now),
+            'appointment_updated': event_schema.AppointmentUpdated(appointment.id, appointment.status, now),
+            'result_created': event_schema.ResultCreated(appointment.id, 654321),
+        }
+
+        for name, event in events.items():
+            encode, decode = legacy[name]
+            self.report(f'{name} legacy', encode, decode, options['events'])
+            self.report(f'{name} msgpack', lambda: event_schema.encode(event), event_schema.decode,
+                        options['events'])
+
+    def report(self, name, encode, decode, count):
+        start = time.perf_counter()
+        for _ in range(count):
+            body = encode()
+        encoded = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(count):
+            decode(body)
+        decoded = time.perf_counter() - start
+
+        size = len(body.encode() if isinstance(body, str) else body)
+        self.stdout.write(f'{name}: {size} bytes, encode {count / encoded:,.0f}/s, decode {count / decoded:,.0f}/s')
@@ -0,0 +1,49 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from src.files.storage import content_addressed_storage
+
+
+class Command(BaseCommand):
+    help = 'Compares disk usage and save latency of plain and content-addressed storage when labs upload the ' \
+           'same reports repeatedly. Writes to a temporary directory and rolls back the blob rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=500)
+        parser.add_argument('--distinct', type=int, default=25, help='Number of different files among the uploads.')
+        parser.add_argument('--size-kb', type=int, default=256)
+
+    def handle(self, *args, **options):
+        files = [b'%PDF-1.4\n' + os.urandom(options['size_kb'] * 1024) for _ in range(options['distinct'])]
+        uploads = [files[i % len(files)] for i in range(options['uploads'])]
+
+        location = tempfile.mkdtemp()
+        try:
+            self.report('plain', FileSystemStorage(location=os.path.join(location, 'plain')), uploads)
+            with transaction.atomic():
+                storage = content_addressed_storage(location=os.path.join(location, 'cas'))
+                self.report('content-addressed', storage, uploads)
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(location)
+
+    def report(self, name, storage, uploads):
+        latencies = []
+        for content in uploads:
+            start = time.perf_counter()
+            storage.save('pdf/report.pdf', ContentFile(content))
+            latencies.append(time.perf_counter() - start)
+
+        size = sum(os.path.getsize(os.path.join(root, file))
+                   for root, _, files in os.walk(storage.location) for file in files)
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        self.stdout.write(f'{name}: {size / 1024 / 1024:,.1f} MB on disk, '
+                          f'mean {statistics.mean(latencies) * 1000:.2f}ms, p95 {p95 * 1000:.2f}ms per upload')
@@ -0,0 +1,82 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from bhealthapp.models import Country, City, Lab, Type, Service, LabService
+
+WORDS = ['synevo', 'medica', 'atrijum', 'klinika', 'laboratorija', 'poliklinika', 'centar', 'dijagnostika', 'zdravlje',
+         'medlab', 'biochem', 'eurofins', 'unilab', 'analiza', 'vita', 'alfa', 'omega', 'nova', 'prima', 'salus']
+SERVICES = ['Complete blood count', 'Lipid panel', 'Thyroid panel', 'Vitamin D', 'Glucose', 'Urinalysis', 'PCR test',
+            'Allergy panel', 'Iron studies', 'Liver function test']
+QUERIES = ['synevo', 'medlab centar', 'thyroid', 'vitamin', 'sarajevo', 'synevp', 'laboratorja', 'klinka']
+
+
+class Command(BaseCommand):
+    help = 'Measures LabListView and LabServiceListView search latency over generated labs. ' \
+           'All generated rows are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--labs', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=12)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Lab search requires PostgreSQL.')
+
+        with transaction.atomic():
+            self.generate(options['labs'])
+
+            for text in QUERIES:
+                self.report(f'labs "{text}"', Lab.objects.search(text), options['repeat'], options['page_size'])
+            for text in QUERIES:
+                self.report(f'lab services "{text}"', LabService.objects.search(text), options['repeat'],
+                            options['page_size'])
+
+            transaction.set_rollback(True)
+
+    def generate(self, count):
+        self.stdout.write(f'Generating {count} labs...')
+        rng = random.Random(0)
+
+        country = Country.objects.create(name='Bosnia and Herzegovina')
+        cities = City.objects.bulk_create([
+            City(name=name, country=country, postal_code=71000 + i)
+            for i, name in enumerate(['Sarajevo', 'Mostar', 'Tuzla', 'Zenica', 'Bihac', 'Banja Luka'])
+        ])
+        service_type = Type.objects.create(name='Laboratory')
+        services = Service.objects.bulk_create([
+            Service(name=name, duration=timedelta(minutes=30), type=service_type) for name in SERVICES
+        ])
+        labs = Lab.objects.bulk_create([
+            Lab(city=rng.choice(cities), name=' '.join(rng.sample(WORDS, 2)).title(),
+                address=f'{rng.choice(WORDS).title()} {rng.randint(1, 200)}', email=f'{i}@bench.local')
+            for i in range(count)
+        ], batch_size=5000)
+        LabService.objects.bulk_create([
+            LabService(lab_service=lab, service=service)
+            for lab in labs
+            for service in rng.sample(services, 3)
+        ], batch_size=5000)
+
+        Lab.objects.filter(pk__in=[lab.pk for lab in labs]).update_search_vector()
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Lab._meta.db_table}')
+            cursor.execute(f'ANALYZE {LabService._meta.db_table}')
+
+    def report(self, name, queryset, repeat, page_size):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = list(queryset[:page_size])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            f'{name}: {len(rows)} results, p50 {statistics.median(timings):.1f}ms, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:.1f}ms'
+        )
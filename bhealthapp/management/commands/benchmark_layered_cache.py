@@ -0,0 +1,78 @@
+import random
+import statistics
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from src.common.cache import LayeredCache, LocalLayer
+
+
+def percentile(timings, fraction):
+    return sorted(timings)[min(int(len(timings) * fraction), len(timings) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Measures p50/p99 of cache reads through the layered cache against reading the Redis cache directly, ' \
+           'with --hot-share of the reads going to --hot of the --keys keys, then how long an invalidation ' \
+           'published by another worker takes to evict a local copy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layered', default='default', help='Alias of the LayeredCache.')
+        parser.add_argument('--keys', type=int, default=2000)
+        parser.add_argument('--reads', type=int, default=20000)
+        parser.add_argument('--hot', type=int, default=200)
+        parser.add_argument('--hot-share', type=float, default=0.9)
+        parser.add_argument('--value-size', type=int, default=20, help='Fields of every cached dict.')
+        parser.add_argument('--invalidations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        layered = caches[options['layered']]
+        if not isinstance(layered, LayeredCache):
+            raise CommandError(f'{options["layered"]} is not a LayeredCache, set CACHE_REDIS_URL.')
+        remote = layered.remote
+
+        deadline = time.monotonic() + 5
+        while not layered.layer.listening:
+            if time.monotonic() > deadline:
+                raise CommandError('The invalidation listener did not subscribe.')
+            time.sleep(0.01)
+
+        random.seed(42)
+        keys = [f'benchmark:lookup:{i}' for i in range(options['keys'])]
+        value = {f'field_{i}': f'value {i}' for i in range(options['value_size'])}
+        remote.set_many({key: value for key in keys})
+        reads = [
+            random.choice(keys[:options['hot']]) if random.random() < options['hot_share'] else random.choice(keys)
+            for _ in range(options['reads'])
+        ]
+
+        try:
+            for name, cache in (('redis', remote), ('layered', layered)):
+                timings = []
+                for key in reads:
+                    start = time.perf_counter()
+                    cache.get(key)
+                    timings.append(time.perf_counter() - start)
+                self.stdout.write(f'{name}: {len(reads):,} reads, p50 {percentile(timings, 0.5) * 1e6:.0f}us, '
+                                  f'p99 {percentile(timings, 0.99) * 1e6:.0f}us, '
+                                  f'total {sum(timings) * 1000:.0f}ms')
+
+            self.report_invalidation(layered, keys[0], options['invalidations'])
+        finally:
+            layered.delete_many(keys)
+
+    def report_invalidation(self, layered, key, count):
+        other_worker = LocalLayer(layered.remote_alias, layered.channel, 1, 1)
+        local_key = layered.make_key(key)
+        timings = []
+        for _ in range(count):
+            layered.get(key)
+            start = time.perf_counter()
+            other_worker.publish([local_key])
+            while local_key in layered.layer.lru.entries:
+                time.sleep(0)
+            timings.append(time.perf_counter() - start)
+
+        self.stdout.write(f'invalidation from another worker: median {statistics.median(timings) * 1000:.2f}ms, '
+                          f'p99 {percentile(timings, 0.99) * 1000:.2f}ms')
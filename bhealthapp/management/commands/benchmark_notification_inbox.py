@@ -0,0 +1,87 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from bhealthapp.management.benchmark_data import create_benchmark_data
+from bhealthapp.models import Appointment, Notification, UserNotificationCounter
+
+
+class Command(BaseCommand):
+    help = 'Fills the inboxes of --users users with --notifications notifications each, a tenth of them unread, ' \
+           'then measures counting the unread ones with COUNT(*) against the counter, loading a page of unread ' \
+           'notifications, and marking --batch of them read one save() at a time against one bulk UPDATE ' \
+           '(rolled back afterwards).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--notifications', type=int, default=2000)
+        parser.add_argument('--batch', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            patient = self.create_data(options['users'], options['notifications'])
+            repeat = options['repeat']
+            unread = Notification.objects.filter(notification_user=patient, is_read=False)
+
+            self.report('unread count', repeat, ('COUNT(*)', unread.count),
+                        ('counter', lambda: UserNotificationCounter.objects.unread(patient.pk)))
+            self.report('unread page', repeat, ('newest 12', lambda: list(unread.order_by('-id')[:12])))
+            self.explain(unread.order_by('-id')[:12])
+
+            ids = list(unread.order_by('id').values_list('id', flat=True))
+            batches = iter([ids[i:i + options['batch']] for i in range(0, len(ids), options['batch'])])
+
+            def save_each():
+                for notification in Notification.objects.filter(pk__in=next(batches)):
+                    notification.is_read = True
+                    notification.is_confirmed = True
+                    notification.save()
+
+            def bulk():
+                Notification.objects.filter(pk__in=next(batches)).mark_read(is_confirmed=True)
+
+            rounds = min(repeat, len(ids) // options['batch'] // 2)
+            self.report(f'confirm {options["batch"]}', rounds, ('save() per row', save_each), ('bulk UPDATE', bulk))
+
+            transaction.set_rollback(True)
+
+    def create_data(self, users, count):
+        data = create_benchmark_data(patients=users)
+        lab, patients = data.labs[0], data.patients
+        appointments = Appointment.objects.bulk_create([
+            Appointment(lab_appointment=lab, service_appointment=data.services[0], patient=patient,
+                        date=timezone.now() + timedelta(days=1))
+            for patient in patients
+        ])
+
+        for appointment in appointments:
+            Notification.objects.bulk_create_unread([
+                Notification(notification_lab=lab, notification_user=appointment.patient,
+                             notification_appointment=appointment, is_read=i % 10 != 0)
+                for i in range(count)
+            ], batch_size=1000)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE bhealthapp_notification')
+        return patients[0]
+
+    def explain(self, queryset):
+        plan = queryset.explain()
+        index = 'notification_user_unread' if 'notification_user_unread' in plan else 'no partial index'
+        self.stdout.write(f'  unread page plan uses {index}')
+
+    def report(self, name, repeat, *variants):
+        results = []
+        for label, run in variants:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+            results.append(f'{label} {statistics.median(timings) * 1000:.2f}ms')
+        self.stdout.write(f'{name}: ' + ', '.join(results))
@@ -0,0 +1,100 @@
+import asyncio
+import time
+import tracemalloc
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import signals
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from bhealthapp import notification_stream
+from bhealthapp.management.benchmark_data import create_benchmark_data
+from bhealthapp.models import Appointment, Notification
+from src.common.signals import DisableSignals
+
+
+class Command(BaseCommand):
+    help = 'Opens --streams in-process notification streams following one lab, reports the memory held per ' \
+           'idle stream and how long one committed notification takes to reach all of them. The rows it ' \
+           'creates are deleted afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', type=int, default=5000)
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        created = self.create_data()
+        try:
+            async_to_sync(self.run)(created, options['streams'], options['rounds'])
+        finally:
+            self.delete_data(created)
+
+    def create_data(self):
+        # the rows are committed, keep post_save from queueing tasks for them
+        with transaction.atomic(), DisableSignals([signals.post_save]):
+            data = create_benchmark_data('Benchmark Stream', is_staff=True)
+            lab, staff = data.labs[0], data.patients[0]
+            appointment = Appointment.objects.create(lab_appointment=lab, service_appointment=data.services[0],
+                                                     patient=staff, date=timezone.now() + timedelta(days=1))
+        return {'data': data, 'staff': staff, 'lab': lab, 'appointment': appointment}
+
+    def delete_data(self, created):
+        with transaction.atomic(), DisableSignals([signals.post_delete]):
+            Notification.objects.filter(notification_lab=created['lab']).delete()
+            created['data'].delete()
+
+    def notify(self, created):
+        with transaction.atomic():
+            notification = Notification.objects.create(notification_lab=created['lab'],
+                                                       notification_user=created['staff'],
+                                                       notification_appointment=created['appointment'])
+            notification_stream.publish([notification])
+
+    async def run(self, created, count, rounds):
+        query = f'token={AccessToken.for_user(created["staff"])}&lab={created["lab"].id}'.encode()
+        scope = {'type': 'http', 'path': '/api/v1/notification_stream', 'query_string': query, 'headers': []}
+        delivered = [0]
+        everyone = asyncio.Event()
+        disconnect = asyncio.Event()
+
+        def stream():
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if b'event: notification' in message.get('body', b''):
+                    delivered[0] += 1
+                    if delivered[0] % count == 0:
+                        everyone.set()
+
+            return notification_stream.notification_stream(scope, receive, send)
+
+        # the first stream authenticates and starts the LISTEN connection outside the measurement
+        tasks = [asyncio.ensure_future(stream())]
+        await asyncio.sleep(0.5)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tasks += [asyncio.ensure_future(stream()) for _ in range(1, count)]
+        while sum(len(subscribers) for subscribers in notification_stream.get_hub().subscribers.values()) < count:
+            await asyncio.sleep(0.05)
+        per_stream = (tracemalloc.get_traced_memory()[0] - before) / (count - 1)
+        tracemalloc.stop()
+        self.stdout.write(f'{count:,} idle streams, {per_stream / 1024:.1f}KB of Python memory each')
+
+        timings = []
+        for _ in range(rounds):
+            everyone.clear()
+            start = time.perf_counter()
+            await sync_to_async(self.notify)(created)
+            await asyncio.wait_for(everyone.wait(), 30)
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(f'commit to delivery on all streams: median {sorted(timings)[len(timings) // 2] * 1000:.1f}ms, '
+                          f'max {max(timings) * 1000:.1f}ms')
+
+        disconnect.set()
+        await asyncio.gather(*tasks)
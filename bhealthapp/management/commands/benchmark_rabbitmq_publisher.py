@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bhealthapp.rabbitmq import RabbitMQPublisher, get_rabbitmq_connection
+from bhealthapp.rabbitmq_standin import InMemoryBroker
+
+
+class Command(BaseCommand):
+    help = 'Compares a connection per message with the pooled RabbitMQPublisher. Uses an in-memory broker ' \
+           'stand-in unless --broker is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--connect-latency-ms', type=float, default=5.0,
+                            help='Simulated handshake cost of the stand-in broker.')
+        parser.add_argument('--broker', action='store_true', help='Publish to the configured RabbitMQ instead.')
+
+    def handle(self, *args, **options):
+        if options['broker']:
+            connection_factory = get_rabbitmq_connection
+        else:
+            connection_factory = InMemoryBroker(connect_latency=options['connect_latency_ms'] / 1000).connect
+
+        body = b'{"type": "benchmark"}'
+
+        def connection_per_message():
+            connection = connection_factory()
+            channel = connection.channel()
+            channel.queue_declare(queue='benchmark')
+            channel.basic_publish(exchange='', routing_key='benchmark', body=body)
+            connection.close()
+
+        publisher = RabbitMQPublisher(connection_factory=connection_factory)
+
+        def pooled():
+            publisher.publish(routing_key='benchmark', queue_name='benchmark', body=body)
+
+        self.report('connection per message', connection_per_message, options['messages'])
+        self.report('pooled publisher', pooled, options['messages'])
+        publisher.close()
+
+    def report(self, name, publish, count):
+        start = time.perf_counter()
+        for _ in range(count):
+            publish()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f'{name}: {count} messages in {elapsed:.3f}s ({count / elapsed:,.0f} msg/s)')
@@ -0,0 +1,92 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from bhealthapp.management.benchmark_data import create_benchmark_data
+from bhealthapp.models import Appointment
+from bhealthapp.slots import DaySchedule, available_slots, day_opening, weekly_hours
+
+MINUTE = 60
+
+
+def naive_free_slots(busy, opening, duration, step):
+    # Every grid position checked against every appointment of the day.
+    slots = []
+    for open_start, open_end in opening:
+        for start in range(open_start, open_end - duration + 1, step):
+            if all(end <= start or start + duration <= busy_start for busy_start, end in busy):
+                slots.append(start)
+    return slots
+
+
+class Command(BaseCommand):
+    help = 'Measures free slot search of the per lab-day sorted arrays against a scan of every appointment, ' \
+           'for --labs labs over --days days in memory, then end to end against the database for --db-labs labs ' \
+           '(rolled back afterwards).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--labs', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--per-day', type=int, default=20, help='Appointments per lab and day.')
+        parser.add_argument('--db-labs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        random.seed(42)
+        day = timezone.localdate() + timedelta(days=1)
+        opening = day_opening(weekly_hours(0), day) or [(0, 8 * 60 * MINUTE)]
+        duration, step = 30 * MINUTE, 15 * MINUTE
+
+        lab_days = [self.random_day(opening, options['per_day']) for _ in range(options['labs'] * options['days'])]
+
+        for name, search in (
+            ('sorted arrays', lambda busy: DaySchedule(busy).free_slots(opening, duration, step)),
+            ('scan', lambda busy: naive_free_slots(busy, opening, duration, step)),
+        ):
+            start = time.perf_counter()
+            for busy in lab_days:
+                search(busy)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'{name}: {len(lab_days):,} lab-days in {elapsed:.2f}s, '
+                              f'{elapsed / options["labs"] * 1000:.2f}ms per lab for {options["days"]} days')
+
+        if options['db_labs']:
+            with transaction.atomic():
+                self.report_database(options, opening, day)
+                transaction.set_rollback(True)
+
+    def random_day(self, opening, count):
+        open_start, open_end = opening[0]
+        busy = []
+        for _ in range(count):
+            start = open_start + random.randrange(0, (open_end - open_start) // (15 * MINUTE)) * 15 * MINUTE
+            busy.append((start, start + random.choice((15, 30, 45, 60)) * MINUTE))
+        return busy
+
+    def report_database(self, options, opening, first_day):
+        data = create_benchmark_data(labs=options['db_labs'])
+        labs, patient, service = data.labs, data.patients[0], data.services[0]
+
+        appointments = []
+        for lab in labs:
+            for offset in range(options['days']):
+                for start, _ in self.random_day(opening, options['per_day']):
+                    date = datetime.fromtimestamp(start, dt_timezone.utc) + timedelta(days=offset)
+                    appointments.append(Appointment(lab_appointment=lab, service_appointment=service, patient=patient,
+                                                    date=date, status=Appointment.STATUS_CONFIRMED))
+        Appointment.objects.bulk_create(appointments, batch_size=5000)
+
+        last_day = first_day + timedelta(days=options['days'] - 1)
+        timings = []
+        for lab in labs:
+            start = time.perf_counter()
+            available_slots(lab.id, service, first_day, last_day)
+            timings.append(time.perf_counter() - start)
+
+        self.stdout.write(f'database: available_slots over {options["days"]} days with {len(appointments) // len(labs):,} '
+                          f'appointments per lab, median {statistics.median(timings) * 1000:.1f}ms, '
+                          f'max {max(timings) * 1000:.1f}ms')
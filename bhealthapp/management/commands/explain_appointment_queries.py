@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from bhealthapp.management.benchmark_data import create_benchmark_data
+from bhealthapp.models import Appointment
+from bhealthapp.views import CustomPagination, UpcomingAppointmentsUserView, PastAppointmentsUserView, \
+    UpcomingAppointmentsLabView, PastAppointmentsLabView, RequestsView
+
+SEQ_SCAN = f'Seq Scan on {Appointment._meta.db_table}'
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN ANALYZE for every appointment timeline view against a generated dataset and fails ' \
+           'if any of them falls back to a sequential scan. All generated rows are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--labs', type=int, default=1000)
+        parser.add_argument('--patients', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN ANALYZE plans are only meaningful on PostgreSQL.')
+
+        with transaction.atomic():
+            lab, patient = self.generate(options['rows'], options['labs'], options['patients'])
+
+            views = (
+                (UpcomingAppointmentsUserView, {'patient': patient.id}),
+                (PastAppointmentsUserView, {'patient': patient.id}),
+                (UpcomingAppointmentsLabView, {'lab': lab.id}),
+                (UpcomingAppointmentsLabView, {'lab': lab.id, 'today': True}),
+                (PastAppointmentsLabView, {'lab': lab.id}),
+                (RequestsView, {'lab_appointment': lab.id}),
+            )
+            seq_scans = []
+
+            for view, params in views:
+                queryset = view().filter_appointments(Appointment.objects.all(), params)
+                plan = queryset.order_by(*view.ordering)[:CustomPagination.page_size].explain(analyze=True)
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{view.__name__} {params}'))
+                self.stdout.write(plan)
+                if SEQ_SCAN in plan:
+                    seq_scans.append(view.__name__)
+
+            transaction.set_rollback(True)
+
+        if seq_scans:
+            raise CommandError(f'Sequential scan on appointments in: {", ".join(seq_scans)}')
+
+        self.stdout.write(self.style.SUCCESS('All appointment timeline queries use index scans.'))
+
+    def generate(self, rows, labs, patients):
+        self.stdout.write(f'Generating {rows} appointments for {labs} labs and {patients} patients...')
+
+        data = create_benchmark_data('Explain', labs=labs, patients=patients, services=50)
+        services, lab_rows, patient_rows = data.services, data.labs, data.patients
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {Appointment._meta.db_table}
+                    (city_appointment, lab_appointment_id, service_appointment_id, patient_id, date, status, updated_at)
+                SELECT 'Sarajevo',
+                       (%(labs)s::int[])[1 + i %% %(lab_count)s],
+                       (%(services)s::int[])[1 + i %% %(service_count)s],
+                       (%(patients)s::int[])[1 + (i / %(lab_count)s) %% %(patient_count)s],
+                       now() + (random() * 3650 - 1825) * interval '1 day',
+                       i %% 3,
+                       now()
+                FROM generate_series(0, %(rows)s - 1) AS i
+                ''',
+                {
+                    'labs': [lab.id for lab in lab_rows],
+                    'lab_count': len(lab_rows),
+                    'services': [service.id for service in services],
+                    'service_count': len(services),
+                    'patients': [patient.id for patient in patient_rows],
+                    'patient_count': len(patient_rows),
+                    'rows': rows,
+                },
+            )
+            cursor.execute(f'ANALYZE {Appointment._meta.db_table}')
+
+        return lab_rows[0], patient_rows[0]
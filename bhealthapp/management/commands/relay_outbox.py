@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bhealthapp.models import OutboxEvent
+from bhealthapp.rabbitmq import publisher
+
+
+class Command(BaseCommand):
+    help = 'Relays outbox events to RabbitMQ. Several relays can run side by side, each one skips ' \
+           'the batches the others have locked.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_RELAY_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once the outbox is empty.')
+        parser.add_argument('--stats', action='store_true', help='Print the outbox backlog and lag and exit.')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(f'pending {OutboxEvent.objects.count()}, lag {OutboxEvent.objects.lag():.3f}s')
+            return
+
+        relayed = 0
+        try:
+            while True:
+                count, lag = OutboxEvent.objects.relay(publisher, batch_size=options['batch_size'])
+                if count:
+                    relayed += count
+                    self.stdout.write(f'relayed {count} events, lag {lag:.3f}s')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        finally:
+            publisher.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Relayed {relayed} outbox events.'))
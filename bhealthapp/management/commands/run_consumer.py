@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bhealthapp.async_consumer import AsyncConsumerEngine
+from bhealthapp.consumer import CONSUMERS
+
+
+class Command(BaseCommand):
+    help = 'Consumes one RabbitMQ queue and turns its messages into notifications in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queue', choices=sorted(CONSUMERS))
+        parser.add_argument('--prefetch', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--batch-timeout', type=float, default=None)
+        parser.add_argument('--engine', choices=['blocking', 'asyncio'], default=None,
+                            help='Consumer engine, defaults to CONSUMER_ENGINE.')
+        parser.add_argument('--drain', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        consumer = CONSUMERS[options['queue']](prefetch_count=options['prefetch'], batch_size=options['batch_size'],
+                                               batch_timeout=options['batch_timeout'], exit_when_idle=options['drain'])
+        try:
+            if (options['engine'] or settings.CONSUMER_ENGINE) == 'asyncio':
+                AsyncConsumerEngine([consumer]).start()
+            else:
+                consumer.start()
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(str(consumer.metrics))
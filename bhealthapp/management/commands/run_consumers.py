@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bhealthapp.consumer import CONSUMERS
+from bhealthapp.supervisor import ConsumerSupervisor
+
+
+class Command(BaseCommand):
+    help = 'Supervises consumer worker processes for every queue, restarting the ones that crash. ' \
+           'SIGTERM stops all workers after their current batch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', action='append', default=[], metavar='QUEUE=COUNT',
+                            help='Worker processes for a queue, overrides CONSUMER_WORKERS. Can be repeated.')
+        parser.add_argument('--prefetch', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--batch-timeout', type=float, default=None)
+        parser.add_argument('--engine', choices=['blocking', 'asyncio'], default=None,
+                            help='Consumer engine, defaults to CONSUMER_ENGINE.')
+
+    def handle(self, *args, **options):
+        workers = dict(settings.CONSUMER_WORKERS)
+        for value in options['workers']:
+            queue, _, count = value.partition('=')
+            if queue not in CONSUMERS or not count.isdigit():
+                raise CommandError(f'Expected QUEUE=COUNT with QUEUE one of {", ".join(sorted(CONSUMERS))}.')
+            workers[queue] = int(count)
+
+        supervisor = ConsumerSupervisor(
+            {queue: count for queue, count in workers.items() if count},
+            options={
+                'prefetch_count': options['prefetch'],
+                'batch_size': options['batch_size'],
+                'batch_timeout': options['batch_timeout'],
+                'engine': options['engine'],
+            },
+        )
+        self.stdout.write(f'Starting consumers: {", ".join(f"{q}={c}" for q, c in supervisor.workers.items())}')
+        supervisor.run()
+        self.stdout.write(f'Consumers stopped, {supervisor.restarts} restarts.')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from bhealthapp.models import Lab
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search vector of every lab.'
+
+    def handle(self, *args, **options):
+        updated = Lab.objects.update_search_vector()
+        self.stdout.write(self.style.SUCCESS(f'Updated search vectors of {updated} labs.'))
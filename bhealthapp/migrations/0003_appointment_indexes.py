@@ -0,0 +1,25 @@
+# Generated by Django 3.2.12 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhealthapp', '0002_remove_result_patient'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'status', 'date'], name='appointment_patient_timeline'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['lab_appointment', 'status', 'date'], name='appointment_lab_timeline'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status', 0)), fields=['lab_appointment', '-id'], name='appointment_lab_pending'),
+        ),
+    ]
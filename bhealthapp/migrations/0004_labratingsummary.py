@@ -0,0 +1,30 @@
+# Generated by Django 3.2.12 on 2026-10-18 11:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhealthapp', '0003_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabRatingSummary',
+            fields=[
+                ('lab', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='bhealthapp.lab')),
+                ('no_rating_count', models.PositiveIntegerField(default=0)),
+                ('one_star_count', models.PositiveIntegerField(default=0)),
+                ('two_star_count', models.PositiveIntegerField(default=0)),
+                ('three_star_count', models.PositiveIntegerField(default=0)),
+                ('four_star_count', models.PositiveIntegerField(default=0)),
+                ('five_star_count', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('average_rating', models.FloatField(default=None, null=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
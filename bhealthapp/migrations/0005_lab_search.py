@@ -0,0 +1,34 @@
+# Generated by Django 3.2.12 on 2026-10-18 11:14
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhealthapp', '0004_labratingsummary'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AddField(
+            model_name='lab',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='lab',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='lab_search_vector'),
+        ),
+        migrations.AddIndex(
+            model_name='lab',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='lab_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='service_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
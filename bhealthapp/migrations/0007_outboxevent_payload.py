@@ -0,0 +1,36 @@
+# Generated by Django 3.2.12 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+def body_to_payload(apps, schema_editor):
+    # Pending events keep their old text body, consumers decode it as schema version 0.
+    OutboxEvent = apps.get_model('bhealthapp', 'OutboxEvent')
+    for event in OutboxEvent.objects.all().iterator():
+        event.payload = event.body.encode()
+        event.save(update_fields=['payload'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhealthapp', '0006_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='payload',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(body_to_payload, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='outboxevent',
+            name='body',
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='payload',
+            field=models.BinaryField(),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.12 on 2026-10-18 11:38
+
+from django.db import migrations, models
+import src.files.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhealthapp', '0007_outboxevent_payload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='result',
+            name='pdf',
+            field=models.FileField(default='src/results/Patient Medical History Report.pdf', storage=src.files.storage.content_addressed_storage, upload_to='pdf'),
+        ),
+    ]
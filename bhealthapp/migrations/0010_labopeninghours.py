@@ -0,0 +1,32 @@
+# Generated by Django 3.2.12 on 2026-10-18 11:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhealthapp', '0009_user_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabOpeningHours',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('opens', models.TimeField()),
+                ('closes', models.TimeField()),
+                ('lab', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='opening_hours', to='bhealthapp.lab')),
+            ],
+            options={
+                'ordering': ['lab', 'weekday', 'opens'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='labopeninghours',
+            constraint=models.CheckConstraint(check=models.Q(('opens__lt', django.db.models.expressions.F('closes'))), name='opening_hours_opens_before_closes'),
+        ),
+    ]
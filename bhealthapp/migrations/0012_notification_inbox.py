@@ -0,0 +1,58 @@
+# Generated by Django 3.2.12 on 2026-10-18 12:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def count_unread(apps, schema_editor):
+    # Existing notifications start out unread.
+    Notification = apps.get_model('bhealthapp', 'Notification')
+    for model, field in (('UserNotificationCounter', 'notification_user'), ('LabNotificationCounter', 'notification_lab')):
+        counter = apps.get_model('bhealthapp', model)
+        rows = Notification.objects.order_by().values(field).annotate(unread=Count('id')).values_list(field, 'unread')
+        counter.objects.bulk_create([counter(pk=pk, unread=unread) for pk, unread in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhealthapp', '0011_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabNotificationCounter',
+            fields=[
+                ('unread', models.PositiveIntegerField(default=0)),
+                ('lab', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to='bhealthapp.lab')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UserNotificationCounter',
+            fields=[
+                ('unread', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to='bhealthapp.user')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='is_read',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['notification_user', '-id'], name='notification_user_unread'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['notification_lab', '-id'], name='notification_lab_unread'),
+        ),
+    ]
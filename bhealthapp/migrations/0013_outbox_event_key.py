@@ -0,0 +1,18 @@
+# Generated by Django 3.2.12 on 2026-10-18 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhealthapp', '0012_notification_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='key',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
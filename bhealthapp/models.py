@@ -1,14 +1,29 @@
+import re
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from dateutil.relativedelta import relativedelta
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchVectorField, TrigramSimilarity
+from django.db import models, transaction
+from django.db.models import F, Q, Count, Sum, FloatField, IntegerField, OuterRef, Subquery, Case, When, Value
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 from django_rest_passwordreset.signals import reset_password_token_created
-from easy_thumbnails.signal_handlers import generate_aliases_global
+from easy_thumbnails.alias import aliases
 from easy_thumbnails.signals import saved_file
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from src.common.helpers import build_absolute_uri
+from src.files.storage import content_addressed_storage
+from src.files.tasks import generate_aliases
 from src.notifications.services import notify, ACTIVITY_USER_RESETS_PASS
+from . import event_schema, profile_pictures
 
 
 @receiver(reset_password_token_created)
@@ -27,6 +42,20 @@ def password_reset_token_created(sender, instance, reset_password_token, *args,
     notify(ACTIVITY_USER_RESETS_PASS, context=context, email_to=[reset_password_token.user.email])
 
 
+SEARCH_CONFIG = 'simple'
+
+
+def build_search_query(text):
+    """
+    Prefix-matches every word of text, so 'syn lab' finds 'Synevo Laboratory'.
+    """
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return None
+
+    return SearchQuery(' & '.join(f'{term}:*' for term in terms), config=SEARCH_CONFIG, search_type='raw')
+
+
 class GetOrNoneManager(models.Manager):
     def get_or_none(self, **kwargs):
         try:
@@ -54,6 +83,8 @@ class User(AbstractUser):
     )
     username = models.CharField(null=False, max_length=150, unique=True)
     profile_picture = models.ImageField(default='default.jpg', upload_to='profile_pics', null=True)
+    # URLs of the pre-sized variants, see profile_pictures.build_manifest
+    profile_picture_variants = models.JSONField(default=dict, blank=True)
     profile_link = models.CharField(max_length=255, blank=True, null=True, default=None)
     name = models.TextField(null=False, max_length=20)
     surname = models.TextField(null=False, max_length=30)
@@ -64,6 +95,7 @@ class User(AbstractUser):
     address = models.TextField(max_length=80, null=True, default=None)
     city = models.ForeignKey(City, related_name='user_city', on_delete=models.DO_NOTHING, default=1)
     joined_at = models.DateTimeField(auto_now_add=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
     is_blocked = models.BooleanField(default=False)
     is_email_verified = models.BooleanField(default=False)
     gender = models.PositiveSmallIntegerField(
@@ -83,6 +115,10 @@ class User(AbstractUser):
     #     img.thumbnail(output_size)  # Resize image
     #     img.save(self.image.path)  # Save it again and override the larger image
 
+    def profile_picture_urls(self):
+        picture = self.profile_picture
+        return profile_pictures.picture_urls(picture.name, self.profile_picture_variants, picture.storage.url)
+
     def get_tokens(self):
         refresh = RefreshToken.for_user(self)
 
@@ -95,6 +131,35 @@ class User(AbstractUser):
         return self.username
 
 
+class LabQuerySet(models.QuerySet):
+    def update_search_vector(self):
+        """
+        Rebuilds search_vector for the selected labs in a single UPDATE from the lab's
+        name and address, its city name and the names of the services it offers.
+        """
+        city_name = City.objects.filter(pk=OuterRef('city_id')).values('name')
+        service_names = LabService.objects.filter(lab_service=OuterRef('pk')).order_by().values(
+            'lab_service'
+        ).annotate(names=StringAgg('service__name', ' ', output_field=models.TextField())).values('names')
+
+        return self.update(
+            search_vector=SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(Subquery(service_names), weight='B', config=SEARCH_CONFIG)
+            + SearchVector('address', weight='C', config=SEARCH_CONFIG)
+            + SearchVector(Subquery(city_name), weight='C', config=SEARCH_CONFIG)
+        )
+
+    def search(self, text):
+        query = build_search_query(text)
+        if query is None:
+            return self.none()
+
+        return self.annotate(
+            rank=SearchRank(F('search_vector'), query),
+            similarity=TrigramSimilarity('name', text),
+        ).filter(Q(search_vector=query) | Q(name__trigram_similar=text)).order_by('-rank', '-similarity', 'id')
+
+
 class Lab(models.Model):
     city = models.ForeignKey(City, related_name='lab_city', on_delete=models.DO_NOTHING)
     name = models.TextField(null=False, max_length=255, default=None)
@@ -103,6 +168,56 @@ class Lab(models.Model):
     phone_number = models.CharField(null=True, max_length=255)
     email = models.TextField(null=False, max_length=255)
     website = models.CharField(max_length=255, blank=True, null=True, default=None)
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # the own columns search_vector is built from, see lab_saved
+    SEARCH_FIELDS = ('name', 'address', 'city_id')
+
+    objects = LabQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        lab = super().from_db(db, field_names, values)
+        lab._indexed_values = lab.searched_values()
+        return lab
+
+    def searched_values(self):
+        # deferred fields are left out, a save does not write them either
+        return tuple(self.__dict__.get(field) for field in self.SEARCH_FIELDS)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='lab_search_vector'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='lab_name_trgm'),
+        ]
+
+
+class LabOpeningHours(models.Model):
+    """
+    One opening interval of a lab on a weekday (0 is Monday), in the server time zone.
+    A lab without rows uses LAB_DEFAULT_OPENING_HOURS.
+    """
+    WEEKDAY_CHOICES = (
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    )
+
+    lab = models.ForeignKey(Lab, related_name='opening_hours', on_delete=models.CASCADE)
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    opens = models.TimeField()
+    closes = models.TimeField()
+
+    class Meta:
+        ordering = ['lab', 'weekday', 'opens']
+        constraints = [
+            models.CheckConstraint(check=Q(opens__lt=F('closes')), name='opening_hours_opens_before_closes'),
+        ]
 
 
 class UserRating(models.Model):
@@ -131,6 +246,91 @@ class UserRating(models.Model):
     )
 
 
+class LabRatingSummaryManager(models.Manager):
+    def record_rating(self, lab, rating):
+        """
+        Folds a single new rating into the lab's summary row. The UPDATE reads the old
+        counters, so concurrent ratings for the same lab cannot lose increments.
+        """
+        star_field = LabRatingSummary.STAR_FIELDS[rating]
+        updates = {star_field: F(star_field) + 1}
+
+        if rating != UserRating.RATING_NULL:
+            updates.update(
+                rating_count=F('rating_count') + 1,
+                rating_sum=F('rating_sum') + rating,
+                average_rating=Cast(F('rating_sum') + rating, FloatField()) / (F('rating_count') + 1),
+            )
+
+        with transaction.atomic():
+            self.get_or_create(lab=lab)
+            self.filter(lab=lab).update(last_updated=timezone.now(), **updates)
+
+    def rebuild(self):
+        """
+        Recomputes every summary from UserRating with one aggregate query and bulk writes.
+        The summary rows of all rated labs are created and locked before the ratings are
+        counted, so a concurrent record_rating either committed before the count or adds
+        its rating after the rebuild.
+
+        Returns the ids of the labs whose summary changed.
+        """
+        fields = ['rating_count', 'rating_sum', 'average_rating', *LabRatingSummary.STAR_FIELDS.values()]
+        rated = Q(rating__gt=UserRating.RATING_NULL)
+
+        with transaction.atomic():
+            self.bulk_create([
+                LabRatingSummary(lab_id=lab_id)
+                for lab_id in UserRating.objects.order_by().values_list('lab', flat=True).distinct()
+            ], batch_size=1000, ignore_conflicts=True)
+            existing = {row['lab']: row for row in self.select_for_update().order_by('lab').values('lab', *fields)}
+
+            rows = UserRating.objects.order_by().values('lab').annotate(
+                rating_count=Count('id', filter=rated),
+                rating_sum=Coalesce(Sum('rating', filter=rated), 0),
+                **{field: Count('id', filter=Q(rating=star)) for star, field in LabRatingSummary.STAR_FIELDS.items()},
+            )
+            now = timezone.now()
+            summaries = []
+            for row in rows:
+                row['average_rating'] = row['rating_sum'] / row['rating_count'] if row['rating_count'] else None
+                if row['lab'] in existing and row != existing[row['lab']]:
+                    summaries.append(LabRatingSummary(lab_id=row['lab'], last_updated=now,
+                                                      **{field: row[field] for field in fields}))
+
+            # only locked rows, a summary created after the lock belongs to a rating the count did not see
+            removed = set(existing) - {row['lab'] for row in rows}
+            self.filter(lab_id__in=removed).delete()
+            self.bulk_update(summaries, [*fields, 'last_updated'], batch_size=1000)
+
+        return sorted(removed | {summary.lab_id for summary in summaries})
+
+
+class LabRatingSummary(models.Model):
+    STAR_FIELDS = {
+        UserRating.RATING_NULL: 'no_rating_count',
+        UserRating.RATING_ONE: 'one_star_count',
+        UserRating.RATING_TWO: 'two_star_count',
+        UserRating.RATING_THREE: 'three_star_count',
+        UserRating.RATING_FOUR: 'four_star_count',
+        UserRating.RATING_FIVE: 'five_star_count',
+    }
+
+    lab = models.OneToOneField(Lab, related_name='rating_summary', on_delete=models.CASCADE, primary_key=True)
+    no_rating_count = models.PositiveIntegerField(default=0)
+    one_star_count = models.PositiveIntegerField(default=0)
+    two_star_count = models.PositiveIntegerField(default=0)
+    three_star_count = models.PositiveIntegerField(default=0)
+    four_star_count = models.PositiveIntegerField(default=0)
+    five_star_count = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(null=True, default=None)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    objects = LabRatingSummaryManager()
+
+
 class Type(models.Model):
     name = models.TextField(null=False, max_length=255, default=None)
     description = models.TextField(null=False, max_length=1000, default='Type Description')
@@ -142,11 +342,59 @@ class Service(models.Model):
     description = models.TextField(null=False, max_length=1000, default='Service Description')
     type = models.ForeignKey(Type, related_name='service_type', on_delete=models.DO_NOTHING)
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='service_name_trgm'),
+        ]
+
+
+class LabServiceQuerySet(models.QuerySet):
+    def search(self, text):
+        query = build_search_query(text)
+        if query is None:
+            return self.none()
+
+        return self.annotate(
+            rank=SearchRank(F('lab_service__search_vector'), query),
+            similarity=TrigramSimilarity('service__name', text),
+        ).filter(
+            Q(lab_service__search_vector=query)
+            | Q(service__name__trigram_similar=text)
+            | Q(lab_service__name__trigram_similar=text)
+        ).order_by('-rank', '-similarity', 'id')
+
 
 class LabService(models.Model):
     lab_service = models.ForeignKey(Lab, related_name='lab_name_service', on_delete=models.DO_NOTHING)
     service = models.ForeignKey(Service, related_name='service_name', on_delete=models.DO_NOTHING)
 
+    objects = LabServiceQuerySet.as_manager()
+
+
+class AppointmentQuerySet(models.QuerySet):
+    def with_related(self):
+        """
+        Pulls in every relation the appointment serializers render, so a page of
+        appointments costs the same number of queries regardless of its size.
+        """
+        return self.select_related(
+            'lab_appointment__city',
+            'service_appointment__type',
+            'patient__city',
+        ).prefetch_related('patient__groups', 'patient__user_permissions')
+
+    def upcoming(self, years=5):
+        now = timezone.now()
+        return self.filter(date__gte=now, date__lte=now + relativedelta(years=years))
+
+    def past(self, years=5):
+        now = timezone.now()
+        return self.filter(date__gte=now - relativedelta(years=years), date__lte=now)
+
+    def on_day(self, day=None):
+        start = timezone.make_aware(datetime.combine(day or timezone.localdate(), time.min))
+        return self.filter(date__gte=start, date__lt=start + timedelta(days=1))
+
 
 class Appointment(models.Model):
     city_appointment = models.TextField(default='Sarajevo')
@@ -169,11 +417,66 @@ class Appointment(models.Model):
         choices=STATUS_CHOICES,
         default=STATUS_PENDING,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = AppointmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'status', 'date'], name='appointment_patient_timeline'),
+            models.Index(fields=['lab_appointment', 'status', 'date'], name='appointment_lab_timeline'),
+            models.Index(fields=['lab_appointment', '-id'], condition=models.Q(status=0),
+                         name='appointment_lab_pending'),
+        ]
 
 
 class Result(models.Model):
     appointment = models.ForeignKey(Appointment, related_name='appointment_result', on_delete=models.DO_NOTHING)
-    pdf = models.FileField(upload_to='pdf', default='src/results/Patient Medical History Report.pdf')
+    pdf = models.FileField(upload_to='pdf', default='src/results/Patient Medical History Report.pdf',
+                           storage=content_addressed_storage)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+def count_unread(rows, step):
+    """
+    Moves the unread counters of the recipients in `rows`, (user id, lab id) pairs of
+    notifications, by `step` per notification.
+    """
+    users, labs = Counter(), Counter()
+    for user_id, lab_id in rows:
+        users[user_id] += step
+        labs[lab_id] += step
+
+    # always users before labs, so concurrent writers lock the counters in the same order
+    UserNotificationCounter.objects.add(users)
+    LabNotificationCounter.objects.add(labs)
+
+
+class NotificationQuerySet(models.QuerySet):
+    def bulk_create_unread(self, notifications, batch_size=None):
+        """
+        Inserts the notifications and counts the unread ones for their user and lab, call
+        it inside a transaction.
+        """
+        created = self.bulk_create(notifications, batch_size=batch_size)
+        count_unread([(notification.notification_user_id, notification.notification_lab_id)
+                      for notification in created if not notification.is_read], 1)
+        return created
+
+    def mark_read(self, **changes):
+        """
+        Marks the notifications of the queryset read and applies `changes` to them with a
+        single UPDATE. The rows that were unread are locked first, so the counters of their
+        recipients drop exactly once even when the same ids are marked concurrently.
+
+        Returns the number of updated notifications.
+        """
+        with transaction.atomic():
+            unread = list(self.filter(is_read=False).select_for_update().order_by('id').values_list(
+                'notification_user_id', 'notification_lab_id'))
+            updated = self.update(is_read=True, updated_at=timezone.now(), **changes)
+            count_unread(unread, -1)
+        return updated
 
 
 class Notification(models.Model):
@@ -184,6 +487,213 @@ class Notification(models.Model):
     message = models.TextField(default='Notification!')
     is_confirmed = models.BooleanField(default=False)
     is_declined = models.BooleanField(default=False)
+    is_read = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['notification_user', '-id'], condition=models.Q(is_read=False),
+                         name='notification_user_unread'),
+            models.Index(fields=['notification_lab', '-id'], condition=models.Q(is_read=False),
+                         name='notification_lab_unread'),
+        ]
+
+
+class NotificationCounterManager(models.Manager):
+    def add(self, steps):
+        """
+        Adds `steps`, a mapping of recipient id to a (possibly negative) number, to the
+        counters with one UPDATE, creating the missing counter rows first.
+        """
+        steps = {pk: step for pk, step in steps.items() if step}
+        if not steps:
+            return
+
+        self.bulk_create([self.model(pk=pk) for pk in steps], ignore_conflicts=True)
+        list(self.select_for_update().filter(pk__in=steps).order_by('pk').values_list('pk'))
+        self.filter(pk__in=steps).update(unread=Greatest(F('unread') + Case(
+            *[When(pk=pk, then=Value(step)) for pk, step in steps.items()], output_field=IntegerField(),
+        ), 0))
+
+    def unread(self, pk):
+        return self.filter(pk=pk).values_list('unread', flat=True).first() or 0
+
+    def rebuild(self):
+        """
+        Recounts the unread notifications of every recipient with one aggregate query.
+        The counters are locked before counting, writers that commit later add their own
+        notifications on top of the recount.
+        """
+        field = self.model.recipient_field
+        with transaction.atomic():
+            existing = set(self.select_for_update().values_list('pk', flat=True))
+            counts = dict(Notification.objects.filter(is_read=False).order_by().values(field).annotate(
+                unread=Count('id')).values_list(field, 'unread'))
+
+            self.exclude(pk__in=counts).exclude(unread=0).update(unread=0)
+            self.bulk_update([self.model(pk=pk, unread=unread) for pk, unread in counts.items() if pk in existing],
+                             ['unread'], batch_size=1000)
+            self.bulk_create([self.model(pk=pk, unread=unread) for pk, unread in counts.items()
+                              if pk not in existing], batch_size=1000, ignore_conflicts=True)
+
+        return len(counts)
+
+
+class NotificationCounter(models.Model):
+    """
+    Unread notifications of one recipient, kept in step by the Notification queryset and
+    reconciled hourly for the changes made around it (the admin, deletes).
+    """
+    recipient_field = None
+
+    unread = models.PositiveIntegerField(default=0)
+
+    objects = NotificationCounterManager()
+
+    class Meta:
+        abstract = True
+
+
+class UserNotificationCounter(NotificationCounter):
+    recipient_field = 'notification_user'
+
+    user = models.OneToOneField(User, related_name='notification_counter', on_delete=models.CASCADE,
+                                primary_key=True)
+
+
+class LabNotificationCounter(NotificationCounter):
+    recipient_field = 'notification_lab'
+
+    lab = models.OneToOneField(Lab, related_name='notification_counter', on_delete=models.CASCADE,
+                               primary_key=True)
+
+
+class OutboxEventManager(models.Manager):
+    def enqueue(self, event, key=None):
+        """
+        Records an event for the relay. Call it inside the transaction that made the
+        change, so the event is stored if and only if the change is committed.
+
+        An event with a `key` replaces the payload of the waiting event with the same key,
+        so repeated changes of one object are published once, with its latest state. A
+        waiting event locked by a relay is being published already and is left alone.
+        """
+        payload = event_schema.encode(event)
+        if key is not None:
+            waiting = self.select_for_update(skip_locked=True).filter(key=key).first()
+            if waiting is not None:
+                waiting.payload = payload
+                waiting.save(update_fields=['payload'])
+                return waiting
+
+        return self.create(queue=event.queue, key=key, payload=payload)
+
+    def enqueue_appointment_request(self, appointment):
+        return self.enqueue(event_schema.AppointmentRequested(
+            appointment.id, appointment.lab_appointment_id, appointment.patient_id,
+            appointment.service_appointment.name, appointment.date,
+        ))
+
+    def enqueue_appointment_update(self, appointment):
+        return self.enqueue(event_schema.AppointmentUpdated(appointment.id, appointment.status, appointment.date),
+                            key=f'appointment_update:{appointment.id}')
+
+    def enqueue_result_created(self, result):
+        return self.enqueue(event_schema.ResultCreated(result.appointment_id, result.id))
+
+    def relay(self, publisher, batch_size=100):
+        """
+        Publishes the oldest batch of events and deletes them in the same transaction.
+        Rows locked by another relay are skipped, so concurrent relays never pick up
+        the same event. Identical events in one batch are published once.
+
+        Returns the number of relayed events and the age in seconds of the oldest one.
+        """
+        with transaction.atomic():
+            events = list(self.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+            if not events:
+                return 0, 0.0
+
+            queues = {}
+            for event in events:
+                queues.setdefault(event.queue, {})[bytes(event.payload)] = None
+            for queue, bodies in queues.items():
+                publisher.publish_batch(routing_key=queue, queue_name=queue, bodies=bodies,
+                                        content_type=event_schema.CONTENT_TYPE)
+
+            self.filter(pk__in=[event.pk for event in events]).delete()
+
+        return len(events), (timezone.now() - events[0].created).total_seconds()
+
+    def lag(self):
+        """
+        Age in seconds of the oldest event still waiting for the relay.
+        """
+        oldest = self.order_by('id').values_list('created', flat=True).first()
+        return (timezone.now() - oldest).total_seconds() if oldest else 0.0
+
+
+class OutboxEvent(models.Model):
+    queue = models.CharField(max_length=64)
+    key = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    payload = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = OutboxEventManager()
+
+
+@receiver(saved_file)
+def queue_aliases(sender, fieldfile, **kwargs):
+    # Aliases are generated by a worker instead of inside the request that saved the file.
+    if not aliases.all(fieldfile, include_global=True):
+        return
+
+    instance = fieldfile.instance
+    transaction.on_commit(lambda: generate_aliases.delay(instance._meta.label, instance.pk, fieldfile.field.name))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    if profile_pictures.needs_variants(instance):
+        from .tasks import generate_profile_picture_variants
+        user_id, picture = instance.id, instance.profile_picture.name
+        transaction.on_commit(lambda: generate_profile_picture_variants.delay(user_id, picture))
+
+
+@receiver(post_save, sender=Lab)
+def lab_saved(sender, instance, created, update_fields=None, **kwargs):
+    values = instance.searched_values()
+    # Writing search_vector writes the copy loaded with the lab, which a related change may
+    # have made stale. Labs loaded for editing defer it, so only searched fields matter.
+    wrote_vector = 'search_vector' not in instance.get_deferred_fields() and (
+        update_fields is None or 'search_vector' in update_fields)
+    if created or wrote_vector or values != getattr(instance, '_indexed_values', None):
+        Lab.objects.filter(pk=instance.pk).update_search_vector()
+    instance._indexed_values = values
+
+
+@receiver(post_save, sender=LabService)
+@receiver(post_delete, sender=LabService)
+def lab_service_changed(sender, instance, **kwargs):
+    Lab.objects.filter(pk=instance.lab_service_id).update_search_vector()
+
+
+@receiver(post_save, sender=Service)
+def service_saved(sender, instance, created, **kwargs):
+    if not created:
+        Lab.objects.filter(lab_name_service__service=instance).update_search_vector()
+
+
+@receiver(post_save, sender=City)
+def city_saved(sender, instance, created, **kwargs):
+    if not created:
+        Lab.objects.filter(city=instance).update_search_vector()
 
 
-saved_file.connect(generate_aliases_global)
+@receiver(post_delete, sender=Result)
+def result_deleted(sender, instance, **kwargs):
+    # The default report is shared by every result without an upload, only release stored blobs.
+    if instance.pdf and instance.pdf.storage.is_blob(instance.pdf.name):
+        instance.pdf.delete(save=False)
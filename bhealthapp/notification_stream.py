@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections, close_old_connections
+from psycopg2 import sql
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import Notification, User
+from .serializers import NotificationSerializer
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY payloads are limited to 8000 bytes, larger notifications are announced without data
+MAX_PAYLOAD = 7500
+# Control messages in the subscriber queues next to the notifications. RESYNC follows a reconnect
+# of the listener, the streams reload what they may have missed.
+PING = 'ping'
+RESYNC = 'resync'
+DISCONNECT = 'disconnect'
+
+
+def notification_event(notification):
+    return {'id': notification.id, **NotificationSerializer(notification).data}
+
+
+def publish(notifications):
+    """
+    Announces new notifications to the stream servers with one NOTIFY per row. Call it in
+    the transaction that created them: Postgres delivers the messages on commit only, so a
+    rolled back batch is never streamed.
+    """
+    payloads = []
+    for notification in notifications:
+        payload = {'id': notification.id, 'user': notification.notification_user_id,
+                   'lab': notification.notification_lab_id, 'data': notification_event(notification)}
+        encoded = json.dumps(payload)
+        if len(encoded.encode()) > MAX_PAYLOAD:
+            del payload['data']
+            encoded = json.dumps(payload)
+        payloads.append(encoded)
+
+    if payloads:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+                           [settings.NOTIFICATION_STREAM_CHANNEL, payloads])
+
+
+class Subscriber:
+    def __init__(self, key):
+        self.key = key
+        self.queue = asyncio.Queue(maxsize=settings.NOTIFICATION_STREAM_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # the client reads too slowly, its stream is closed and resumes from Last-Event-ID
+            self.overflowed = True
+
+
+class NotificationHub:
+    """
+    One LISTEN connection per process and event loop, fanning NOTIFY messages out to the
+    queues of the open streams subscribed to the notification's user or lab. Events are
+    encoded once per notification and heartbeats are queued by one timer, so an idle stream
+    costs a coroutine waiting on an empty queue, not a database connection or a timer.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.subscribers = defaultdict(set)
+        self.listening = asyncio.Event()
+        self.tasks = None
+
+    async def subscribe(self, key):
+        if self.tasks is None:
+            self.tasks = (self.loop.create_task(self.run()), self.loop.create_task(self.heartbeat()))
+        await asyncio.wait_for(self.listening.wait(), settings.NOTIFICATION_STREAM_CONNECT_TIMEOUT)
+
+        subscriber = Subscriber(key)
+        self.subscribers[key].add(subscriber)
+        return subscriber
+
+    def broadcast(self, message):
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.put(message)
+
+    async def heartbeat(self):
+        # keeps proxies from closing idle streams and finds clients that went away
+        while True:
+            await asyncio.sleep(settings.NOTIFICATION_STREAM_HEARTBEAT)
+            self.broadcast(PING)
+
+    def unsubscribe(self, subscriber):
+        subscribers = self.subscribers[subscriber.key]
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self.subscribers[subscriber.key]
+
+    def connect(self):
+        listener = psycopg2.connect(**connections['default'].get_connection_params())
+        listener.autocommit = True
+        with listener.cursor() as cursor:
+            cursor.execute(sql.SQL('LISTEN {}').format(sql.Identifier(settings.NOTIFICATION_STREAM_CHANNEL)))
+        return listener
+
+    async def run(self):
+        reconnect = False
+        while True:
+            try:
+                listener = await self.loop.run_in_executor(None, self.connect)
+            except psycopg2.Error:
+                logger.warning('Notification stream cannot LISTEN, retrying', exc_info=True)
+                await asyncio.sleep(1)
+                continue
+
+            lost = self.loop.create_future()
+            self.loop.add_reader(listener.fileno(), self.read, listener, lost)
+            self.listening.set()
+            if reconnect:
+                self.broadcast(RESYNC)
+
+            try:
+                error = await lost
+                logger.warning('Notification stream lost its LISTEN connection: %s', error)
+            finally:
+                self.listening.clear()
+                self.loop.remove_reader(listener.fileno())
+                listener.close()
+
+            reconnect = True
+            await asyncio.sleep(1)
+
+    def read(self, listener, lost):
+        try:
+            listener.poll()
+        except psycopg2.Error as error:
+            if not lost.done():
+                lost.set_result(error)
+            return
+
+        while listener.notifies:
+            message = json.loads(listener.notifies.pop(0).payload)
+            if 'data' in message:
+                message['event'] = encode_event(message['data'])
+            for key in (('user', message['user']), ('lab', message['lab'])):
+                for subscriber in self.subscribers.get(key, ()):
+                    subscriber.put(message)
+
+
+_hub = None
+
+
+def get_hub():
+    global _hub
+    loop = asyncio.get_running_loop()
+    if _hub is None or _hub.loop is not loop:
+        _hub = NotificationHub(loop)
+    return _hub
+
+
+def authenticate(token, lab):
+    """
+    Returns the (kind, id) stream the access token may read: the user's own notifications,
+    or a lab's for staff. Returns (status, message) of the error response otherwise.
+    """
+    close_old_connections()
+    try:
+        user_id = AccessToken(token)[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None, (401, 'Invalid or expired token.')
+
+    user = User.objects.filter(pk=user_id, is_active=True).only('id', 'is_staff').first()
+    if user is None:
+        return None, (401, 'Invalid or expired token.')
+    if lab is None:
+        return ('user', user.id), None
+    if not user.is_staff:
+        return None, (403, 'Only staff can follow lab notifications.')
+    return ('lab', lab), None
+
+
+def load_events(key, after=None, ids=None):
+    close_old_connections()
+    queryset = Notification.objects.filter(**{f'notification_{key[0]}_id': key[1]}).order_by('id')
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    return [notification_event(notification)
+            for notification in queryset[:settings.NOTIFICATION_STREAM_REPLAY_LIMIT]]
+
+
+def encode_event(event):
+    return f'id: {event["id"]}\nevent: notification\ndata: {json.dumps(event)}\n\n'.encode()
+
+
+async def respond(send, status, message):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps({'Failure': message}).encode()})
+
+
+async def notification_stream(scope, receive, send):
+    """
+    ASGI app streaming a user's notifications as Server-Sent Events, or a lab's with
+    ?lab= for staff. The JWT access token comes in the Authorization header or ?token=,
+    since browsers' EventSource can not set headers. After a reconnect the Last-Event-ID
+    header (or ?last_event_id=) replays the notifications created since.
+    """
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+    query = {name: values[-1] for name, values in parse_qs(scope['query_string'].decode()).items()}
+
+    token = query.get('token') or headers.get('authorization', '').partition('Bearer ')[2]
+    try:
+        lab = int(query['lab']) if 'lab' in query else None
+        last_event_id = int(headers.get('last-event-id') or query.get('last_event_id') or 0) or None
+    except ValueError:
+        return await respond(send, 400, 'lab and Last-Event-ID must be integers.')
+
+    key, error = await sync_to_async(authenticate)(token, lab)
+    if error is not None:
+        return await respond(send, *error)
+
+    hub = get_hub()
+    try:
+        # subscribed before the replay query, so nothing committed in between is lost
+        subscriber = await hub.subscribe(key)
+    except asyncio.TimeoutError:
+        return await respond(send, 503, 'Notification stream unavailable.')
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive, subscriber))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+        # live messages can repeat a replayed row, RESYNC only loads rows newer than the last one sent
+        replayed = set()
+        last_sent = last_event_id or 0
+        if last_event_id is not None:
+            for event in await sync_to_async(load_events)(key, after=last_event_id):
+                await send({'type': 'http.response.body', 'body': encode_event(event), 'more_body': True})
+                replayed.add(event['id'])
+                last_sent = max(last_sent, event['id'])
+
+        while True:
+            message = await subscriber.queue.get()
+            if message == DISCONNECT or subscriber.overflowed:
+                break
+
+            if message == PING:
+                chunks = [b': ping\n\n']
+            elif message == RESYNC:
+                events = await sync_to_async(load_events)(key, after=last_sent)
+                chunks = [encode_event(event) for event in events]
+                last_sent = max([last_sent, *(event['id'] for event in events)])
+            elif message['id'] in replayed:
+                continue
+            elif 'event' in message:
+                chunks = [message['event']]
+                last_sent = max(last_sent, message['id'])
+            else:
+                events = await sync_to_async(load_events)(key, ids=[message['id']])
+                chunks = [encode_event(event) for event in events]
+                last_sent = max(last_sent, message['id'])
+
+            for chunk in chunks:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        hub.unsubscribe(subscriber)
+        disconnected.cancel()
+
+
+async def wait_for_disconnect(receive, subscriber):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    subscriber.put(DISCONNECT)
@@ -0,0 +1,51 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from src.files.thumbnails import render_variants
+
+VARIANTS_DIR = 'profile_pics/variants'
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+
+def build_manifest(field_file):
+    """
+    Renders the PROFILE_PICTURE_SIZES variants of a stored picture and returns the URL
+    manifest kept on the user. Variant names contain the picture's content hash, so a
+    URL never changes meaning and can be cached forever; a new upload gets new URLs.
+    """
+    storage = field_file.storage
+    with field_file.open('rb') as picture:
+        content = picture.read()
+
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    variants = render_variants(ContentFile(content), settings.PROFILE_PICTURE_SIZES)
+
+    sizes = {}
+    for (size, image_format), data in variants.items():
+        name = f'{VARIANTS_DIR}/{digest}/{size}.{EXTENSIONS[image_format]}'
+        if not storage.exists(name):
+            storage.save(name, ContentFile(data))
+        sizes.setdefault(str(size), {})[image_format] = storage.url(name)
+
+    return {'source': field_file.name, 'original': storage.url(field_file.name), 'sizes': sizes}
+
+
+def picture_urls(name, manifest, url):
+    """
+    URLs for a stored profile picture. Once its manifest is built they come from there
+    without calling `url` (the storage's url method); until then only the original is known.
+    """
+    if not name:
+        return {'original': None, 'sizes': {}}
+    if manifest and manifest.get('source') == name:
+        return manifest
+    return {'original': url(name), 'sizes': {}}
+
+
+def needs_variants(user):
+    picture = user.profile_picture
+    default = user._meta.get_field('profile_picture').default
+    return bool(picture) and picture.name != default and \
+        (user.profile_picture_variants or {}).get('source') != picture.name
@@ -1,20 +1,31 @@
 import json
+import logging
+import os
+import queue
+import threading
+import time
 
 import pika
 from django.conf import settings
 
-def get_rabbitmq_connection():
+logger = logging.getLogger(__name__)
+
+RECOVERABLE_ERRORS = (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError)
+
+def get_rabbitmq_parameters():
     credentials = pika.PlainCredentials(
         username=settings.RABBITMQ_USER,
         password=settings.RABBITMQ_PASSWORD
     )
-    parameters = pika.ConnectionParameters(
+    return pika.ConnectionParameters(
         host=settings.RABBITMQ_HOST,
         port=settings.RABBITMQ_PORT,
         virtual_host=settings.RABBITMQ_VHOST,
         credentials=credentials
     )
-    connection = pika.BlockingConnection(parameters)
+
+def get_rabbitmq_connection():
+    connection = pika.BlockingConnection(get_rabbitmq_parameters())
     return connection
 
 def get_rabbitmq_channel():
@@ -37,4 +48,129 @@ def publish_message():
         properties=pika.BasicProperties(
             delivery_mode=2
         )
-    )
\ No newline at end of file
+    )
+
+
+class PooledChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.channel = connection.channel()
+        self.channel.confirm_delivery()
+
+    @property
+    def is_open(self):
+        return self.connection.is_open and self.channel.is_open
+
+    def close(self):
+        try:
+            self.connection.close()
+        except pika.exceptions.AMQPError:
+            pass
+
+
+class RabbitMQPublisher:
+    """
+    Process-wide publisher that keeps a small pool of open, confirm-mode channels
+    instead of paying a TCP and AMQP handshake for every message. Exchanges and
+    queues are declared once per process, and a dropped connection is replaced
+    and the publish retried.
+    """
+
+    def __init__(self, connection_factory=get_rabbitmq_connection, pool_size=None, retries=1):
+        self.connection_factory = connection_factory
+        self.pool_size = pool_size or settings.RABBITMQ_PUBLISHER_POOL_SIZE
+        self.retries = retries
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        self._declared = set()
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        # Connections must not be shared with forked Celery worker processes.
+        if self._pid != os.getpid():
+            self._reset()
+
+        try:
+            pooled = self._pool.get_nowait()
+        except queue.Empty:
+            return PooledChannel(self.connection_factory())
+
+        if pooled.is_open:
+            return pooled
+
+        pooled.close()
+        return PooledChannel(self.connection_factory())
+
+    def _release(self, pooled):
+        try:
+            self._pool.put_nowait(pooled)
+        except queue.Full:
+            pooled.close()
+
+    def _declare(self, channel, exchange, exchange_type, queue_name):
+        key = (exchange, exchange_type, queue_name)
+        if key in self._declared:
+            return
+
+        if exchange:
+            channel.exchange_declare(exchange=exchange, exchange_type=exchange_type, durable=True)
+        if queue_name:
+            channel.queue_declare(queue=queue_name)
+            if exchange:
+                channel.queue_bind(queue=queue_name, exchange=exchange, routing_key=queue_name)
+
+        with self._lock:
+            self._declared.add(key)
+
+    def publish(self, routing_key, body, exchange='', exchange_type='direct', queue_name=None, properties=None):
+        self.publish_batch(routing_key, [body], exchange, exchange_type, queue_name, properties)
+
+    def publish_batch(self, routing_key, bodies, exchange='', exchange_type='direct', queue_name=None,
+                      properties=None, content_type=None):
+        """
+        Publishes all bodies over one pooled channel. A retry after a lost connection
+        resends only the bodies the broker has not confirmed yet.
+        """
+        bodies = list(bodies)
+        sent = 0
+        # The timestamp lets consumers report how long messages waited in the queue.
+        properties = properties or pika.BasicProperties(delivery_mode=2, timestamp=int(time.time()),
+                                                        content_type=content_type)
+        for attempt in range(self.retries + 1):
+            pooled = self._acquire()
+            published = False
+            try:
+                self._declare(pooled.channel, exchange, exchange_type, queue_name)
+                while sent < len(bodies):
+                    pooled.channel.basic_publish(exchange=exchange, routing_key=routing_key, body=bodies[sent],
+                                                 properties=properties)
+                    sent += 1
+                published = True
+            except RECOVERABLE_ERRORS:
+                with self._lock:
+                    self._declared.clear()
+                if attempt == self.retries:
+                    raise
+                logger.warning('RabbitMQ publish to %s failed, reconnecting.', routing_key, exc_info=True)
+            finally:
+                # a channel that failed in any way is closed, never handed to the next publish
+                if published:
+                    self._release(pooled)
+                else:
+                    pooled.close()
+
+            if published:
+                return
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+publisher = RabbitMQPublisher()
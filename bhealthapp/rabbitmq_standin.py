@@ -0,0 +1,259 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+
+import pika
+
+
+class InMemoryBroker:
+    """
+    In-process stand-in for a RabbitMQ broker, implementing the part of pika's
+    BlockingConnection API the publishers and consumers use. connect_latency
+    simulates the TCP and AMQP handshake of a real broker.
+    """
+
+    def __init__(self, connect_latency=0.0):
+        self.connect_latency = connect_latency
+        self.queues = defaultdict(deque)
+        self.bindings = defaultdict(set)
+        self.connections = 0
+        self.declarations = 0
+        self.acked = 0
+        self.listeners = []
+        self.lock = threading.Condition()
+
+    def connect(self):
+        time.sleep(self.connect_latency)
+        with self.lock:
+            self.connections += 1
+        return InMemoryConnection(self)
+
+    async def open_async_channel(self):
+        """
+        Returns an open AsyncInMemoryChannel, like the channel factory of the
+        asyncio consumer engine.
+        """
+        await asyncio.sleep(self.connect_latency)
+        with self.lock:
+            self.connections += 1
+        return AsyncInMemoryChannel(InMemoryConnection(self), asyncio.get_running_loop())
+
+    def _notify(self):
+        for listener in list(self.listeners):
+            listener()
+
+    def route(self, exchange, routing_key, body, properties):
+        with self.lock:
+            if not exchange:
+                self.queues[routing_key].append((body, properties))
+            else:
+                for queue_name in self.bindings[(exchange, routing_key)]:
+                    self.queues[queue_name].append((body, properties))
+            self.lock.notify_all()
+        self._notify()
+
+    def requeue(self, queue_name, deliveries):
+        with self.lock:
+            self.queues[queue_name].extendleft(reversed(deliveries))
+            self.lock.notify_all()
+        self._notify()
+
+    def messages(self, queue_name):
+        return [body for body, properties in self.queues[queue_name]]
+
+
+class InMemoryConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+        self.channels = []
+
+    def channel(self):
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError('Connection is closed')
+        return InMemoryChannel(self)
+
+    def close(self):
+        self.is_open = False
+        for channel in self.channels:
+            channel.close()
+
+
+class InMemoryChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.is_open = True
+        self.prefetch_count = 0
+        self.delivery_tag = 0
+        self.unacked = {}
+        self.cancelled = False
+        connection.channels.append(self)
+
+    def _check_open(self):
+        if not self.connection.is_open:
+            raise pika.exceptions.StreamLostError('Connection lost')
+
+    def confirm_delivery(self):
+        self._check_open()
+
+    def exchange_declare(self, exchange, exchange_type='direct', durable=False, **kwargs):
+        self._check_open()
+        self.broker.declarations += 1
+
+    def queue_declare(self, queue, **kwargs):
+        self._check_open()
+        self.broker.declarations += 1
+        self.broker.queues[queue]
+
+    def queue_bind(self, queue, exchange, routing_key=None, **kwargs):
+        self._check_open()
+        self.broker.bindings[(exchange, routing_key or queue)].add(queue)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self._check_open()
+        self.broker.route(exchange, routing_key, body, properties)
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        self._check_open()
+        self.prefetch_count = prefetch_count
+
+    def _next_delivery(self, queue):
+        if self.prefetch_count and len(self.unacked) >= self.prefetch_count:
+            return None
+        if not self.broker.queues[queue]:
+            return None
+
+        body, properties = self.broker.queues[queue].popleft()
+        self.delivery_tag += 1
+        self.unacked[self.delivery_tag] = (queue, body, properties)
+        method = pika.spec.Basic.Deliver(delivery_tag=self.delivery_tag, routing_key=queue)
+        return method, properties or pika.BasicProperties(), body
+
+    def consume(self, queue, auto_ack=False, inactivity_timeout=None, **kwargs):
+        """
+        Mirrors BlockingChannel.consume: yields (method, properties, body) tuples, and
+        (None, None, None) whenever no message arrived within inactivity_timeout.
+        """
+        self.cancelled = False
+        while not self.cancelled:
+            self._check_open()
+            with self.broker.lock:
+                delivery = self._next_delivery(queue)
+                if delivery is None:
+                    self.broker.lock.wait(inactivity_timeout)
+                    delivery = self._next_delivery(queue)
+
+            if delivery is not None:
+                if auto_ack:
+                    self.basic_ack(delivery[0].delivery_tag)
+                yield delivery
+            elif inactivity_timeout is not None:
+                yield None, None, None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _settle(self, delivery_tag, multiple):
+        with self.broker.lock:
+            tags = [tag for tag in self.unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+            deliveries = [self.unacked.pop(tag) for tag in sorted(tags)]
+            self.broker.lock.notify_all()
+        return deliveries
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self._check_open()
+        deliveries = self._settle(delivery_tag, multiple)
+        with self.broker.lock:
+            self.broker.acked += len(deliveries)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self._check_open()
+        deliveries = self._settle(delivery_tag, multiple)
+        if requeue:
+            self._requeue(deliveries)
+
+    def _requeue(self, deliveries):
+        queues = defaultdict(list)
+        for queue, body, properties in deliveries:
+            queues[queue].append((body, properties))
+        for queue, messages in queues.items():
+            self.broker.requeue(queue, messages)
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        # Like RabbitMQ, unacknowledged deliveries go back to their queue.
+        self._requeue([self.unacked.pop(tag) for tag in sorted(self.unacked)])
+
+
+class AsyncInMemoryChannel(InMemoryChannel):
+    """
+    Callback style channel matching the part of pika's AsyncioConnection channel API
+    the asyncio consumer engine uses. Deliveries run on the channel's event loop.
+    """
+
+    def __init__(self, connection, loop):
+        super().__init__(connection)
+        self.loop = loop
+        self.consumers = {}
+        self.close_callbacks = []
+        self.broker.listeners.append(self._wake)
+
+    def add_on_close_callback(self, callback):
+        self.close_callbacks.append(callback)
+
+    def _wake(self):
+        if self.is_open and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._pump)
+
+    def _reply(self, callback):
+        if callback is not None:
+            self.loop.call_soon(callback, None)
+
+    def queue_declare(self, queue, callback=None, **kwargs):
+        super().queue_declare(queue)
+        self._reply(callback)
+
+    def basic_qos(self, prefetch_count=0, callback=None, **kwargs):
+        super().basic_qos(prefetch_count)
+        self._reply(callback)
+
+    def basic_consume(self, queue, on_message_callback, **kwargs):
+        self._check_open()
+        self.consumers[queue] = on_message_callback
+        self.loop.call_soon(self._pump)
+        return queue
+
+    def basic_cancel(self, consumer_tag, callback=None):
+        self.consumers.pop(consumer_tag, None)
+        self._reply(callback)
+
+    def _pump(self):
+        for queue, callback in list(self.consumers.items()):
+            while self.is_open and queue in self.consumers:
+                with self.broker.lock:
+                    delivery = self._next_delivery(queue)
+                if delivery is None:
+                    break
+                callback(self, *delivery)
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        super().basic_ack(delivery_tag, multiple)
+        self.loop.call_soon(self._pump)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        super().basic_nack(delivery_tag, multiple, requeue)
+        self.loop.call_soon(self._pump)
+
+    def close(self):
+        if self._wake in self.broker.listeners:
+            self.broker.listeners.remove(self._wake)
+        was_open = self.is_open
+        super().close()
+        if was_open:
+            for callback in self.close_callbacks:
+                self.loop.call_soon_threadsafe(callback, self, None)
+
@@ -1,10 +1,15 @@
 from distutils.command.upload import upload
 
+from datetime import timedelta
+
+from django.conf import settings
 from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
-from .models import Appointment, Lab, User, Type, City, Service, Result, UserRating, LabService, Notification
+from .models import Appointment, Lab, User, Type, City, Service, Result, UserRating, LabService, Notification, \
+    LabRatingSummary
 from src.files.models import File
 
 
@@ -99,11 +104,22 @@ class PatientSerializer(serializers.ModelSerializer):
 
 class PatientViewSerializer(serializers.ModelSerializer):
     gender = ChoiceField(choices=User.GENDER_CHOICES)
+    profile_picture = serializers.SerializerMethodField()
+    profile_picture_variants = serializers.SerializerMethodField()
+
+    def get_profile_picture(self, obj):
+        url = obj.profile_picture_urls()['original']
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if url and request else url
+
+    def get_profile_picture_variants(self, obj):
+        return obj.profile_picture_urls()['sizes']
 
     class Meta:
         model = User
         fields = [
             "profile_picture",
+            "profile_picture_variants",
             "profile_link",
             "name",
             "surname",
@@ -135,7 +151,26 @@ class LabSerializer(serializers.ModelSerializer):
         ]
 
 
+class LabRatingSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LabRatingSummary
+        fields = [
+            "no_rating_count",
+            "one_star_count",
+            "two_star_count",
+            "three_star_count",
+            "four_star_count",
+            "five_star_count",
+            "rating_count",
+            "rating_sum",
+            "average_rating",
+            "last_updated",
+        ]
+
+
 class LabViewSerializer(serializers.ModelSerializer):
+    rating_summary = LabRatingSummarySerializer(read_only=True)
+
     class Meta:
         model = Lab
         fields = [
@@ -146,10 +181,19 @@ class LabViewSerializer(serializers.ModelSerializer):
             "phone_number",
             "email",
             "website",
+            "rating_summary",
         ]
         depth = 1
 
 
+class LabNestedSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Lab
+        exclude = [
+            "search_vector",
+        ]
+
+
 class LabServiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = LabService
@@ -160,6 +204,8 @@ class LabServiceSerializer(serializers.ModelSerializer):
 
 
 class LabServiceViewSerializer(serializers.ModelSerializer):
+    lab_service = LabNestedSerializer(read_only=True)
+
     class Meta:
         model = LabService
         fields = [
@@ -281,11 +327,13 @@ class AppointmentSerializer(serializers.ModelSerializer):
 
         def get_patient(self, obj):
             patient = obj.patient
+            picture = patient.profile_picture_urls()
             return {
                 'id': patient.id,
                 'name': patient.name,
                 'surname': patient.surname,
-                'profile_picture': patient.profile_picture.url,
+                'profile_picture': picture['original'],
+                'profile_picture_variants': picture['sizes'],
                 'profile_link': patient.profile_link,
                 'phone_number': patient.phone_number,
                 'email': patient.email,
@@ -304,7 +352,29 @@ class AppointmentSerializer(serializers.ModelSerializer):
 
 
 
+class AppointmentBookingSerializer(serializers.Serializer):
+    lab_appointment = serializers.PrimaryKeyRelatedField(queryset=Lab.objects.all())
+    service_appointment = serializers.PrimaryKeyRelatedField(queryset=Service.objects.all())
+    patient = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    date = serializers.DateTimeField()
+    city_appointment = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        if not LabService.objects.filter(lab_service=attrs['lab_appointment'],
+                                         service=attrs['service_appointment']).exists():
+            raise serializers.ValidationError('The lab does not offer this service.')
+
+        now = timezone.now()
+        if not now < attrs['date'] <= now + timedelta(days=settings.APPOINTMENT_BOOKING_MAX_DAYS):
+            raise serializers.ValidationError(
+                f'Appointments can be booked up to {settings.APPOINTMENT_BOOKING_MAX_DAYS} days ahead.')
+
+        return attrs
+
+
 class AppointmentViewSerializer(serializers.ModelSerializer):
+    lab_appointment = LabNestedSerializer(read_only=True)
+
     class Meta:
         model = Appointment
         fields = [
@@ -319,6 +389,8 @@ class AppointmentViewSerializer(serializers.ModelSerializer):
 
 
 class ResultSerializer(serializers.ModelSerializer):
+    PDF_SIGNATURE = b'%PDF-'
+
     class Meta:
         model = Result
         fields = [
@@ -326,6 +398,16 @@ class ResultSerializer(serializers.ModelSerializer):
             "pdf",
         ]
 
+    def validate_pdf(self, pdf):
+        # Only the first bytes are read, the upload stays on disk until it is stored.
+        pdf.seek(0)
+        signature = pdf.read(len(self.PDF_SIGNATURE))
+        pdf.seek(0)
+        if signature != self.PDF_SIGNATURE:
+            raise serializers.ValidationError('Uploaded file is not a PDF.')
+
+        return pdf
+
 
 
 
@@ -348,11 +430,18 @@ class NotificationSerializer(serializers.ModelSerializer):
             "notification_appointment",
             "message",
             "is_confirmed",
-            "is_declined"
+            "is_declined",
+            "is_read"
         ]
 
 
+class NotificationBulkUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), min_length=1, max_length=500)
+
+
 class NotificationViewSerializer(serializers.ModelSerializer):
+    notification_lab = LabNestedSerializer(read_only=True)
+
     class Meta:
         model = Notification
         fields = [
@@ -361,6 +450,7 @@ class NotificationViewSerializer(serializers.ModelSerializer):
             "notification_appointment",
             "message",
             "is_confirmed",
-            "is_declined"
+            "is_declined",
+            "is_read"
         ]
         depth = 1
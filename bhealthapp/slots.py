@@ -0,0 +1,152 @@
+import bisect
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Appointment, Lab, LabOpeningHours
+
+# Pending requests hold their time as well, so a lab never has to confirm two overlapping ones.
+BUSY_STATUSES = (Appointment.STATUS_PENDING, Appointment.STATUS_CONFIRMED)
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+class DaySchedule:
+    """
+    Busy time of one lab on one day, kept as two sorted arrays of merged, disjoint
+    intervals in epoch seconds. Checking a booking is a bisect, listing the free slots
+    of a day is a single walk over both arrays.
+    """
+
+    def __init__(self, busy=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(busy):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def is_free(self, start, end):
+        index = bisect.bisect_right(self.starts, start)
+        if index and self.ends[index - 1] > start:
+            return False
+        return index == len(self.starts) or self.starts[index] >= end
+
+    def free_slots(self, opening, duration, step, not_before=None):
+        """
+        Start times of every `duration` long gap inside the `opening` intervals, on a
+        grid of `step` seconds from the opening time.
+        """
+        slots = []
+        for open_start, open_end in opening:
+            start = open_start
+            if not_before is not None and start < not_before:
+                start = align(not_before, open_start, step)
+            index = bisect.bisect_right(self.ends, start)
+
+            while start + duration <= open_end:
+                while index < len(self.ends) and self.ends[index] <= start:
+                    index += 1
+                if index < len(self.starts) and self.starts[index] < start + duration:
+                    start = align(self.ends[index], open_start, step)
+                    continue
+                slots.append(start)
+                start += step
+
+        return slots
+
+
+def align(moment, origin, step):
+    return origin + -(-(moment - origin) // step) * step
+
+
+def weekly_hours(lab_id):
+    hours = defaultdict(list)
+    for weekday, opens, closes in LabOpeningHours.objects.filter(lab_id=lab_id).values_list(
+            'weekday', 'opens', 'closes'):
+        hours[weekday].append((opens, closes))
+
+    if hours:
+        return hours
+    return {
+        weekday: [(time.fromisoformat(opens), time.fromisoformat(closes)) for opens, closes in intervals]
+        for weekday, intervals in settings.LAB_DEFAULT_OPENING_HOURS.items()
+    }
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_opening(hours, day):
+    return [
+        (int(timezone.make_aware(datetime.combine(day, opens)).timestamp()),
+         int(timezone.make_aware(datetime.combine(day, closes)).timestamp()))
+        for opens, closes in hours.get(day.weekday(), ())
+    ]
+
+
+def day_schedules(lab_id, first_day, last_day):
+    """
+    Builds a DaySchedule for every day of the range from one query on the lab's
+    appointment timeline index.
+    """
+    busy = defaultdict(list)
+    appointments = Appointment.objects.filter(
+        lab_appointment_id=lab_id, status__in=BUSY_STATUSES,
+        date__gte=day_start(first_day), date__lt=day_start(last_day + timedelta(days=1)),
+    ).values_list('date', 'service_appointment__duration')
+
+    for date, duration in appointments:
+        start = int(date.timestamp())
+        busy[timezone.localdate(date)].append((start, start + int(duration.total_seconds())))
+
+    days = (first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1))
+    return {day: DaySchedule(busy.get(day, ())) for day in days}
+
+
+def available_slots(lab_id, service, first_day, last_day):
+    """
+    Returns {day: [aware datetimes]} of the times `service` can still be booked at the lab.
+    """
+    hours = weekly_hours(lab_id)
+    duration = int(service.duration.total_seconds())
+    step = settings.APPOINTMENT_SLOT_STEP * 60
+    now = int(timezone.now().timestamp())
+    tz = timezone.get_current_timezone()
+
+    return {
+        day: [datetime.fromtimestamp(slot, tz) for slot in schedule.free_slots(
+            day_opening(hours, day), duration, step, not_before=now)]
+        for day, schedule in day_schedules(lab_id, first_day, last_day).items()
+    }
+
+
+def book_appointment(lab_appointment, service_appointment, patient, date, **fields):
+    """
+    Creates a pending appointment if the time is inside the lab's opening hours and
+    overlaps no other booking. The lab row is locked first, so concurrent bookings at
+    one lab are checked one after the other. Raises SlotUnavailable otherwise.
+    """
+    with transaction.atomic():
+        list(Lab.objects.select_for_update().filter(pk=lab_appointment.pk).values_list('pk'))
+
+        day = timezone.localdate(date)
+        start = int(date.timestamp())
+        end = start + int(service_appointment.duration.total_seconds())
+        opening = day_opening(weekly_hours(lab_appointment.pk), day)
+
+        if not any(open_start <= start and end <= open_end for open_start, open_end in opening):
+            raise SlotUnavailable('The lab is closed at this time.')
+        if not day_schedules(lab_appointment.pk, day, day)[day].is_free(start, end):
+            raise SlotUnavailable('This time is already booked.')
+
+        return Appointment.objects.create(lab_appointment=lab_appointment, service_appointment=service_appointment,
+                                          patient=patient, date=date, status=Appointment.STATUS_PENDING, **fields)
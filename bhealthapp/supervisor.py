@@ -0,0 +1,122 @@
+import logging
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from bhealthapp.async_consumer import AsyncConsumerEngine
+from bhealthapp.consumer import CONSUMERS
+
+logger = logging.getLogger(__name__)
+
+
+def run_worker(queue, options):
+    options = dict(options)
+    engine = options.pop('engine', None) or settings.CONSUMER_ENGINE
+    consumer = CONSUMERS[queue](**options)
+
+    if engine == 'asyncio':
+        AsyncConsumerEngine([consumer]).start()
+        return
+
+    def stop(signum, frame):
+        consumer.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    consumer.start()
+    logger.info('%s', consumer.metrics)
+
+
+class ConsumerSupervisor:
+    """
+    Runs `workers[queue]` consumer processes for every queue and restarts the ones that
+    exit while the supervisor is running. A worker that keeps crashing is restarted
+    with an exponential backoff capped at `max_restart_delay` seconds.
+    """
+
+    def __init__(self, workers, options=None, target=run_worker, restart_delay=1.0, max_restart_delay=60.0,
+                 shutdown_timeout=30.0):
+        self.workers = workers
+        self.options = options or {}
+        self.target = target
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.shutdown_timeout = shutdown_timeout
+        self.context = multiprocessing.get_context('fork')
+        self.processes = {}
+        self.crashes = {}
+        self.restarts = 0
+        self.stopping = False
+
+    def spawn(self, slot):
+        queue, index = slot
+        # Forked workers must open their own database connections.
+        connections.close_all()
+        process = self.context.Process(target=self.target, args=(queue, self.options), name=f'{queue}-{index}',
+                                       daemon=False)
+        process.start()
+        self.processes[slot] = (process, time.monotonic())
+        logger.info('Started consumer %s (pid %s)', process.name, process.pid)
+
+    def start(self):
+        for queue, count in self.workers.items():
+            for index in range(count):
+                self.spawn((queue, index))
+
+    def check(self):
+        """
+        Restarts every worker that exited, unless it is still backing off.
+        """
+        now = time.monotonic()
+        for slot, (process, started) in list(self.processes.items()):
+            if process.is_alive() or self.stopping:
+                continue
+
+            crashes, not_before = self.crashes.get(slot, (0, 0.0))
+            if not_before == 0.0:
+                # A worker that ran for a while before exiting starts its backoff over.
+                crashes = crashes + 1 if now - started < self.max_restart_delay else 1
+                delay = min(self.restart_delay * 2 ** (crashes - 1), self.max_restart_delay)
+                logger.warning('Consumer %s exited with code %s, restarting in %.1fs', process.name,
+                               process.exitcode, delay)
+                not_before = now + delay
+
+            if now < not_before:
+                self.crashes[slot] = (crashes, not_before)
+                continue
+
+            self.crashes[slot] = (crashes, 0.0)
+            self.restarts += 1
+            self.spawn(slot)
+
+    def stop(self):
+        self.stopping = True
+        for process, started in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        for process, started in self.processes.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning('Consumer %s did not stop in time, killing it', process.name)
+                process.kill()
+                process.join()
+
+    def run(self, poll_interval=1.0):
+        def stop(signum, frame):
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.start()
+        try:
+            while not self.stopping:
+                self.check()
+                time.sleep(poll_interval)
+        finally:
+            self.stop()
@@ -1,88 +1,74 @@
-import json
+import logging
 from datetime import date
-from django.core.serializers import serialize
-from django.conf import settings
-import pika
+
 from django.conf import settings
+from django.utils import timezone
 
 today = date.today()
 
-from .serializers import ResultSerializer
-
 from celery import shared_task
-from .models import Result, Appointment, Notification
+from PIL import UnidentifiedImageError
 
+from .detail_cache import detail_cache, invalidate_recommendations
+from .models import Lab, Notification, LabRatingSummary, OutboxEvent, User, UserNotificationCounter, \
+    LabNotificationCounter
+from .profile_pictures import build_manifest
+from .rabbitmq import publisher
 
-@shared_task
-def upload_pdf(result_id, data):
-    serializer = ResultSerializer(data=data)
-    serializer.is_valid(raise_exception=True)
-    serializer.save()
+logger = logging.getLogger(__name__)
 
-    result = Result.objects.last()
-    result.appointment = Appointment.objects.get(pk=result_id)
-    result.save(update_fields=['appointment'])
 
-    # Publish notification to RabbitMQ
-    message = {
-        'type': 'result_created',
-        'data': serialize('json', [result.appointment])
-    }
+@shared_task
+def reconcile_lab_rating_summaries():
+    changed = LabRatingSummary.objects.rebuild()
+    # lab payloads embed their summary, and drift means ratings changed without the
+    # signals that drop the cached rankings
+    detail_cache.invalidate(Lab, changed)
+    if changed:
+        invalidate_recommendations()
 
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host=settings.CELERY_BROKER_URL))
-    channel = connection.channel()
+    return f"Rebuilt lab rating summaries, {len(changed)} changed"
 
-    channel.queue_declare(queue='notifications')
-    channel.basic_publish(exchange='', routing_key='notifications', body=json.dumps(message))
 
-    connection.close()
+@shared_task
+def reconcile_notification_counters():
+    users = UserNotificationCounter.objects.rebuild()
+    labs = LabNotificationCounter.objects.rebuild()
 
-    return "Done"
+    return f"Rebuilt unread counters of {users} users and {labs} labs"
 
 
 @shared_task
-def send_request_notification(appointment_id):
-    appointment = Appointment.objects.get(id=appointment_id)
-    if appointment.status == 0:
-        message = {
-            'id': appointment.id,
-            'lab_id': appointment.lab_appointment.id,
-            'patient_id': appointment.patient.id,
-            'service_name': appointment.service_appointment.name,
-            'date': str(appointment.date),
-        }
-        connection = pika.BlockingConnection(pika.ConnectionParameters(
-            host=settings.RABBITMQ_HOST,
-            port=settings.RABBITMQ_PORT,
-            credentials=pika.PlainCredentials(
-                settings.RABBITMQ_USER,
-                settings.RABBITMQ_PASSWORD,
-            ),
-        ))
-        channel = connection.channel()
-        channel.exchange_declare(exchange=settings.RABBITMQ_EXCHANGE, exchange_type='direct')
-        channel.basic_publish(
-            exchange='requests',
-            routing_key='new_request',
-            body=json.dumps(message),
-        )
-        connection.close()
+def relay_outbox(max_batches=100):
+    """
+    Drains the outbox until it is empty or `max_batches` batches were relayed.
+    """
+    relayed = 0
+    for _ in range(max_batches):
+        count, lag = OutboxEvent.objects.relay(publisher, batch_size=settings.OUTBOX_RELAY_BATCH_SIZE)
+        if not count:
+            break
+        relayed += count
+        logger.info('Relayed %d outbox events, lag %.3fs', count, lag)
 
-    return "Done"
+    return f"Relayed {relayed} outbox events"
 
 
 @shared_task
-def request_updated(appointment_id):
-    appointment = Appointment.objects.get(pk=appointment_id)
-
-    # Send message to RabbitMQ
-    message = f'Appointment request updated: {appointment}'
-    connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
-    channel = connection.channel()
-    channel.queue_declare(queue='appointment_updates')
-    channel.basic_publish(exchange='',
-                          routing_key='appointment_updates',
-                          body=message)
-    connection.close()
+def generate_profile_picture_variants(user_id, picture):
+    user = User.objects.filter(pk=user_id, profile_picture=picture).first()
+    if user is None:
+        return "Replaced"
+
+    try:
+        manifest = build_manifest(user.profile_picture)
+    except (UnidentifiedImageError, FileNotFoundError):
+        logger.warning('Profile picture %s of user %s cannot be read', picture, user_id)
+        return "Unreadable"
+
+    # update() so post_save does not queue another run, and only if the picture is still current.
+    User.objects.filter(pk=user_id, profile_picture=picture).update(profile_picture_variants=manifest,
+                                                                    updated_at=timezone.now())
+    detail_cache.invalidate(User, [user_id])
 
     return "Done"
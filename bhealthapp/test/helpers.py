@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.db.models import signals
+from django.utils import timezone
+
+from bhealthapp.models import Country, City, User, Lab, Type, Service, Appointment
+from src.common.signals import DisableSignals
+
+
+def create_appointments(count, status=Appointment.STATUS_CONFIRMED, days=1):
+    country = Country.objects.create(name='Bosnia and Herzegovina')
+    city = City.objects.create(name='Sarajevo', country=country, postal_code=71000)
+    lab = Lab.objects.create(city=city, name='TestLab', password='1234567', address='TestAddress',
+                             email='lab@email.com')
+    service_type = Type.objects.create(name='TestType')
+    appointments = []
+
+    with DisableSignals([signals.post_save]):
+        for i in range(count):
+            patient = User.objects.create(username=f'patient{i}', name='TestName', surname='TestSurname',
+                                          email=f'patient{i}@email.com', city=city)
+            service = Service.objects.create(name=f'TestService{i}', duration=timedelta(minutes=30),
+                                             type=service_type)
+            appointments.append(Appointment.objects.create(lab_appointment=lab, service_appointment=service,
+                                                           patient=patient, status=status,
+                                                           date=timezone.now() + timedelta(days=days)))
+
+    return lab, appointments
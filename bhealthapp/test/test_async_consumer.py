@@ -0,0 +1,64 @@
+import asyncio
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from bhealthapp.async_consumer import AsyncConsumerEngine, DeliveryTracker
+from bhealthapp.consumer import AppointmentUpdatesConsumer
+from bhealthapp.models import Notification
+from bhealthapp.rabbitmq import RabbitMQPublisher
+from bhealthapp.rabbitmq_standin import InMemoryBroker
+from bhealthapp.test.helpers import create_appointments
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.calls = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.calls.append(('ack', delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.calls.append(('nack', delivery_tag, requeue))
+
+
+class DeliveryTrackerTest(SimpleTestCase):
+
+    def test_out_of_order_batches_are_acked_in_order(self):
+        channel = RecordingChannel()
+        tracker = DeliveryTracker(channel)
+        for delivery_tag in range(1, 7):
+            tracker.delivered(delivery_tag)
+
+        tracker.settle([3, 4], set())
+        self.assertEqual(channel.calls, [])
+
+        tracker.settle([1, 2], {2})
+        self.assertEqual(channel.calls, [('nack', 2, False), ('ack', 4, True)])
+
+        tracker.settle([5, 6], {6})
+        self.assertEqual(channel.calls[2:], [('nack', 6, False), ('ack', 5, True)])
+        """Test Async Consumer: Out of order batches are acked in order -> Working"""
+
+
+class AsyncConsumerEngineTest(TransactionTestCase):
+
+    def test_consumes_queue_concurrently(self):
+        lab, appointments = create_appointments(3)
+        broker = InMemoryBroker()
+        publisher = RabbitMQPublisher(connection_factory=broker.connect, pool_size=1)
+        publisher.publish_batch('appointment_updates', [
+            f'Appointment request updated: {appointments[i % 3].id}' for i in range(30)
+        ] + ['Appointment request updated: nope'], queue_name='appointment_updates')
+
+        consumer = AppointmentUpdatesConsumer(prefetch_count=20, batch_size=5, batch_timeout=0.05,
+                                              exit_when_idle=True)
+        engine = AsyncConsumerEngine([consumer], channel_factory=broker.open_async_channel, concurrency=4)
+        asyncio.run(engine.run())
+        engine.shutdown()
+
+        self.assertEqual(Notification.objects.count(), 30)
+        self.assertEqual(broker.acked, 30)
+        self.assertEqual(consumer.metrics.messages, 31)
+        self.assertEqual(consumer.metrics.failed, 1)
+        self.assertEqual(broker.messages('appointment_updates'), [])
+        """Test Async Consumer: Engine consumes a queue with concurrent batches -> Working"""
@@ -0,0 +1,14 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+
+class ExplainAppointmentQueriesTest(TestCase):
+
+    def test_runs_against_current_schema(self):
+        out = StringIO()
+        call_command('explain_appointment_queries', rows=20000, labs=20, patients=200, stdout=out)
+
+        self.assertIn('All appointment timeline queries use index scans.', out.getvalue())
+        """Test Commands: Appointment query plans are generated against the current schema -> Working"""
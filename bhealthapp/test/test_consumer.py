@@ -0,0 +1,87 @@
+import msgpack
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from bhealthapp.consumer import NewResultConsumer, RequestConsumer, AppointmentUpdatesConsumer
+from bhealthapp.event_schema import AppointmentUpdated
+from bhealthapp.models import Notification, OutboxEvent, Result, UserNotificationCounter, LabNotificationCounter
+from bhealthapp.rabbitmq import RabbitMQPublisher
+from bhealthapp.rabbitmq_standin import InMemoryBroker
+from bhealthapp.test.helpers import create_appointments
+
+
+class BatchConsumerTest(TestCase):
+
+    def setUp(self):
+        self.lab, self.appointments = create_appointments(5)
+        self.broker = InMemoryBroker()
+        self.publisher = RabbitMQPublisher(connection_factory=self.broker.connect, pool_size=1)
+
+    def relay(self):
+        while OutboxEvent.objects.relay(self.publisher)[0]:
+            pass
+
+    def consume(self, consumer_class, **kwargs):
+        consumer = consumer_class(connection_factory=self.broker.connect, batch_timeout=0.01, **kwargs)
+        flush = consumer.flush
+
+        def flush_and_stop(batch):
+            flush(batch)
+            if not self.broker.queues[consumer.queue]:
+                consumer.stop()
+
+        consumer.flush = flush_and_stop
+        consumer.start()
+        return consumer
+
+    def test_result_notifications_in_batches(self):
+        for appointment in self.appointments:
+            OutboxEvent.objects.enqueue_result_created(Result(appointment=appointment))
+        self.relay()
+
+        with CaptureQueriesContext(connection) as context:
+            consumer = self.consume(NewResultConsumer, prefetch_count=2, batch_size=5)
+
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "bhealthapp_notification"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(consumer.metrics.batches, 3)
+        self.assertEqual(consumer.metrics.messages, 5)
+        self.assertEqual(self.broker.acked, 5)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('notification_appointment', flat=True)),
+            sorted(appointment.id for appointment in self.appointments),
+        )
+        """Test Consumer: Result notifications are written per batch -> Working"""
+
+    def test_request_and_update_notifications(self):
+        OutboxEvent.objects.enqueue_appointment_request(self.appointments[0])
+        OutboxEvent.objects.enqueue_appointment_update(self.appointments[1])
+        self.relay()
+
+        self.consume(RequestConsumer)
+        self.consume(AppointmentUpdatesConsumer)
+
+        request, update = Notification.objects.order_by('id')
+        self.assertEqual(request.notification_lab, self.lab)
+        self.assertTrue(request.message.startswith(f'New request for {self.appointments[0].service_appointment.name}'))
+        self.assertEqual(update.notification_user, self.appointments[1].patient)
+        self.assertEqual(self.broker.acked, 2)
+        self.assertEqual(UserNotificationCounter.objects.unread(self.appointments[1].patient.pk), 1)
+        self.assertEqual(LabNotificationCounter.objects.unread(self.lab.pk), 2)
+        """Test Consumer: Request and update notifications -> Working"""
+
+    def test_bad_message_is_rejected_alone(self):
+        OutboxEvent.objects.enqueue_appointment_update(self.appointments[0])
+        OutboxEvent.objects.create(queue='appointment_updates', payload=msgpack.packb([AppointmentUpdated.type_code, 1]))
+        OutboxEvent.objects.enqueue_appointment_update(self.appointments[1])
+        self.relay()
+
+        consumer = self.consume(AppointmentUpdatesConsumer)
+
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(consumer.metrics.failed, 1)
+        self.assertEqual(self.broker.acked, 2)
+        self.assertEqual(self.broker.messages('appointment_updates'), [])
+        """Test Consumer: Bad message is rejected without the batch -> Working"""
@@ -0,0 +1,94 @@
+import fakeredis
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory
+
+from bhealthapp.detail_cache import detail_cache
+from bhealthapp.models import City, Lab, Result, UserRating
+from bhealthapp.test.helpers import create_appointments
+from bhealthapp.views import LabView, AppointmentView, ProfileView, ResultView
+
+
+class DetailCacheTest(TestCase):
+    factory = APIRequestFactory()
+
+    def setUp(self):
+        self.settings = override_settings(CACHES={'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://localhost:6379/1',
+            'OPTIONS': {'CONNECTION_POOL_KWARGS': {
+                'connection_class': fakeredis.FakeConnection, 'server': fakeredis.FakeServer(),
+            }},
+        }})
+        self.settings.enable()
+        self.lab, self.appointments = create_appointments(1)
+        self.appointment = self.appointments[0]
+
+    def tearDown(self):
+        caches['default'].clear()
+        self.settings.disable()
+
+    def get(self, view, pk):
+        response = view.as_view()(self.factory.get('/', {'pk': pk}))
+        return response, response.get('X-Cache')
+
+    def test_read_through(self):
+        result = Result.objects.create(appointment=self.appointment)
+
+        for view, pk in ((LabView, self.lab.pk), (AppointmentView, self.appointment.pk),
+                         (ProfileView, self.appointment.patient_id), (ResultView, result.pk)):
+            first, first_cache = self.get(view, pk)
+            with self.assertNumQueries(0):
+                second, second_cache = self.get(view, pk)
+
+            self.assertEqual((first_cache, second_cache), ('MISS', 'HIT'))
+            self.assertEqual(first.data, second.data)
+
+        self.assertEqual(self.get(LabView, 0)[0].status_code, 404)
+        self.assertEqual(self.get(LabView, 'abc')[0].status_code, 404)
+        self.assertEqual(detail_cache.metrics.hit_rate('bhealthapp.result'), 0.5)
+        """Test Detail Cache: Detail payloads are served from the cache -> Working"""
+
+    def test_invalidated_on_change(self):
+        self.get(LabView, self.lab.pk)
+        self.get(AppointmentView, self.appointment.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Lab.objects.get(pk=self.lab.pk).save()
+        self.assertEqual(self.get(LabView, self.lab.pk)[1], 'MISS')
+        self.assertEqual(self.get(AppointmentView, self.appointment.pk)[1], 'MISS')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserRating.objects.create(user=self.appointment.patient, lab=self.lab, rating=5)
+        self.assertEqual(self.get(LabView, self.lab.pk)[1], 'MISS')
+
+        self.get(ProfileView, self.appointment.patient_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.patient.save()
+        response, hit = self.get(ProfileView, self.appointment.patient_id)
+        self.assertEqual(hit, 'MISS')
+        """Test Detail Cache: Saving an object invalidates its payloads -> Working"""
+
+    def test_invalidated_on_nested_change(self):
+        patient = self.appointment.patient
+        for related in (patient, self.appointment.service_appointment):
+            self.get(AppointmentView, self.appointment.pk)
+            related.name = 'Renamed'
+            with self.captureOnCommitCallbacks(execute=True):
+                related.save()
+            self.assertEqual(self.get(AppointmentView, self.appointment.pk)[1], 'MISS')
+
+        response = self.get(AppointmentView, self.appointment.pk)[0]
+        self.assertEqual(response.data['patient']['name'], 'Renamed')
+        self.assertEqual(response.data['service_appointment']['name'], 'Renamed')
+
+        self.get(LabView, self.lab.pk)
+        self.get(ProfileView, patient.pk)
+        city = City.objects.get(pk=self.lab.city_id)
+        city.name = 'Mostar'
+        with self.captureOnCommitCallbacks(execute=True):
+            city.save()
+        for view, pk in ((LabView, self.lab.pk), (ProfileView, patient.pk)):
+            response, hit = self.get(view, pk)
+            self.assertEqual((hit, response.data['city']['name']), ('MISS', 'Mostar'))
+        """Test Detail Cache: Changing an embedded object invalidates the payloads embedding it -> Working"""
@@ -0,0 +1,45 @@
+import json
+
+import msgpack
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from bhealthapp.event_schema import AppointmentRequested, AppointmentUpdated, ResultCreated, EventDecodeError, \
+    encode, decode
+
+
+class EventSchemaTest(SimpleTestCase):
+
+    def test_round_trip(self):
+        events = [
+            AppointmentRequested(1, 2, 3, 'Lipid panel', timezone.now()),
+            AppointmentUpdated(1, 1, None),
+            ResultCreated(1, 7),
+        ]
+
+        for event in events:
+            self.assertEqual(decode(encode(event)), event)
+        self.assertLess(len(encode(events[0])), 40)
+        """Test Event Schema: Events survive encode and decode -> Working"""
+
+    def test_other_schema_versions(self):
+        older = msgpack.packb([AppointmentUpdated.type_code, 0, 5])
+        newer = msgpack.packb([AppointmentUpdated.type_code, 2, 5, 1, None, 'added later'])
+
+        self.assertEqual(decode(older), AppointmentUpdated(5))
+        self.assertEqual(decode(newer), AppointmentUpdated(5, 1))
+        with self.assertRaises(EventDecodeError):
+            decode(msgpack.packb([99, 1, 5]))
+        """Test Event Schema: Older and newer schema versions decode -> Working"""
+
+    def test_legacy_messages(self):
+        result = json.dumps({'type': 'result_created', 'data': json.dumps([{'pk': 4, 'model': 'appointment'}])})
+        request = json.dumps({'id': 4, 'lab_id': 2, 'patient_id': 3, 'service_name': 'Lipid panel',
+                              'date': '2026-10-18 10:00:00+00:00'})
+
+        self.assertEqual(decode(result), ResultCreated(4))
+        self.assertEqual(decode(request).date.hour, 10)
+        self.assertEqual(decode(b'Appointment request updated: 4'), AppointmentUpdated(4))
+        with self.assertRaises(EventDecodeError):
+            decode(b'Appointment request updated: nope')
+        """Test Event Schema: Messages from before the schema decode -> Working"""
@@ -0,0 +1,81 @@
+from unittest import mock
+
+import pika
+from django.db import transaction
+from django.test import TestCase
+
+from bhealthapp.event_schema import AppointmentUpdated, decode
+from bhealthapp.models import Appointment, OutboxEvent
+from bhealthapp.rabbitmq import RabbitMQPublisher
+from bhealthapp.rabbitmq_standin import InMemoryBroker
+from bhealthapp.test.helpers import create_appointments
+
+
+class OutboxRelayTest(TestCase):
+
+    def setUp(self):
+        self.lab, self.appointments = create_appointments(3)
+        self.broker = InMemoryBroker()
+        self.publisher = RabbitMQPublisher(connection_factory=self.broker.connect, pool_size=1)
+
+    def test_appointment_save_writes_outbox(self):
+        with transaction.atomic():
+            self.appointments[0].save()
+            self.appointments[0].save()
+            transaction.set_rollback(True)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+        for appointment in self.appointments + self.appointments[:1]:
+            appointment.save()
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+        """Test Events: Appointment changes are written to the outbox -> Working"""
+
+    def test_repeated_updates_collapse(self):
+        appointment = self.appointments[0]
+        appointment.save()
+        appointment.status = Appointment.STATUS_CANCELED
+        appointment.save()
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(decode(bytes(event.payload)).status, Appointment.STATUS_CANCELED)
+
+        OutboxEvent.objects.relay(self.publisher)
+        appointment.save()
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+        self.assertEqual(len(self.broker.messages('appointment_updates')), 1)
+        """Test Events: Repeated updates of an appointment wait as one outbox event -> Working"""
+
+    def test_relay_publishes_batches(self):
+        for appointment in self.appointments + self.appointments[:1]:
+            OutboxEvent.objects.enqueue_appointment_update(appointment)
+        OutboxEvent.objects.enqueue_appointment_request(self.appointments[0])
+
+        self.assertEqual(OutboxEvent.objects.relay(self.publisher, batch_size=2)[0], 2)
+        self.assertEqual(OutboxEvent.objects.relay(self.publisher, batch_size=2)[0], 2)
+        self.assertEqual(OutboxEvent.objects.relay(self.publisher, batch_size=2), (0, 0.0))
+
+        self.assertEqual(self.broker.connections, 1)
+        self.assertEqual([decode(body).appointment_id for body in self.broker.messages('appointment_updates')],
+                         [appointment.id for appointment in self.appointments])
+        self.assertEqual(decode(self.broker.messages('requests')[0]).appointment_id, self.appointments[0].id)
+        self.assertEqual(OutboxEvent.objects.lag(), 0.0)
+        """Test Events: Outbox relay publishes and deletes batches -> Working"""
+
+    def test_relay_deduplicates_batch(self):
+        for appointment in self.appointments + self.appointments:
+            OutboxEvent.objects.enqueue(AppointmentUpdated(appointment.id))
+
+        self.assertEqual(OutboxEvent.objects.relay(self.publisher)[0], 6)
+        self.assertEqual(len(self.broker.messages('appointment_updates')), 3)
+        """Test Events: Outbox relay deduplicates a batch -> Working"""
+
+    def test_failed_publish_keeps_events(self):
+        OutboxEvent.objects.enqueue_appointment_update(self.appointments[0])
+
+        with mock.patch.object(self.publisher, 'publish_batch', side_effect=pika.exceptions.StreamLostError):
+            with self.assertRaises(pika.exceptions.StreamLostError):
+                OutboxEvent.objects.relay(self.publisher)
+
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+        self.assertGreater(OutboxEvent.objects.lag(), 0)
+        """Test Events: Outbox keeps events that failed to publish -> Working"""
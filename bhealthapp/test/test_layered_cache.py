@@ -0,0 +1,87 @@
+import time
+import uuid
+
+import fakeredis
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from src.common.cache import LocalLayer, LocalLRU, MISSING
+
+SERVER = fakeredis.FakeServer()
+
+
+class LayeredCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        # every test listens on its own channel, layers of earlier tests keep running
+        self.channel = f'cache-invalidation-{uuid.uuid4().hex}'
+        self.settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'src.common.cache.LayeredCache',
+                'OPTIONS': {'REMOTE': 'redis', 'CHANNEL': self.channel, 'MAX_ENTRIES': 3, 'LOCAL_TIMEOUT': 60},
+            },
+            'redis': {
+                'BACKEND': 'django_redis.cache.RedisCache',
+                'LOCATION': 'redis://localhost:6379/2',
+                'OPTIONS': {'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection, 'server': SERVER}},
+            },
+        })
+        self.settings.enable()
+        self.cache, self.remote = caches['default'], caches['redis']
+        self.wait_until(lambda: self.cache.layer.listening)
+
+    def tearDown(self):
+        self.remote.clear()
+        self.settings.disable()
+
+    def wait_until(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'Timed out waiting for the invalidation listener')
+            time.sleep(0.01)
+
+    def test_reads_are_served_locally(self):
+        self.cache.set('city:1', {'name': 'Sarajevo'})
+        self.assertEqual(self.cache.get('city:1'), {'name': 'Sarajevo'})
+
+        # changed behind the layer's back, the local copy is still served
+        self.remote.set('city:1', {'name': 'Mostar'})
+        self.assertEqual(self.cache.get('city:1'), {'name': 'Sarajevo'})
+        self.assertEqual(self.cache.get_many(['city:1', 'city:2']), {'city:1': {'name': 'Sarajevo'}})
+
+        self.cache.set('city:1', {'name': 'Tuzla'})
+        self.assertEqual(self.cache.get('city:1'), {'name': 'Tuzla'})
+        self.cache.delete('city:1')
+        self.assertIsNone(self.cache.get('city:1'))
+        """Test Layered Cache: Reads are served from the process LRU, writes go through -> Working"""
+
+    def test_invalidated_by_other_workers(self):
+        self.cache.set_many({'type:1': 'Blood', 'type:2': 'Urine'})
+        self.cache.get_many(['type:1', 'type:2'])
+        self.remote.set_many({'type:1': 'Blood test', 'type:2': 'Urine test'})
+
+        other_worker = LocalLayer('redis', self.channel, 10, 60)
+        other_worker.publish([self.cache.make_key('type:1')])
+        self.wait_until(lambda: self.cache.get('type:1') == 'Blood test')
+        self.assertEqual(self.cache.get('type:2'), 'Urine')
+
+        other_worker.publish(None)
+        self.wait_until(lambda: self.cache.get('type:2') == 'Urine test')
+        """Test Layered Cache: Writes of other workers evict the local copies -> Working"""
+
+    def test_local_layer_is_bounded(self):
+        lru = LocalLRU(max_entries=2, timeout=60)
+        for key in ('a', 'b', 'c'):
+            lru.set(key, key, lru.generation)
+        self.assertEqual(list(lru.entries), ['b', 'c'])
+
+        # an invalidation arrived while the value was fetched from Redis
+        generation = lru.generation
+        lru.evict(['d'])
+        lru.set('d', 'stale', generation)
+        self.assertIs(lru.get('d'), MISSING)
+
+        expired = LocalLRU(max_entries=2, timeout=-1)
+        expired.set('a', 'a', expired.generation)
+        self.assertIs(expired.get('a'), MISSING)
+        """Test Layered Cache: The LRU is bounded and drops stale fetches -> Working"""
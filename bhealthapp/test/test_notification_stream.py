@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import transaction
+from django.test import TransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from bhealthapp import event_schema
+from bhealthapp.consumer import AppointmentUpdatesConsumer
+from bhealthapp.models import Notification
+from bhealthapp.notification_stream import notification_stream
+from bhealthapp.test.helpers import create_appointments
+
+
+class NotificationStreamTest(TransactionTestCase):
+    # NOTIFY is only delivered on commit, so the tests commit for real
+
+    def setUp(self):
+        self.lab, self.appointments = create_appointments(2)
+        self.patient = self.appointments[0].patient
+        self.token = str(AccessToken.for_user(self.patient))
+
+    def consume(self, appointments):
+        with transaction.atomic():
+            AppointmentUpdatesConsumer(connection_factory=None).handle_batch([
+                event_schema.encode(event_schema.AppointmentUpdated(appointment_id=appointment.id))
+                for appointment in appointments
+            ])
+
+    @async_to_sync
+    async def stream(self, query='', headers=(), action=None, events=0):
+        """
+        Opens a stream, runs `action` once it is subscribed and disconnects after `events`
+        events. Returns the response status and the events received.
+        """
+        receive = asyncio.Queue()
+        body, status, arrived = bytearray(), [], asyncio.Event()
+
+        async def send(message):
+            status.extend([message['status']] if 'status' in message else [])
+            body.extend(message.get('body', b''))
+            arrived.set()
+
+        scope = {'type': 'http', 'path': '/api/v1/notification_stream', 'query_string': query.encode(),
+                 'headers': [(name.encode(), value.encode()) for name, value in headers]}
+        task = asyncio.ensure_future(notification_stream(scope, receive.get, send))
+
+        async def wait_for(condition):
+            while not condition() and not task.done():
+                await asyncio.wait_for(arrived.wait(), 5)
+                arrived.clear()
+
+        await wait_for(lambda: b'retry:' in body)
+        if action is not None:
+            await sync_to_async(action)()
+        await wait_for(lambda: body.count(b'event: notification') >= events)
+
+        await receive.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(task, 5)
+
+        chunks = [chunk for chunk in body.decode().split('\n\n') if chunk.startswith('id: ')]
+        return status[0], [json.loads(chunk.split('data: ', 1)[1]) for chunk in chunks]
+
+    def test_streams_new_notifications(self):
+        status, events = self.stream(f'token={self.token}', action=lambda: self.consume(self.appointments), events=1)
+
+        self.assertEqual(status, 200)
+        notification = Notification.objects.get(notification_user=self.patient)
+        self.assertEqual([event['id'] for event in events], [notification.id])
+        self.assertEqual(events[0]['notification_appointment'], self.appointments[0].id)
+        """Test Notification Stream: Committed notifications are pushed to their user -> Working"""
+
+    def test_resumes_from_last_event_id(self):
+        self.consume([self.appointments[0]] * 3)
+        first, *missed = Notification.objects.filter(notification_user=self.patient).order_by('id')
+
+        status, events = self.stream(headers=[('authorization', f'Bearer {self.token}'),
+                                              ('last-event-id', str(first.id))], events=2)
+        self.assertEqual([event['id'] for event in events], [notification.id for notification in missed])
+        """Test Notification Stream: Last-Event-ID replays the missed notifications -> Working"""
+
+    def test_requires_token(self):
+        self.assertEqual(self.stream()[0], 401)
+        self.assertEqual(self.stream(f'token={self.token}&lab={self.lab.id}')[0], 403)
+
+        self.patient.is_staff = True
+        self.patient.save()
+        status, events = self.stream(f'token={self.token}&lab={self.lab.id}',
+                                     action=lambda: self.consume(self.appointments), events=2)
+        self.assertEqual(len(events), 2)
+        """Test Notification Stream: Streams need a token, lab streams need staff -> Working"""
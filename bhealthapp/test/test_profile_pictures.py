@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from bhealthapp.models import Appointment, User
+from bhealthapp.serializers import AppointmentSerializer
+from bhealthapp.tasks import generate_profile_picture_variants
+from bhealthapp.test.helpers import create_appointments
+
+
+class ProfilePictureVariantsTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        self.lab, self.appointments = create_appointments(1)
+        self.patient = self.appointments[0].patient
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload_picture(self):
+        output = BytesIO()
+        Image.new('RGB', (1200, 900), (20, 120, 200)).save(output, 'JPEG')
+        self.patient.profile_picture = SimpleUploadedFile('me.jpg', output.getvalue(), 'image/jpeg')
+
+        with mock.patch('bhealthapp.tasks.generate_profile_picture_variants.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.patient.save()
+
+        delay.assert_called_once_with(self.patient.id, self.patient.profile_picture.name)
+        return generate_profile_picture_variants(self.patient.id, self.patient.profile_picture.name)
+
+    def test_variants_generated_once(self):
+        self.assertEqual(self.upload_picture(), 'Done')
+
+        self.patient.refresh_from_db()
+        manifest = self.patient.profile_picture_urls()
+        self.assertEqual(sorted(manifest['sizes']), ['128', '360', '64'])
+        self.assertEqual(sorted(manifest['sizes']['64']), ['jpeg', 'webp'])
+        path = manifest['sizes']['64']['webp'].replace('/media/', self.media_root + '/', 1)
+        self.assertEqual(Image.open(path).size, (64, 48))
+
+        with mock.patch('bhealthapp.tasks.generate_profile_picture_variants.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                User.objects.get(pk=self.patient.pk).save()
+        delay.assert_not_called()
+        """Test Profile Pictures: Variants are rendered once per upload -> Working"""
+
+    def test_serializers_use_manifest(self):
+        self.upload_picture()
+        queryset = Appointment.objects.order_by('id')
+
+        with mock.patch.object(FileSystemStorage, 'url', side_effect=AssertionError('storage call')):
+            appointments = AppointmentSerializer(queryset.with_related(), many=True).data
+
+        self.patient.refresh_from_db()
+        patient = appointments[0]['patient']
+        self.assertEqual(patient['profile_picture_variants'], self.patient.profile_picture_urls()['sizes'])
+        self.assertTrue(patient['profile_picture_variants']['360']['jpeg'].endswith('360.jpg'))
+        self.assertTrue(patient['profile_picture'].endswith('me.jpg'))
+        """Test Profile Pictures: Serializers build URLs from the manifest -> Working"""
@@ -0,0 +1,68 @@
+import pika
+from django.test import SimpleTestCase
+
+from bhealthapp.rabbitmq import RabbitMQPublisher
+from bhealthapp.rabbitmq_standin import InMemoryBroker
+
+
+class RabbitMQPublisherTest(SimpleTestCase):
+
+    def setUp(self):
+        self.broker = InMemoryBroker()
+        self.publisher = RabbitMQPublisher(connection_factory=self.broker.connect, pool_size=2)
+
+    def test_reuses_connection_and_declares_once(self):
+        for i in range(10):
+            self.publisher.publish(routing_key='results', queue_name='results', body=str(i))
+
+        self.assertEqual(self.broker.connections, 1)
+        self.assertEqual(self.broker.declarations, 1)
+        self.assertEqual(self.broker.messages('results'), [str(i) for i in range(10)])
+        """Test RabbitMQ: Publisher reuses pooled channel -> Working"""
+
+    def test_exchange_routing(self):
+        self.publisher.publish(exchange='events', routing_key='requests', queue_name='requests', body='request')
+
+        self.assertEqual(self.broker.messages('requests'), ['request'])
+        """Test RabbitMQ: Publisher declares and binds exchange -> Working"""
+
+    def test_reconnects_after_connection_loss(self):
+        self.publisher.publish(routing_key='results', queue_name='results', body='before')
+        self.publisher._pool.queue[0].connection.is_open = False
+
+        self.publisher.publish(routing_key='results', queue_name='results', body='after')
+
+        self.assertEqual(self.broker.connections, 2)
+        self.assertEqual(self.broker.messages('results'), ['before', 'after'])
+        """Test RabbitMQ: Publisher reconnects -> Working"""
+
+    def test_retries_when_publish_fails(self):
+        self.publisher.publish(routing_key='results', queue_name='results', body='before')
+
+        def lost(**kwargs):
+            raise pika.exceptions.StreamLostError('Connection lost')
+
+        self.publisher._pool.queue[0].channel.basic_publish = lost
+        self.publisher.publish(routing_key='results', queue_name='results', body='after')
+
+        self.assertEqual(self.broker.connections, 2)
+        self.assertEqual(self.broker.declarations, 2)
+        self.assertEqual(self.broker.messages('results'), ['before', 'after'])
+        """Test RabbitMQ: Publisher retries on a lost connection -> Working"""
+
+    def test_closes_channel_on_unexpected_error(self):
+        self.publisher.publish(routing_key='results', queue_name='results', body='before')
+        pooled = self.publisher._pool.queue[0]
+
+        def broken(**kwargs):
+            raise RuntimeError('Broken channel')
+
+        pooled.channel.basic_publish = broken
+        with self.assertRaises(RuntimeError):
+            self.publisher.publish(routing_key='results', queue_name='results', body='after')
+
+        self.assertFalse(pooled.connection.is_open)
+        self.assertEqual(self.publisher._pool.qsize(), 0)
+        self.publisher.publish(routing_key='results', queue_name='results', body='again')
+        self.assertEqual(self.broker.messages('results'), ['before', 'again'])
+        """Test RabbitMQ: Publisher closes the channel after an unexpected error -> Working"""
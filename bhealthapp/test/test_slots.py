@@ -0,0 +1,113 @@
+import threading
+from datetime import datetime, time, timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from bhealthapp.models import Appointment, LabOpeningHours, LabService, OutboxEvent
+from bhealthapp.slots import DaySchedule, SlotUnavailable, available_slots, book_appointment
+from bhealthapp.test.helpers import create_appointments
+from bhealthapp.views import AddAppointmentView
+
+
+def at(day, hour, minute=0):
+    return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+
+class SlotEngineMixin:
+
+    def create_lab(self):
+        self.lab, self.appointments = create_appointments(2)
+        self.service = self.appointments[0].service_appointment
+        self.patient = self.appointments[0].patient
+        self.day = timezone.localdate() + timedelta(days=2)
+        LabService.objects.create(lab_service=self.lab, service=self.service)
+        LabOpeningHours.objects.bulk_create([
+            LabOpeningHours(lab=self.lab, weekday=weekday, opens=time(8), closes=time(12)) for weekday in range(7)
+        ])
+
+
+class DayScheduleTest(TestCase):
+
+    def test_free_slots_and_overlaps(self):
+        schedule = DaySchedule([(60, 90), (0, 30), (20, 40)])
+
+        self.assertEqual((schedule.starts, schedule.ends), ([0, 60], [40, 90]))
+        self.assertTrue(schedule.is_free(40, 60))
+        self.assertFalse(schedule.is_free(35, 45))
+        self.assertFalse(schedule.is_free(50, 70))
+        self.assertEqual(schedule.free_slots([(0, 120)], duration=20, step=10), [40, 90, 100])
+        self.assertEqual(schedule.free_slots([(0, 120)], duration=20, step=10, not_before=95), [100])
+        """Test Slots: Day schedule finds gaps and overlaps -> Working"""
+
+
+class AvailableSlotsTest(SlotEngineMixin, TestCase):
+    factory = APIRequestFactory()
+
+    def setUp(self):
+        self.create_lab()
+
+    def book(self, date, service=None):
+        request = self.factory.post('/', {
+            'lab_appointment': self.lab.id, 'service_appointment': (service or self.service).id,
+            'patient': self.patient.id, 'date': date.isoformat(),
+        }, format='json')
+        return AddAppointmentView.as_view()(request)
+
+    def test_slots_skip_booked_time(self):
+        Appointment.objects.create(lab_appointment=self.lab, service_appointment=self.service, patient=self.patient,
+                                   date=at(self.day, 9), status=Appointment.STATUS_CONFIRMED)
+
+        with self.assertNumQueries(2):
+            slots = available_slots(self.lab.id, self.service, self.day, self.day + timedelta(days=1))
+
+        self.assertEqual(len(slots), 2)
+        self.assertEqual(slots[self.day][:4], [at(self.day, 8), at(self.day, 8, 15), at(self.day, 8, 30),
+                                               at(self.day, 9, 30)])
+        self.assertEqual(slots[self.day][-1], at(self.day, 11, 30))
+        self.assertEqual(len(slots[self.day + timedelta(days=1)]), 15)
+        """Test Slots: Booked time is not offered -> Working"""
+
+    def test_booking_refuses_overlaps(self):
+        response = self.book(at(self.day, 10))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('requests', OutboxEvent.objects.values_list('queue', flat=True))
+
+        self.assertEqual(self.book(at(self.day, 10, 15)).status_code, 409)
+        self.assertEqual(self.book(at(self.day, 11, 45)).status_code, 409)
+        self.assertEqual(self.book(at(self.day, 10, 30)).status_code, 200)
+        self.assertEqual(self.book(at(self.day, 9), service=self.appointments[1].service_appointment).status_code,
+                         400)
+        """Test Slots: Overlapping and closed-hours bookings are refused -> Working"""
+
+
+class ConcurrentBookingTest(SlotEngineMixin, TransactionTestCase):
+
+    def test_one_of_two_concurrent_bookings_wins(self):
+        self.create_lab()
+        barrier = threading.Barrier(2)
+        outcomes = []
+
+        def book(minute):
+            try:
+                barrier.wait()
+                book_appointment(self.lab, self.service, self.patient, at(self.day, 10, minute))
+                outcomes.append('booked')
+            except SlotUnavailable:
+                outcomes.append('refused')
+            finally:
+                connection.close()
+
+        with mock.patch('bhealthapp.tasks.relay_outbox.delay'):
+            threads = [threading.Thread(target=book, args=(minute,)) for minute in (0, 15)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sorted(outcomes), ['booked', 'refused'])
+        self.assertEqual(Appointment.objects.filter(date__gte=at(self.day, 0)).count(), 1)
+        """Test Slots: Concurrent overlapping bookings are serialized -> Working"""
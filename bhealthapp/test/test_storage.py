@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from bhealthapp.models import Result
+from bhealthapp.test.helpers import create_appointments
+from src.files.models import Blob
+
+
+class ContentAddressedStorageTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        self.lab, self.appointments = create_appointments(3)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload(self, appointment, content):
+        result = Result(appointment=appointment)
+        result.pdf.save('report.pdf', ContentFile(content))
+        return result
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.upload(self.appointments[0], b'%PDF-1.4 template')
+        second = self.upload(self.appointments[1], b'%PDF-1.4 template')
+        other = self.upload(self.appointments[2], b'%PDF-1.4 other')
+
+        self.assertEqual(first.pdf.name, second.pdf.name)
+        self.assertNotEqual(first.pdf.name, other.pdf.name)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'cas', first.pdf.name[4:6]))), 1)
+        self.assertEqual(Blob.objects.get(key=first.pdf.name).refcount, 2)
+        """Test Storage: Identical uploads are stored once -> Working"""
+
+    def test_blob_removed_with_last_reference(self):
+        first = self.upload(self.appointments[0], b'%PDF-1.4 template')
+        second = self.upload(self.appointments[1], b'%PDF-1.4 template')
+        path = first.pdf.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Blob.objects.get(key=second.pdf.name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.exists())
+        """Test Storage: Blob is deleted with its last reference -> Working"""
+
+    def test_reupload_after_rollback(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                path = self.upload(self.appointments[0], b'%PDF-1.4 template').pdf.path
+                raise ValueError
+        self.assertFalse(Blob.objects.exists())
+        with open(path, 'wb') as leftover:
+            leftover.write(b'%PDF')
+
+        result = self.upload(self.appointments[1], b'%PDF-1.4 template')
+
+        self.assertEqual(result.pdf.path, path)
+        self.assertEqual(Blob.objects.get(key=result.pdf.name).refcount, 1)
+        with open(path, 'rb') as stored:
+            self.assertEqual(stored.read(), b'%PDF-1.4 template')
+        """Test Storage: Rolled back upload is stored again -> Working"""
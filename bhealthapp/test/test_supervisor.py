@@ -0,0 +1,61 @@
+import multiprocessing
+import signal
+import sys
+import time
+
+from django.test import SimpleTestCase
+
+from bhealthapp.supervisor import ConsumerSupervisor
+
+
+def crash(queue, options):
+    sys.exit(1)
+
+
+def idle(queue, options):
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    options['ready'].release()
+    time.sleep(60)
+
+
+class ConsumerSupervisorTest(SimpleTestCase):
+
+    def wait_until(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'Timed out waiting for workers')
+            time.sleep(0.01)
+
+    def test_starts_and_stops_workers_per_queue(self):
+        ready = multiprocessing.get_context('fork').Semaphore(0)
+        supervisor = ConsumerSupervisor({'results': 2, 'requests': 1}, {'ready': ready}, target=idle)
+        supervisor.start()
+        processes = [process for process, started in supervisor.processes.values()]
+        # terminating a worker before it installed its SIGTERM handler would kill it with -15
+        for process in processes:
+            self.assertTrue(ready.acquire(timeout=5))
+
+        self.assertEqual(sorted(process.name for process in processes), ['requests-0', 'results-0', 'results-1'])
+        self.assertTrue(all(process.is_alive() for process in processes))
+
+        supervisor.stop()
+        self.assertEqual([process.exitcode for process in processes], [0, 0, 0])
+        """Test Supervisor: Workers start per queue and stop gracefully -> Working"""
+
+    def test_restarts_crashed_workers_with_backoff(self):
+        supervisor = ConsumerSupervisor({'results': 1}, target=crash, restart_delay=0, max_restart_delay=60)
+        supervisor.start()
+
+        for restarts in range(1, 4):
+            self.wait_until(lambda: not supervisor.processes[('results', 0)][0].is_alive())
+            supervisor.check()
+            self.assertEqual(supervisor.restarts, restarts)
+
+        supervisor.restart_delay = 60
+        self.wait_until(lambda: not supervisor.processes[('results', 0)][0].is_alive())
+        supervisor.check()
+        self.assertEqual(supervisor.restarts, 3)
+        self.assertEqual(supervisor.crashes[('results', 0)][0], 4)
+
+        supervisor.stop()
+        """Test Supervisor: Crashed workers are restarted with backoff -> Working"""
@@ -0,0 +1,96 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+
+from bhealthapp.detail_cache import WE_RECOMMEND_CACHE_KEY
+from bhealthapp.models import Lab, LabRatingSummary, UserRating, Notification, UserNotificationCounter, \
+    LabNotificationCounter
+from bhealthapp.tasks import reconcile_lab_rating_summaries, reconcile_notification_counters
+from bhealthapp.test.helpers import create_appointments
+from bhealthapp.views import LabView
+
+
+class ReconcileLabRatingSummariesTest(TestCase):
+
+    def setUp(self):
+        self.lab, appointments = create_appointments(4)
+        self.patients = [appointment.patient for appointment in appointments]
+
+    def rate(self, lab, ratings):
+        for patient, rating in zip(self.patients, ratings):
+            UserRating.objects.create(user=patient, lab=lab, rating=rating)
+            LabRatingSummary.objects.record_rating(lab, rating)
+
+    def test_incremental_summary_matches_rebuild(self):
+        self.rate(self.lab, [5, 4, 0, 3])
+        incremental = LabRatingSummary.objects.values().get(lab=self.lab)
+
+        reconcile_lab_rating_summaries()
+        rebuilt = LabRatingSummary.objects.values().get(lab=self.lab)
+
+        for summary in (incremental, rebuilt):
+            self.assertEqual(summary['rating_count'], 3)
+            self.assertEqual(summary['rating_sum'], 12)
+            self.assertEqual(summary['average_rating'], 4.0)
+            self.assertEqual(summary['no_rating_count'], 1)
+            self.assertEqual(summary['five_star_count'], 1)
+        """Test Tasks: Lab rating summary reconciliation -> Working"""
+
+    def test_rebuild_fixes_drift(self):
+        other_lab = Lab.objects.create(city=self.lab.city, name='OtherLab', address='TestAddress',
+                                       email='other@email.com')
+        LabRatingSummary.objects.create(lab=other_lab, rating_count=7, rating_sum=35, average_rating=5.0)
+        UserRating.objects.create(user=self.patients[0], lab=self.lab, rating=2)
+
+        self.assertEqual(reconcile_lab_rating_summaries(), 'Rebuilt lab rating summaries, 2 changed')
+        self.assertFalse(LabRatingSummary.objects.filter(lab=other_lab).exists())
+        self.assertEqual(LabRatingSummary.objects.get(lab=self.lab).average_rating, 2.0)
+        """Test Tasks: Lab rating summary drift -> Working"""
+
+    def test_rebuild_drops_changed_caches(self):
+        view = LabView.as_view()
+        request = APIRequestFactory().get('/', {'pk': self.lab.pk})
+        self.rate(self.lab, [4])
+        view(request)
+        cache.set(WE_RECOMMEND_CACHE_KEY.format('average'), [])
+        # written without the signals, as a queryset bulk write does
+        UserRating.objects.bulk_create([UserRating(user=self.patients[1], lab=self.lab, rating=2)])
+
+        self.assertEqual(view(request)['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reconcile_lab_rating_summaries(), 'Rebuilt lab rating summaries, 1 changed')
+
+        response = view(request)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['rating_summary']['average_rating'], 3.0)
+        self.assertIsNone(cache.get(WE_RECOMMEND_CACHE_KEY.format('average')))
+        self.assertEqual(reconcile_lab_rating_summaries(), 'Rebuilt lab rating summaries, 0 changed')
+        cache.clear()
+        """Test Tasks: Lab rating summary rebuild drops the cached lab and rankings -> Working"""
+
+
+class ReconcileNotificationCountersTest(TestCase):
+
+    def setUp(self):
+        self.lab, self.appointments = create_appointments(2)
+
+    def test_rebuild_fixes_drift(self):
+        other_lab = Lab.objects.create(city=self.lab.city, name='OtherLab', address='TestAddress',
+                                       email='other@email.com')
+        LabNotificationCounter.objects.create(lab=other_lab, unread=4)
+        patient = self.appointments[0].patient
+        UserNotificationCounter.objects.create(user=patient, unread=9)
+        # written around the queryset, as the admin does
+        Notification.objects.bulk_create([
+            Notification(notification_lab=self.lab, notification_user=appointment.patient,
+                         notification_appointment=appointment, is_read=is_read)
+            for appointment, is_read in ((self.appointments[0], False), (self.appointments[0], True),
+                                         (self.appointments[1], False))
+        ])
+
+        self.assertEqual(reconcile_notification_counters(), 'Rebuilt unread counters of 2 users and 1 labs')
+        self.assertEqual(UserNotificationCounter.objects.unread(patient.pk), 1)
+        self.assertEqual(UserNotificationCounter.objects.unread(self.appointments[1].patient.pk), 1)
+        self.assertEqual(LabNotificationCounter.objects.unread(self.lab.pk), 2)
+        self.assertEqual(LabNotificationCounter.objects.unread(other_lab.pk), 0)
+        """Test Tasks: Unread notification counter drift -> Working"""
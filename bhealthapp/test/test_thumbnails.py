@@ -0,0 +1,126 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.middleware.csrf import get_token
+from django.test import Client, RequestFactory, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase, APIRequestFactory, force_authenticate
+
+from bhealthapp.test.helpers import create_appointments
+from src.files.models import File
+from src.files.thumbnails import render_thumbnail
+from src.files.views import FilesViewset
+
+
+def jpeg(size=(2400, 1600)):
+    output = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(output, 'JPEG')
+    return output.getvalue()
+
+
+class ThumbnailPipelineTest(APITestCase):
+    factory = APIRequestFactory()
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        lab, appointments = create_appointments(2)
+        self.user, self.other = [appointment.patient for appointment in appointments]
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def create_file(self, content, name):
+        file = File(author=self.user)
+        file.file.save(name, ContentFile(content), save=False)
+        with mock.patch('src.files.tasks.generate_thumbnails.delay'):
+            file.save()
+        return file
+
+    def retrieve(self, file, user):
+        request = self.factory.get('/')
+        force_authenticate(request, user)
+        return FilesViewset.as_view({'get': 'retrieve'})(request, pk=file.pk)
+
+    def test_upload_returns_before_thumbnail(self):
+        request = self.factory.post('/', {'file': SimpleUploadedFile('photo.jpg', jpeg(), 'image/jpeg')},
+                                    format='multipart')
+        force_authenticate(request, self.user)
+
+        with mock.patch('src.files.tasks.generate_thumbnails.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = FilesViewset.as_view({'post': 'create'})(request)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['thumbnail_status'], File.THUMBNAIL_PENDING)
+        self.assertIsNone(response.data['thumbnail'])
+        delay.assert_called_once_with()
+        """Test Thumbnails: Upload responds before the thumbnail is rendered -> Working"""
+
+    def test_upload_with_session_csrf_check(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        token = get_token(RequestFactory().get('/'))
+        client.cookies[settings.CSRF_COOKIE_NAME] = token
+
+        with mock.patch('src.files.tasks.generate_thumbnails.delay'):
+            response = client.post('/api/v1/files/', {'file': SimpleUploadedFile('photo.jpg', jpeg(), 'image/jpeg'),
+                                                      'csrfmiddlewaretoken': token})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(File.objects.get(author=self.user).file.name.startswith('cas/'))
+        """Test Thumbnails: Upload works for session users past the CSRF check -> Working"""
+
+    def test_batch_renders_thumbnails(self):
+        photo = jpeg()
+        files = [self.create_file(photo, 'a.jpg'), self.create_file(photo, 'b.jpg'),
+                 self.create_file(b'%PDF-1.4 report', 'report.pdf')]
+
+        self.assertEqual(File.objects.render_thumbnails(batch_size=10), 3)
+        self.assertEqual(File.objects.render_thumbnails(batch_size=10), 0)
+
+        first, second, report = [File.objects.get(pk=file.pk) for file in files]
+        self.assertEqual(first.thumbnail_status, File.THUMBNAIL_READY)
+        self.assertEqual(first.thumbnail.name, second.thumbnail.name)
+        self.assertEqual(Image.open(first.thumbnail).size, (360, 240))
+        self.assertEqual(report.thumbnail_status, File.THUMBNAIL_NONE)
+
+        self.assertEqual(self.retrieve(first, self.user).data['thumbnail_status'], File.THUMBNAIL_READY)
+        self.assertEqual(self.retrieve(first, self.other).status_code, 404)
+        """Test Thumbnails: Pending files are rendered in batches -> Working"""
+
+    def test_renders_outside_claim_transaction(self):
+        file = self.create_file(jpeg(), 'a.jpg')
+        depth = len(connection.savepoint_ids)
+
+        def render(*args):
+            self.assertEqual(len(connection.savepoint_ids), depth)
+            self.assertIsNotNone(File.objects.get(pk=file.pk).thumbnail_claimed_at)
+            return render_thumbnail(*args)
+
+        with mock.patch('src.files.models.render_thumbnail', side_effect=render) as renderer:
+            self.assertEqual(File.objects.render_thumbnails(), 1)
+
+        renderer.assert_called_once()
+        self.assertEqual(File.objects.get(pk=file.pk).thumbnail_status, File.THUMBNAIL_READY)
+        """Test Thumbnails: Images are rendered after the claim commits -> Working"""
+
+    def test_claims_expire(self):
+        file = self.create_file(jpeg(), 'a.jpg')
+        File.objects.filter(pk=file.pk).update(thumbnail_claimed_at=timezone.now())
+        self.assertEqual(File.objects.render_thumbnails(), 0)
+
+        File.objects.filter(pk=file.pk).update(thumbnail_claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(File.objects.render_thumbnails(), 1)
+        self.assertEqual(File.objects.get(pk=file.pk).thumbnail_status, File.THUMBNAIL_READY)
+        """Test Thumbnails: Files of an expired claim are rendered again -> Working"""
@@ -0,0 +1,534 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import tracemalloc
+from datetime import timedelta
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.middleware.csrf import get_token
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APIRequestFactory, force_authenticate
+
+from bhealthapp.detail_cache import WE_RECOMMEND_CACHE_KEY
+from bhealthapp.models import Appointment, Lab, LabService, OutboxEvent, Result, Service, Type, User, UserRating, \
+    Notification, UserNotificationCounter, LabNotificationCounter
+from bhealthapp.test.helpers import create_appointments
+from bhealthapp.views import CustomPagination, UpcomingAppointmentsUserView, PastAppointmentsUserView, \
+    UpcomingAppointmentsLabView, PastAppointmentsLabView, RequestsView, WeRecommendView, RatingAddView, LabView, \
+    LabListView, LabServiceListView, ResultAddView, ResultDownloadView, NotificationListView, \
+    UnreadNotificationsView, NotificationBulkUpdateView
+
+
+class QueryCountGuardMixin:
+    """
+    Fails when the number of SQL queries a list endpoint issues depends on the page size.
+    """
+    factory = APIRequestFactory()
+
+    def count_queries(self, view, params):
+        request = self.factory.get('/', params)
+        with CaptureQueriesContext(connection) as context:
+            response = view.as_view()(request)
+            response.render()
+
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def assertConstantQueries(self, view, params, page_sizes=(1, 12)):
+        counts = []
+        for page_size in page_sizes:
+            count, response = self.count_queries(view, {**params, 'page_size': page_size})
+            self.assertEqual(len(response.data['results']), page_size)
+            counts.append(count)
+
+        self.assertEqual(len(set(counts)), 1, f'Query count grows with page size: {counts}')
+
+
+class AppointmentListQueriesTest(QueryCountGuardMixin, APITestCase):
+
+    def create_patient_appointments(self, count, days):
+        lab, appointments = create_appointments(count, days=days)
+        patient = appointments[0].patient
+        Appointment.objects.filter(pk__in=[appointment.pk for appointment in appointments]).update(patient=patient)
+        return patient
+
+    def test_upcoming_appointments_user(self):
+        patient = self.create_patient_appointments(12, days=1)
+        self.assertConstantQueries(UpcomingAppointmentsUserView, {'patient': patient.id})
+        """Test Views: Upcoming appointments per user -> Working"""
+
+    def test_past_appointments_user(self):
+        patient = self.create_patient_appointments(12, days=-1)
+        self.assertConstantQueries(PastAppointmentsUserView, {'patient': patient.id})
+        """Test Views: Past appointments per user -> Working"""
+
+    def test_upcoming_appointments_lab(self):
+        lab, appointments = create_appointments(12)
+        self.assertConstantQueries(UpcomingAppointmentsLabView, {'lab': lab.id})
+        """Test Views: Upcoming appointments per lab -> Working"""
+
+    def test_past_appointments_lab(self):
+        lab, appointments = create_appointments(12, days=-1)
+        self.assertConstantQueries(PastAppointmentsLabView, {'lab': lab.id})
+        """Test Views: Past appointments per lab -> Working"""
+
+    def test_requests(self):
+        lab, appointments = create_appointments(12, status=Appointment.STATUS_PENDING)
+        self.assertConstantQueries(RequestsView, {'lab_appointment': lab.id})
+        """Test Views: Pending requests per lab -> Working"""
+
+
+class CursorPaginationTest(QueryCountGuardMixin, APITestCase):
+
+    def setUp(self):
+        self.lab, self.appointments = create_appointments(15, status=Appointment.STATUS_PENDING)
+
+    def test_cursor_pages_cover_all_rows(self):
+        params = {'lab_appointment': self.lab.id, 'pagination': 'cursor', 'page_size': 3}
+        seen = []
+
+        while True:
+            count, response = self.count_queries(RequestsView, params)
+            self.assertNotIn('count', response.data)
+            seen.extend(row['patient']['username'] for row in response.data['results'])
+            if response.data['next'] is None:
+                break
+            params['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+
+        self.assertEqual(sorted(seen), sorted(appointment.patient.username for appointment in self.appointments))
+        """Test Views: Cursor pagination walks every row once -> Working"""
+
+    def test_cursor_breaks_date_ties_on_id(self):
+        # two groups of rows sharing a date, the older rows have the later date
+        later, earlier = self.appointments[:5], self.appointments[5:10]
+        date = self.appointments[0].date
+        for group, date in ((later, date + timedelta(hours=1)), (earlier, date)):
+            Appointment.objects.filter(pk__in=[appointment.pk for appointment in group]).update(
+                status=Appointment.STATUS_CONFIRMED, date=date)
+        params = {'lab': self.lab.id, 'pagination': 'cursor', 'page_size': 3}
+        seen = []
+
+        while True:
+            count, response = self.count_queries(UpcomingAppointmentsLabView, params)
+            seen.extend(row['patient']['username'] for row in response.data['results'])
+            if response.data['next'] is None:
+                break
+            params['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+
+        expected = [appointment.patient.username for group in (later, earlier)
+                    for appointment in sorted(group, key=lambda appointment: appointment.pk, reverse=True)]
+        self.assertEqual(seen, expected)
+        """Test Views: Cursor pagination orders timelines by date and id -> Working"""
+
+    def test_cursor_rejects_unstable_orderings(self):
+        request = self.factory.get('/', {'lab_appointment': self.lab.id, 'pagination': 'cursor', 'ordering': 'date'})
+        self.assertEqual(RequestsView.as_view()(request).status_code, 400)
+
+        request = self.factory.get('/', {'search': 'TestLab', 'pagination': 'cursor'})
+        self.assertEqual(LabListView.as_view()(request).status_code, 400)
+        """Test Views: Cursor pagination rejects ?ordering= and ranked search -> Working"""
+
+    def test_cursor_pagination_skips_count(self):
+        with CaptureQueriesContext(connection) as context:
+            self.count_queries(RequestsView, {'lab_appointment': self.lab.id, 'pagination': 'cursor'})
+
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(' in query['sql']])
+        """Test Views: Cursor pagination issues no count query -> Working"""
+
+    def test_lab_dashboard_max_page_size(self):
+        count, response = self.count_queries(RequestsView, {'lab_appointment': self.lab.id, 'pagination': 'cursor',
+                                                            'page_size': 50})
+        self.assertEqual(len(response.data['results']), 15)
+
+        count, response = self.count_queries(RequestsView, {'lab_appointment': self.lab.id, 'page_size': 50})
+        self.assertEqual(len(response.data['results']), CustomPagination.max_page_size)
+        """Test Views: Lab dashboard page size -> Working"""
+
+
+class WeRecommendTest(QueryCountGuardMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        lab, appointments = create_appointments(3)
+        city = lab.city
+        self.labs = [lab] + [
+            Lab.objects.create(city=city, name=f'TestLab{i}', address='TestAddress', email=f'lab{i}@email.com')
+            for i in range(2)
+        ]
+        patients = [appointment.patient for appointment in appointments]
+
+        for patient, rating in zip(patients, [5, 5, 4]):
+            UserRating.objects.create(user=patient, lab=self.labs[1], rating=rating)
+        for patient, rating in zip(patients, [5, 3]):
+            UserRating.objects.create(user=patient, lab=self.labs[2], rating=rating)
+        UserRating.objects.create(user=patients[0], lab=self.labs[0], rating=UserRating.RATING_NULL)
+
+    def ranked_names(self, params):
+        count, response = self.count_queries(WeRecommendView, params)
+        return [lab['name'] for lab in response.data]
+
+    def test_rankings(self):
+        self.assertEqual(self.ranked_names({}), ['TestLab0', 'TestLab1', 'TestLab'])
+        self.assertEqual(self.ranked_names({'rank_by': 'average'}), ['TestLab0', 'TestLab1', 'TestLab'])
+        self.assertEqual(self.ranked_names({'rank_by': 'volume'}), ['TestLab0', 'TestLab1', 'TestLab'])
+        """Test Views: We recommend rankings -> Working"""
+
+    def test_single_query_and_cache(self):
+        self.assertEqual(self.count_queries(WeRecommendView, {'rank_by': 'volume'})[0], 1)
+        self.assertEqual(self.count_queries(WeRecommendView, {'rank_by': 'volume'})[0], 0)
+        """Test Views: We recommend is one cached query -> Working"""
+
+    def test_cache_invalidated_on_rating(self):
+        self.assertEqual(self.ranked_names({'rank_by': 'volume'})[0], 'TestLab0')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                UserRating.objects.create(user=User.objects.first(), lab=self.labs[2], rating=1)
+            # the ranking is only dropped once the ratings are committed
+            self.assertIsNotNone(cache.get(WE_RECOMMEND_CACHE_KEY.format('volume')))
+
+        self.assertEqual(self.ranked_names({'rank_by': 'volume'})[0], 'TestLab1')
+        """Test Views: We recommend cache invalidation -> Working"""
+
+
+class RatingAddTest(QueryCountGuardMixin, APITestCase):
+
+    def test_rating_updates_summary(self):
+        lab, appointments = create_appointments(2)
+
+        for appointment, rating in zip(appointments, [5, 2]):
+            request = self.factory.post(f'/?pk={lab.id}', {'user': appointment.patient_id, 'rating': rating})
+            response = RatingAddView.as_view()(request)
+            self.assertEqual(response.status_code, 200)
+
+        count, response = self.count_queries(LabView, {'pk': lab.id})
+        self.assertEqual(count, 1)
+        self.assertEqual(response.data['rating_summary']['rating_count'], 2)
+        self.assertEqual(response.data['rating_summary']['average_rating'], 3.5)
+        """Test Views: Rating updates lab rating summary -> Working"""
+
+
+class LabSearchTest(QueryCountGuardMixin, APITestCase):
+
+    def setUp(self):
+        lab, appointments = create_appointments(1)
+        city = lab.city
+        service_type = Type.objects.create(name='Laboratory')
+        thyroid = Service.objects.create(name='Thyroid panel', duration=timedelta(minutes=30), type=service_type)
+
+        self.synevo = Lab.objects.create(city=city, name='Synevo Laboratory', address='Zmaja od Bosne 1',
+                                         email='synevo@email.com')
+        self.medica = Lab.objects.create(city=city, name='Medica Centar', address='Synevo street 2',
+                                         email='medica@email.com')
+        LabService.objects.create(lab_service=self.medica, service=thyroid)
+
+    def search(self, view, text):
+        count, response = self.count_queries(view, {'search': text})
+        return response.data['results']
+
+    def test_ranked_lab_search(self):
+        results = self.search(LabListView, 'synevo')
+        self.assertEqual([lab['name'] for lab in results], ['Synevo Laboratory', 'Medica Centar'])
+        """Test Views: Lab search ranks name matches first -> Working"""
+
+    def test_lab_search_matches_services_and_city(self):
+        self.assertEqual([lab['name'] for lab in self.search(LabListView, 'thyro')], ['Medica Centar'])
+        self.assertEqual(len(self.search(LabListView, 'sarajevo')), 3)
+        """Test Views: Lab search covers services and city -> Working"""
+
+    def test_lab_search_typo(self):
+        self.assertEqual([lab['name'] for lab in self.search(LabListView, 'Synevp Laboratory')],
+                         ['Synevo Laboratory'])
+        """Test Views: Lab search tolerates typos -> Working"""
+
+    def test_search_vector_rebuilt_on_searched_fields_only(self):
+        lab = Lab.objects.defer('search_vector').get(pk=self.medica.pk)
+        with CaptureQueriesContext(connection) as context:
+            lab.phone_number = '033 123 456'
+            lab.save()
+        self.assertFalse([query for query in context.captured_queries if 'search_vector' in query['sql']])
+
+        lab.name = 'Medica Dijagnostika'
+        lab.save()
+        self.assertEqual([lab['name'] for lab in self.search(LabListView, 'dijagnostika')], ['Medica Dijagnostika'])
+        """Test Views: Lab saves rebuild the search vector only for searched fields -> Working"""
+
+    def test_lab_save_keeps_search_vector_current(self):
+        lab = Lab.objects.get(pk=self.synevo.pk)
+        LabService.objects.create(lab_service=self.synevo, service=Service.objects.get(name='Thyroid panel'))
+        lab.save()
+        self.assertEqual([lab['name'] for lab in self.search(LabListView, 'thyro')],
+                         ['Synevo Laboratory', 'Medica Centar'])
+
+        Lab.objects.filter(pk=lab.pk).delete()
+        lab.save()
+        self.assertTrue(Lab.objects.filter(pk=lab.pk).exists())
+        """Test Views: Saving a loaded lab does not write back a stale search vector -> Working"""
+
+    def test_lab_service_search(self):
+        results = self.search(LabServiceListView, 'thyroid')
+        self.assertEqual([row['lab_service']['name'] for row in results], ['Medica Centar'])
+        self.assertNotIn('search_vector', results[0]['lab_service'])
+        """Test Views: Lab service search -> Working"""
+
+
+class ResultAddTest(APITestCase):
+    factory = APIRequestFactory()
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        self.lab, self.appointments = create_appointments(1)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload(self, content, name='result.pdf'):
+        request = self.factory.post(f'/?pk={self.appointments[0].id}',
+                                    {'pdf': SimpleUploadedFile(name, content, 'application/pdf')},
+                                    format='multipart')
+        tracemalloc.start()
+        response = ResultAddView.as_view()(request)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return response, peak
+
+    def test_upload_streams_to_storage(self):
+        content = b'%PDF-1.4\n' + os.urandom(8 * 1024 * 1024)
+        response, peak = self.upload(content)
+
+        self.assertEqual(response.status_code, 200)
+        result = Result.objects.get(appointment=self.appointments[0])
+        self.assertEqual(result.pdf.name, f'cas/{hashlib.sha256(content).hexdigest()[:2]}/'
+                                          f'{hashlib.sha256(content).hexdigest()}.pdf')
+        with result.pdf.open('rb') as pdf:
+            self.assertEqual(pdf.read(), content)
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+        self.assertEqual(OutboxEvent.objects.get().queue, 'results')
+        """Test Views: Result upload streams to storage -> Working"""
+
+    def test_upload_rejects_non_pdf(self):
+        response, peak = self.upload(b'not a pdf', name='result.pdf')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Result.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+        """Test Views: Result upload rejects files that are not PDFs -> Working"""
+
+    def test_upload_with_session_csrf_check(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.appointments[0].patient)
+        token = get_token(RequestFactory().get('/'))
+        client.cookies[settings.CSRF_COOKIE_NAME] = token
+
+        response = client.post(f'/api/v1/add_result?pk={self.appointments[0].id}',
+                               {'pdf': SimpleUploadedFile('result.pdf', b'%PDF-1.4 report', 'application/pdf'),
+                                'csrfmiddlewaretoken': token})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Result.objects.filter(appointment=self.appointments[0]).exists())
+        """Test Views: Result upload works for session users past the CSRF check -> Working"""
+
+
+
+class ResultDownloadTest(APITestCase):
+    factory = APIRequestFactory()
+    content = b'%PDF-1.4\n' + bytes(range(256)) * 64
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root, RESULT_DOWNLOAD_BACKEND='django')
+        self.settings.enable()
+        self.lab, self.appointments = create_appointments(2)
+        self.result = Result(appointment=self.appointments[0])
+        self.result.pdf.save('result.pdf', ContentFile(self.content))
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def download(self, user, **headers):
+        request = self.factory.get(f'/?pk={self.result.id}', **headers)
+        force_authenticate(request, user)
+        return ResultDownloadView.as_view()(request)
+
+    def test_download_ranges(self):
+        patient = self.appointments[0].patient
+        response = self.download(patient)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response = self.download(patient, HTTP_RANGE='bytes=9-18')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 9-18/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[9:19])
+
+        response = self.download(patient, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.download(patient, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        """Test Views: Result download serves byte ranges -> Working"""
+
+    def test_download_conditional_and_access(self):
+        patient = self.appointments[0].patient
+        etag = self.download(patient)['ETag']
+
+        self.assertEqual(self.download(patient, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.download(self.appointments[1].patient).status_code, 403)
+        self.assertIn(self.download(None).status_code, (401, 403))
+
+        with override_settings(RESULT_DOWNLOAD_BACKEND='x-accel'):
+            response = self.download(patient)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/media/{self.result.pdf.name}')
+        self.assertEqual(response.content, b'')
+        """Test Views: Result download checks access and ETag -> Working"""
+
+
+class ConditionalGetTest(APITestCase):
+    factory = APIRequestFactory()
+
+    def setUp(self):
+        self.lab, self.appointments = create_appointments(3)
+        self.patient = self.appointments[0].patient
+
+    def tearDown(self):
+        cache.clear()
+
+    def get(self, view, params, **headers):
+        response = view.as_view()(self.factory.get('/', params, **headers))
+        if response.status_code != 304:
+            response.render()
+        return response
+
+    def test_detail_not_modified(self):
+        response = self.get(LabView, {'pk': self.lab.pk})
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(LabView, {'pk': self.lab.pk}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(LabView, {'pk': self.lab.pk}, HTTP_IF_MODIFIED_SINCE=last_modified).status_code,
+                         304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Lab.objects.get(pk=self.lab.pk).save()
+        response = self.get(LabView, {'pk': self.lab.pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        """Test Views: Detail endpoints answer conditional requests with 304 -> Working"""
+
+    def test_list_not_modified(self):
+        params = {'patient': self.patient.pk}
+        response = self.get(UpcomingAppointmentsUserView, params)
+        etag = response['ETag']
+        self.assertEqual(len(response.data['results']), 1)
+
+        not_modified = self.get(UpcomingAppointmentsUserView, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+        # an edit of an embedded relation and a row leaving the filter both change the ETag
+        self.lab.save()
+        response = self.get(UpcomingAppointmentsUserView, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        Appointment.objects.filter(pk=self.appointments[0].pk).update(status=Appointment.STATUS_CANCELED)
+        response = self.get(UpcomingAppointmentsUserView, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+        """Test Views: List endpoints answer If-None-Match with 304 -> Working"""
+
+
+class NotificationInboxTest(APITestCase):
+    factory = APIRequestFactory()
+
+    def setUp(self):
+        self.lab, self.appointments = create_appointments(2)
+        self.patient, self.other_patient = [appointment.patient for appointment in self.appointments]
+        Notification.objects.bulk_create_unread([
+            Notification(notification_lab=self.lab, notification_user=appointment.patient,
+                         notification_appointment=appointment)
+            for appointment in [self.appointments[0]] * 3 + [self.appointments[1]]
+        ])
+        self.own = list(Notification.objects.filter(notification_user=self.patient).values_list('id', flat=True))
+        self.other = Notification.objects.get(notification_user=self.other_patient).id
+
+    def call(self, view, params=None, data=None, user=None, **initkwargs):
+        if data is None:
+            request = self.factory.get('/', params)
+        else:
+            request = self.factory.post(f'/?{urlencode(params or {})}', data, format='json')
+        force_authenticate(request, user=user or self.patient)
+        response = view.as_view(**initkwargs)(request)
+        response.render()
+        return response
+
+    def test_list_filters_combine(self):
+        Notification.objects.filter(pk=self.own[0]).mark_read()
+
+        response = self.call(NotificationListView, {'notification_user': self.patient.pk, 'is_read': 'false'})
+        self.assertEqual(response.data['count'], 2)
+        response = self.call(NotificationListView, {'notification_lab': self.lab.pk, 'is_read': 'false'})
+        self.assertEqual(response.data['count'], 3)
+        response = self.call(NotificationListView, {'notification_lab': self.lab.pk,
+                                                    'notification_user': self.other_patient.pk})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(self.call(NotificationListView, {'notification_user': 'x'}).status_code, 400)
+        """Test Views: Notification filters combine with the read state -> Working"""
+
+    def test_bulk_read_moves_counters(self):
+        self.assertEqual(self.call(UnreadNotificationsView).data, {'unread': 3})
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.call(NotificationBulkUpdateView, data={'ids': self.own[:2] + [self.other]})
+        updates = [query for query in context.captured_queries
+                   if query['sql'].startswith('UPDATE "bhealthapp_notification"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(response.data, {'updated': 2, 'unread': 1})
+
+        # marking them again leaves the counters alone
+        response = self.call(NotificationBulkUpdateView, data={'ids': self.own})
+        self.assertEqual(response.data, {'updated': 3, 'unread': 0})
+        self.assertEqual(UserNotificationCounter.objects.unread(self.other_patient.pk), 1)
+        self.assertEqual(LabNotificationCounter.objects.unread(self.lab.pk), 1)
+        self.assertFalse(Notification.objects.get(pk=self.other).is_read)
+        """Test Views: Bulk mark-read updates once and keeps the unread counters exact -> Working"""
+
+    def test_bulk_confirm_and_decline(self):
+        confirm = {'changes': {'is_confirmed': True, 'is_declined': False}}
+        decline = {'changes': {'is_confirmed': False, 'is_declined': True}}
+
+        self.call(NotificationBulkUpdateView, data={'ids': self.own[:2]}, **confirm)
+        self.call(NotificationBulkUpdateView, data={'ids': self.own[1:]}, **decline)
+
+        states = dict((pk, state) for pk, *state in Notification.objects.filter(pk__in=self.own).values_list(
+            'id', 'is_confirmed', 'is_declined', 'is_read'))
+        self.assertEqual(states, {self.own[0]: [True, False, True], self.own[1]: [False, True, True],
+                                  self.own[2]: [False, True, True]})
+        self.assertEqual(self.call(NotificationBulkUpdateView, data={'ids': []}).status_code, 400)
+        """Test Views: Bulk confirm and decline set the flags and mark read -> Working"""
+
+    def test_lab_inbox_is_staff_only(self):
+        params = {'lab': self.lab.pk}
+        self.assertEqual(self.call(UnreadNotificationsView, params).status_code, 403)
+        self.assertEqual(self.call(NotificationBulkUpdateView, params, data={'ids': self.own}).status_code, 403)
+
+        self.patient.is_staff = True
+        response = self.call(NotificationBulkUpdateView, params, data={'ids': [self.own[0], self.other]})
+        self.assertEqual(response.data, {'updated': 2, 'unread': 2})
+        self.assertEqual(self.call(UnreadNotificationsView, params).data, {'unread': 2})
+        self.assertEqual(UserNotificationCounter.objects.unread(self.other_patient.pk), 0)
+        """Test Views: Lab inbox needs staff and updates the patients' counters -> Working"""
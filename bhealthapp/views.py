@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 from datetime import datetime
@@ -5,29 +6,38 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 import pika
-from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import AuthenticationForm
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.core.serializers import serialize
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, F, Avg, Count
 from django.shortcuts import render, redirect
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
 from rest_framework import pagination
 from rest_framework import status, filters, serializers, fields
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import (
     CreateAPIView, GenericAPIView, DestroyAPIView, ListAPIView, get_object_or_404
 )
-from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
-from .models import Lab, LabService, Result, Appointment, User, UserRating, Notification
+from src.files.views import HashingUploadMixin
+
+from .models import Lab, LabService, Result, Appointment, User, UserRating, Notification, LabRatingSummary, \
+    OutboxEvent, Service, UserNotificationCounter, LabNotificationCounter
 from .serializers import LabSerializer, LabServiceViewSerializer, UserRatingViewSerializer, ResultViewSerializer, \
     PatientSerializer, PatientViewSerializer, LabViewSerializer, \
     AppointmentViewSerializer, PatientLoginSerializer, UserRatingSerializer, ResultSerializer, AppointmentSerializer, \
-    NotificationViewSerializer
-from .tasks import upload_pdf, send_request_notification, request_updated
+    NotificationViewSerializer, AppointmentBookingSerializer, NotificationBulkUpdateSerializer
+from .detail_cache import detail_cache, WE_RECOMMEND_CACHE_KEY, WE_RECOMMEND_CACHE_TIMEOUT, WE_RECOMMEND_RANKINGS
+from .downloads import serve_file
+from .slots import SlotUnavailable, available_slots, book_appointment
 
 logger = logging.getLogger()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(levelname)s: %(message)s')
@@ -41,6 +51,107 @@ class CustomPagination(pagination.PageNumberPagination):
     max_page_size = 12
 
 
+class CustomCursorPagination(pagination.CursorPagination):
+    page_size = 4
+    page_size_query_param = 'page_size'
+    max_page_size = 12
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Pages on the view ordering with the unique id as the last key, so rows sharing a
+        date are neither skipped nor repeated across pages. ?ordering= and the relevance
+        order of ?search= are not stable keys and are rejected, use page pagination for them.
+        """
+        if request.query_params.get('ordering'):
+            raise serializers.ValidationError({'ordering': 'Not supported with cursor pagination.'})
+        if request.query_params.get('search') and SearchRankOrderingFilter in view.filter_backends:
+            raise serializers.ValidationError({'search': 'Not supported with cursor pagination.'})
+
+        ordering = list(getattr(view, 'ordering', None) or [self.ordering])
+        if ordering[-1].lstrip('-') != 'id':
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        return tuple(ordering)
+
+
+class LabDashboardCursorPagination(CustomCursorPagination):
+    max_page_size = 100
+
+
+class SearchRankOrderingFilter(filters.OrderingFilter):
+    """
+    Keeps the relevance ordering of ?search= results unless ?ordering= is given explicitly.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if request.query_params.get('search') and not request.query_params.get(self.ordering_param):
+            return queryset
+        return super().filter_queryset(request, queryset, view)
+
+
+class CursorPaginationMixin:
+    """
+    Opt-in keyset pagination: ?pagination=cursor swaps the page-number paginator for a
+    cursor one, which pages on the view ordering and issues neither OFFSET nor COUNT(*).
+    """
+    cursor_pagination_class = CustomCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.request.query_params.get('pagination') == 'cursor':
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+
+def conditional_etag(request, *parts):
+    # the renderer is part of the validator, the browsable API and JSON are different representations
+    return quote_etag('-'.join(str(part) for part in (request.accepted_renderer.format, *parts)))
+
+
+def timestamp_token(moment):
+    return f'{int(moment.timestamp() * 1000000):x}' if moment is not None else '0'
+
+
+def resolve(instance, path):
+    for name in path.split('__'):
+        instance = getattr(instance, name, None)
+        if instance is None:
+            return None
+    return instance
+
+
+class ConditionalListMixin:
+    """
+    Answers If-None-Match on list endpoints with 304 before the page is serialized. The
+    ETag is a digest of the pagination links and, per row, the id and the `modified_fields`,
+    the updated_at columns the rendered row depends on (loaded by the view's
+    select_related). Lists send no Last-Modified, deleting a row would not move it.
+    """
+    modified_fields = ('updated_at',)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+
+        links = {} if page is None else self.get_paginated_response([]).data
+        validators = (
+            [(key, value) for key, value in links.items() if key != 'results'],
+            [(row.pk, *(resolve(row, field) for field in self.modified_fields)) for row in rows],
+        )
+        etag = conditional_etag(request, hashlib.sha1(repr(validators).encode()).hexdigest())
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        serializer = self.get_serializer(rows, many=True)
+        response = Response(serializer.data) if page is None else self.get_paginated_response(serializer.data)
+        response['ETag'] = etag
+        return response
+
+
 class ValidateQueryParams(serializers.Serializer):
     search = fields.RegexField(
         "^[\u0621-\u064A\u0660-\u0669 a-zA-Z0-9]{3,30}$", required=False
@@ -61,6 +172,83 @@ class ValidateQueryParams(serializers.Serializer):
     pk = fields.RegexField("^[\u0621-\u064A\u0660-\u0669 0-9]{3,30}$", required=False)
     day = fields.IntegerField(min_value=1, max_value=30, required=False)
     year = fields.IntegerField(min_value=1990, max_value=today.year, required=False)
+    pagination = fields.ChoiceField(choices=['page', 'cursor'], required=False)
+
+
+class ValidateAppointmentQueryParams(serializers.Serializer):
+    patient = fields.IntegerField(min_value=1, required=False)
+    lab = fields.IntegerField(min_value=1, required=False)
+    lab_appointment = fields.IntegerField(min_value=1, required=False)
+    today = fields.BooleanField(required=False)
+    pagination = fields.ChoiceField(choices=['page', 'cursor'], required=False)
+
+
+class ValidateSlotQueryParams(serializers.Serializer):
+    lab = fields.IntegerField(min_value=1)
+    service = fields.IntegerField(min_value=1)
+    start = fields.DateField()
+    end = fields.DateField()
+
+    def validate(self, attrs):
+        if not 0 <= (attrs['end'] - attrs['start']).days < settings.APPOINTMENT_BOOKING_MAX_DAYS:
+            raise serializers.ValidationError(
+                f'end must be on or after start and at most {settings.APPOINTMENT_BOOKING_MAX_DAYS} days later.')
+        return attrs
+
+
+class ValidateRecommendQueryParams(serializers.Serializer):
+    rank_by = fields.ChoiceField(choices=WE_RECOMMEND_RANKINGS, required=False)
+
+
+class ValidateNotificationQueryParams(serializers.Serializer):
+    notification_lab = fields.IntegerField(min_value=1, required=False)
+    notification_user = fields.IntegerField(min_value=1, required=False)
+    notification_appointment = fields.IntegerField(min_value=1, required=False)
+    is_read = fields.BooleanField(required=False, allow_null=True, default=None)
+    pagination = fields.ChoiceField(choices=['page', 'cursor'], required=False)
+
+
+class ValidateNotificationRecipientParams(serializers.Serializer):
+    lab = fields.IntegerField(min_value=1, required=False)
+
+
+class CachedDetailMixin:
+    """
+    GET ?pk= detail endpoint served through detail_cache. Subclasses set model,
+    serializer_class (registered in detail_cache) and missing_message and implement load(pk).
+    last_modified(instance) is the latest updated_at the payload depends on, the ETag and
+    Last-Modified built from it are kept in the cache entry, so a 304 costs no query on a hit.
+    """
+    model = None
+    missing_message = None
+
+    def load(self, pk):
+        raise NotImplementedError
+
+    def last_modified(self, instance):
+        return instance.updated_at
+
+    def get(self, request):
+        param = self.request.query_params.get('pk', default=None)
+        if param is None:
+            return Response('Please add primary key.')
+
+        try:
+            data, modified, hit = detail_cache.get_or_load(self.model, param, self.serializer_class, self.load,
+                                                           self.last_modified)
+        except (self.model.DoesNotExist, ValidationError):
+            return Response({'Failure': self.missing_message}, status.HTTP_404_NOT_FOUND)
+
+        etag = conditional_etag(request, getattr(self.serializer_class, 'cache_version', 1), timestamp_token(modified))
+        headers = {'X-Cache': 'HIT' if hit else 'MISS', 'ETag': etag, 'Last-Modified': http_date(modified.timestamp())}
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=int(modified.timestamp()))
+        if not_modified is not None:
+            for header, value in headers.items():
+                not_modified[header] = value
+            return not_modified
+
+        return Response(data, content_type="application/json", headers=headers)
 
 
 class UserCreate(GenericAPIView):
@@ -97,18 +285,40 @@ class LabCreate(GenericAPIView):
 
 class AddAppointmentView(CreateAPIView):
     permission_classes = [AllowAny]
-    serializer_class = AppointmentSerializer
+    serializer_class = AppointmentBookingSerializer
 
     def create(self, request, **kwargs):
-        data = request.data.copy()
-        data['status'] = Appointment.STATUS_PENDING
-        serializer = AppointmentSerializer(data=request.data)
+        serializer = AppointmentBookingSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
 
-        send_request_notification.delay(appointment.id)
+        try:
+            with transaction.atomic():
+                appointment = book_appointment(**serializer.validated_data)
+                OutboxEvent.objects.enqueue_appointment_request(appointment)
+        except SlotUnavailable as error:
+            return Response({'Failure': str(error)}, status.HTTP_409_CONFLICT)
 
-        return Response(serializer.data, content_type="application/json")
+        return Response(AppointmentSerializer(appointment).data, content_type="application/json")
+
+
+class AvailableSlotsView(GenericAPIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        params = ValidateSlotQueryParams(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        lab, service = params.validated_data['lab'], params.validated_data['service']
+
+        try:
+            service = Service.objects.get(pk=service, service_name__lab_service=lab)
+        except Service.DoesNotExist:
+            return Response({'Failure': 'The lab does not offer this service.'}, status.HTTP_404_NOT_FOUND)
+
+        slots = available_slots(lab, service, params.validated_data['start'], params.validated_data['end'])
+        format_date = fields.DateTimeField().to_representation
+
+        return Response({str(day): [format_date(slot) for slot in day_slots] for day, day_slots in slots.items()},
+                        content_type="application/json")
 
 
 class UserLogin(GenericAPIView):
@@ -154,35 +364,87 @@ class UserUpdateView(GenericAPIView):
         return Response(serializer.validated_data, status.HTTP_202_ACCEPTED)
 
 
-class NotificationListView(ListAPIView):
+class NotificationListView(ConditionalListMixin, CursorPaginationMixin, ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = NotificationViewSerializer
+    modified_fields = ('updated_at', 'notification_lab__updated_at', 'notification_user__updated_at',
+                       'notification_appointment__updated_at')
     ordering = ['-id']
     pagination_class = CustomPagination
     search_fields = ['notification_lab', 'notification_user', 'notification_appointment']
     filter_backends = (filters.SearchFilter, filters.OrderingFilter)
 
     def get_queryset(self, *args, **kwargs):
-        param = self.request.query_params
+        query_params = ValidateNotificationQueryParams(data=self.request.query_params)
+        query_params.is_valid(raise_exception=True)
+        param = query_params.validated_data
 
-        query_params = ValidateQueryParams(data=param)
+        queryset = Notification.objects.select_related(
+            'notification_lab', 'notification_user', 'notification_appointment')
+
+        # the filters combine, ?is_read=false with a lab or user reads the unread partial indexes
+        for field in ('notification_lab', 'notification_user', 'notification_appointment', 'is_read'):
+            if param.get(field) is not None:
+                queryset = queryset.filter(**{field: param[field]})
+
+        return queryset
+
+
+class NotificationRecipientMixin:
+    """
+    Resolves whose notifications a request acts on: the caller's own, or with ?lab= the
+    lab's, which only staff may. Returns the counter model and the recipient id, or None.
+    """
+
+    def get_recipient(self):
+        query_params = ValidateNotificationRecipientParams(data=self.request.query_params)
         query_params.is_valid(raise_exception=True)
+        lab = query_params.validated_data.get('lab')
 
-        queryset = Notification.objects.all().order_by('id')
+        if lab is None:
+            return UserNotificationCounter, self.request.user.id
+        if not self.request.user.is_staff:
+            return None
+        return LabNotificationCounter, lab
 
-        if param.get('notification_lab') is not None:
-            query_set = queryset.filter(notification_lab=param.get('notification_lab'))
 
-        elif param.get('notification_user') is not None:
-            query_set = queryset.filter(notification_user=param.get('notification_user'))
+class UnreadNotificationsView(NotificationRecipientMixin, GenericAPIView):
+    permission_classes = [IsAuthenticated]
 
-        elif param.get('notification_appointment') is not None:
-            query_set = queryset.filter(notification_appointment=param.get('notification_appointment'))
+    def get(self, request):
+        recipient = self.get_recipient()
+        if recipient is None:
+            return Response({'Failure': 'Only staff can read lab notifications.'}, status.HTTP_403_FORBIDDEN)
 
-        else:
-            query_set = queryset
+        counter, pk = recipient
+        return Response({'unread': counter.objects.unread(pk)})
 
-        return query_set
+
+class NotificationBulkUpdateView(NotificationRecipientMixin, GenericAPIView):
+    """
+    Marks the notifications listed in `ids` read and applies `changes` to them with one
+    UPDATE. Ids of other recipients' notifications are skipped.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = NotificationBulkUpdateSerializer
+    changes = {}
+
+    def post(self, request):
+        recipient = self.get_recipient()
+        if recipient is None:
+            return Response({'Failure': 'Only staff can update lab notifications.'}, status.HTTP_403_FORBIDDEN)
+
+        serializer = NotificationBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        counter, pk = recipient
+        with transaction.atomic():
+            updated = Notification.objects.filter(
+                pk__in=serializer.validated_data['ids'], **{counter.recipient_field: pk},
+            ).mark_read(**self.changes)
+            unread = counter.objects.unread(pk)
+
+        return Response({'updated': updated, 'unread': unread}, status.HTTP_202_ACCEPTED)
 
 
 class LabUpdateView(GenericAPIView):
@@ -199,7 +461,9 @@ class LabUpdateView(GenericAPIView):
             return Response({'Failure': 'Lab does not exist.'},
                             status.HTTP_404_NOT_FOUND)
 
-        serializer = LabSerializer(instance=get_object_or_404(Lab, pk=param), data=request.data)
+        # search_vector is rebuilt from the saved fields, writing back the loaded copy could undo a newer rebuild
+        lab = get_object_or_404(Lab.objects.defer('search_vector'), pk=param)
+        serializer = LabSerializer(instance=lab, data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
 
@@ -207,13 +471,13 @@ class LabUpdateView(GenericAPIView):
                         status=status.HTTP_202_ACCEPTED)
 
 
-class LabListView(ListAPIView):
+class LabListView(ConditionalListMixin, CursorPaginationMixin, ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = LabViewSerializer
+    modified_fields = ('updated_at', 'rating_summary__last_updated')
     ordering = ['-id']
     pagination_class = CustomPagination
-    search_fields = ['name', 'city', 'address']
-    filter_backends = (filters.SearchFilter, filters.OrderingFilter)
+    filter_backends = (SearchRankOrderingFilter,)
 
     def get_queryset(self, *args, **kwargs):
         param = self.request.query_params
@@ -221,12 +485,10 @@ class LabListView(ListAPIView):
         query_params = ValidateQueryParams(data=param)
         query_params.is_valid(raise_exception=True)
 
-        queryset = Lab.objects.all().order_by('id')
+        queryset = Lab.objects.select_related('city', 'rating_summary').order_by('id')
 
         if param.get('search') is not None:
-
-            search = param.get('search')
-            query_set = queryset.filter(Q(lab__name__contains=search) | Q(service__name__contains=search))
+            query_set = queryset.search(param.get('search'))
 
         elif param.get('city') is not None:
             query_set = queryset.filter(city=param.get('city'))
@@ -243,32 +505,26 @@ class LabListView(ListAPIView):
         return query_set
 
 
-class LabView(GenericAPIView):
+class LabView(CachedDetailMixin, GenericAPIView):
     permission_classes = [AllowAny]
     serializer_class = LabViewSerializer
+    model = Lab
+    missing_message = 'Lab does not exist.'
 
-    def get(self, request):
-        try:
-            param = self.request.query_params.get('pk', default=None)
-            if param is None:
-                return Response('Please add primary key.')
-            lab = Lab.objects.get(pk=param)
-        except Lab.DoesNotExist:
-            return Response({'Failure': 'Lab does not exist.'}, status.HTTP_404_NOT_FOUND)
-
-        serializer = LabViewSerializer(lab)
-        data = serializer.data
+    def load(self, pk):
+        return Lab.objects.select_related('city', 'rating_summary').get(pk=pk)
 
-        return Response(data, content_type="application/json")
+    def last_modified(self, instance):
+        summary = getattr(instance, 'rating_summary', None)
+        return max(instance.updated_at, summary.last_updated) if summary else instance.updated_at
 
 
-class LabServiceListView(ListAPIView):
+class LabServiceListView(CursorPaginationMixin, ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = LabServiceViewSerializer
     ordering = ['-id']
     pagination_class = CustomPagination
-    search_fields = ['lab__name', 'city', 'service']
-    filter_backends = (filters.SearchFilter, filters.OrderingFilter)
+    filter_backends = (SearchRankOrderingFilter,)
 
     def get_queryset(self, *args, **kwargs):
         param = self.request.query_params
@@ -276,12 +532,10 @@ class LabServiceListView(ListAPIView):
         query_params = ValidateQueryParams(data=param)
         query_params.is_valid(raise_exception=True)
 
-        queryset = LabService.objects.all().order_by('id')
+        queryset = LabService.objects.select_related('lab_service', 'service').order_by('id')
 
         if param.get('search') is not None:
-
-            search = param.get('search')
-            query_set = queryset.filter(Q(lab__name__contains=search) | Q(service__name__contains=search))
+            query_set = queryset.search(param.get('search'))
 
         elif param.get('city') is not None:
             query_set = queryset.filter(lab_service__city=param.get('city'))
@@ -358,7 +612,7 @@ class LabRemoveView(DestroyAPIView):
         )
 
 
-class ResultListView(ListAPIView):
+class ResultListView(CursorPaginationMixin, ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = ResultViewSerializer
     ordering = ['-id']
@@ -387,184 +641,128 @@ class ResultListView(ListAPIView):
         return query_set
 
 
-class ResultView(GenericAPIView):
+class ResultView(CachedDetailMixin, GenericAPIView):
     permission_classes = [AllowAny]
     serializer_class = ResultViewSerializer
+    model = Result
+    missing_message = 'Result does not exist.'
 
-    def get(self, request):
-        try:
-            param = self.request.query_params.get('pk', default=None)
-            if param is None:
-                return Response('Please add primary key.')
-            result = Result.objects.get(pk=param)
-        except Result.DoesNotExist:
-            return Response({'Failure': 'Result does not exist.'}, status.HTTP_404_NOT_FOUND)
-
-        serializer = ResultViewSerializer(result)
-        data = serializer.data
+    def load(self, pk):
+        return Result.objects.select_related('appointment').get(pk=pk)
 
-        return Response(data, content_type="application/json")
+    def last_modified(self, instance):
+        return max(instance.updated_at, instance.appointment.updated_at)
     # add options for patient id search
     # add to get per appointment id
 
 
-class AppointmentView(GenericAPIView):
-    permission_classes = [AllowAny]
-    serializer_class = AppointmentViewSerializer
+class ResultDownloadView(GenericAPIView):
+    permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        param = self.request.query_params.get('pk', default=None)
+        if param is None:
+            return Response('Please add primary key.')
         try:
-            param = self.request.query_params.get('pk', default=None)
-            if param is None:
-                return Response('Please add primary key.')
-            appointment = Appointment.objects.get(pk=param)
-        except Appointment.DoesNotExist:
-            return Response({'Failure': 'Appointment does not exist.'}, status.HTTP_404_NOT_FOUND)
+            result = Result.objects.select_related('appointment').get(pk=param)
+        except (Result.DoesNotExist, ValueError):
+            return Response({'Failure': 'Result does not exist.'}, status.HTTP_404_NOT_FOUND)
 
-        serializer = AppointmentViewSerializer(appointment)
-        data = serializer.data
+        if result.appointment.patient_id != request.user.id and not request.user.is_staff:
+            return Response({'Failure': 'Result belongs to another patient.'}, status.HTTP_403_FORBIDDEN)
+        if not result.pdf.storage.exists(result.pdf.name):
+            return Response({'Failure': 'Result file is missing.'}, status.HTTP_404_NOT_FOUND)
 
-        return Response(data, content_type="application/json")
+        return serve_file(request, result.pdf)
 
 
-class UpcomingAppointmentsUserView(ListAPIView):
+class AppointmentView(CachedDetailMixin, GenericAPIView):
     permission_classes = [AllowAny]
     serializer_class = AppointmentViewSerializer
-    ordering = ['-id']
-    pagination_class = CustomPagination
-    filter_backends = (filters.SearchFilter, filters.OrderingFilter)
+    model = Appointment
+    missing_message = 'Appointment does not exist.'
 
-    def get_queryset(self, *args, **kwargs):
-        param = self.request.query_params
+    def load(self, pk):
+        return Appointment.objects.with_related().get(pk=pk)
 
-        query_params = ValidateQueryParams(data=param)
-        query_params.is_valid(raise_exception=True)
-
-        if param.get('patient') is not None:
+    def last_modified(self, instance):
+        return max(instance.updated_at, instance.lab_appointment.updated_at, instance.patient.updated_at)
 
-            patient = param.get('patient')
-            date_from = today
-            date_to = today + relativedelta(years=5)
-            query_set = Appointment.objects.filter(patient=patient, datetime__gte=date_from, datetime__lte=date_to,
-                                                   status=1)
 
-        else:
-            query_set = Appointment.objects.none()
-
-        return query_set
-
-
-class PastAppointmentsUserView(ListAPIView):
+class AppointmentListView(ConditionalListMixin, CursorPaginationMixin, ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = AppointmentViewSerializer
-    ordering = ['-id']
+    modified_fields = ('updated_at', 'lab_appointment__updated_at', 'patient__updated_at')
+    ordering = ['-date', '-id']
     pagination_class = CustomPagination
     filter_backends = (filters.SearchFilter, filters.OrderingFilter)
 
     def get_queryset(self, *args, **kwargs):
-        param = self.request.query_params
-
-        query_params = ValidateQueryParams(data=param)
+        query_params = ValidateAppointmentQueryParams(data=self.request.query_params)
         query_params.is_valid(raise_exception=True)
 
-        if param.get('patient') is not None:
-
-            patient = param.get('patient')
-            date_from = today - relativedelta(years=5)
-            date_to = today
-            query_set = Appointment.objects.filter(patient=patient, datetime__gte=date_from, datetime__lte=date_to,
-                                                   status=1)
+        return self.filter_appointments(Appointment.objects.with_related(), query_params.validated_data)
 
-        else:
-            query_set = Appointment.objects.none()
+    def filter_appointments(self, queryset, param):
+        raise NotImplementedError
 
-        return query_set
-
-
-class UpcomingAppointmentsLabView(ListAPIView):
-    permission_classes = [AllowAny]
-    serializer_class = AppointmentViewSerializer
-    ordering = ['-id']
-    pagination_class = CustomPagination
-    filter_backends = (filters.SearchFilter, filters.OrderingFilter)
-
-    def get_queryset(self, *args, **kwargs):
-        param = self.request.query_params
-
-        query_params = ValidateQueryParams(data=param)
-        query_params.is_valid(raise_exception=True)
 
-        if param.get('lab') is not None:
+class UpcomingAppointmentsUserView(AppointmentListView):
 
-            lab = param.get('lab')
-            date_from = today
-            date_to = today + relativedelta(years=5)
-            query_set = Appointment.objects.filter(lab_appointment=lab, datetime__gte=date_from,
-                                                   datetime__lte=date_to, status=1)
-            if param.get('today') is True:
-                query_set = Appointment.objects.filter(lab_appointment=lab, datetime__gte=today,
-                                                       datetime__lte=today, status=1)
+    def filter_appointments(self, queryset, param):
+        if param.get('patient') is None:
+            return queryset.none()
 
-        else:
-            query_set = Appointment.objects.none()
+        return queryset.upcoming().filter(patient=param['patient'], status=Appointment.STATUS_CONFIRMED)
 
-        return query_set
 
+class PastAppointmentsUserView(AppointmentListView):
 
-class PastAppointmentsLabView(ListAPIView):
-    permission_classes = [AllowAny]
-    serializer_class = AppointmentViewSerializer
-    ordering = ['-id']
-    pagination_class = CustomPagination
-    filter_backends = (filters.SearchFilter, filters.OrderingFilter)
+    def filter_appointments(self, queryset, param):
+        if param.get('patient') is None:
+            return queryset.none()
 
-    def get_queryset(self, *args, **kwargs):
-        param = self.request.query_params
+        return queryset.past().filter(patient=param['patient'], status=Appointment.STATUS_CONFIRMED)
 
-        query_params = ValidateQueryParams(data=param)
-        query_params.is_valid(raise_exception=True)
 
-        if param.get('lab') is not None:
+class UpcomingAppointmentsLabView(AppointmentListView):
+    cursor_pagination_class = LabDashboardCursorPagination
 
-            lab = param.get('lab')
-            date_from = today - relativedelta(years=5)
-            date_to = today
-            query_set = Appointment.objects.filter(lab_appointment=lab, datetime__gte=date_from, datetime__lte=date_to,
-                                                   status=1)
+    def filter_appointments(self, queryset, param):
+        if param.get('lab') is None:
+            return queryset.none()
 
+        if param.get('today'):
+            queryset = queryset.on_day()
         else:
-            query_set = Appointment.objects.none()
+            queryset = queryset.upcoming()
 
-        return query_set
+        return queryset.filter(lab_appointment=param['lab'], status=Appointment.STATUS_CONFIRMED)
 
 
-class RequestsView(ListAPIView):
-    permission_classes = [AllowAny]
-    serializer_class = AppointmentViewSerializer
-    ordering = ['-id']
-    pagination_class = CustomPagination
-    filter_backends = (filters.SearchFilter, filters.OrderingFilter)
+class PastAppointmentsLabView(AppointmentListView):
+    cursor_pagination_class = LabDashboardCursorPagination
 
-    def get_queryset(self, *args, **kwargs):
-        param = self.request.query_params
+    def filter_appointments(self, queryset, param):
+        if param.get('lab') is None:
+            return queryset.none()
 
-        query_params = ValidateQueryParams(data=param)
-        query_params.is_valid(raise_exception=True)
+        return queryset.past().filter(lab_appointment=param['lab'], status=Appointment.STATUS_CONFIRMED)
 
-        if param.get('lab_appointment') is not None:
 
-            lab = param.get('lab_appointment')
-
-            query_set = Appointment.objects.filter(lab_appointment=lab, status=0)
+class RequestsView(AppointmentListView):
+    cursor_pagination_class = LabDashboardCursorPagination
+    # pending requests may have no date yet, a cursor can not be keyed on NULL
+    ordering = ['-id']
 
+    def filter_appointments(self, queryset, param):
+        if param.get('lab_appointment') is None:
+            return queryset.none()
 
-        else:
-            query_set = Appointment.objects.none()
+        return queryset.filter(lab_appointment=param['lab_appointment'], status=Appointment.STATUS_PENDING)
 
-        return query_set
 
-
-class PatientsView(ListAPIView):
+class PatientsView(CursorPaginationMixin, ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = PatientViewSerializer
     ordering = ['-id']
@@ -596,34 +794,44 @@ class WeRecommendView(ListAPIView):
     pagination_class = CustomPagination
     filter_backends = (filters.SearchFilter, filters.OrderingFilter)
 
-    def get(self, *args, **kwargs):
-        labs = Lab.objects.all()
-        my_dict = {}
-
-        for lab in labs:
-            my_dict[lab.name] = UserRating.objects.filter(rating=5, lab=lab).count()
+    top_labs_count = 6
+    rankings = {
+        'five_stars': (F('five_star_count').desc(), F('average_rating').desc(nulls_last=True), 'id'),
+        'average': (F('average_rating').desc(nulls_last=True), F('rating_count').desc(), 'id'),
+        'volume': (F('rating_count').desc(), F('average_rating').desc(nulls_last=True), 'id'),
+    }
 
-        top_6_labs = sorted(my_dict.items(), key=lambda x: x[1])[:6]
-        return Response(top_6_labs, content_type="application/json")
+    def get(self, *args, **kwargs):
+        query_params = ValidateRecommendQueryParams(data=self.request.query_params)
+        query_params.is_valid(raise_exception=True)
+        rank_by = query_params.validated_data.get('rank_by', 'five_stars')
+
+        top_labs = cache.get_or_set(WE_RECOMMEND_CACHE_KEY.format(rank_by), lambda: self.rank_labs(rank_by),
+                                    WE_RECOMMEND_CACHE_TIMEOUT)
+        return Response(top_labs, content_type="application/json")
+
+    def rank_labs(self, rank_by):
+        rated = Q(lab_rating__rating__gt=UserRating.RATING_NULL)
+
+        return list(
+            Lab.objects.annotate(
+                rating_count=Count('lab_rating', filter=rated),
+                five_star_count=Count('lab_rating', filter=Q(lab_rating__rating=UserRating.RATING_FIVE)),
+                average_rating=Avg('lab_rating__rating', filter=rated),
+            ).order_by(*self.rankings[rank_by]).values(
+                'id', 'name', 'average_rating', 'five_star_count', 'rating_count'
+            )[:self.top_labs_count]
+        )
 
 
-class ProfileView(GenericAPIView):
+class ProfileView(CachedDetailMixin, GenericAPIView):
     permission_classes = [AllowAny]
     serializer_class = PatientViewSerializer
+    model = User
+    missing_message = 'User does not exist.'
 
-    def get(self, request):
-        try:
-            param = self.request.query_params.get('pk', default=None)
-            if param is None:
-                return Response('Please add primary key.')
-            user = User.objects.get(pk=param)
-        except User.DoesNotExist:
-            return Response({'Failure': 'User does not exist.'}, status.HTTP_404_NOT_FOUND)
-
-        serializer = PatientViewSerializer(user)
-        data = serializer.data
-
-        return Response(data, content_type="application/json")
+    def load(self, pk):
+        return User.objects.get(pk=pk)
 
 
 class RatingAddView(CreateAPIView):
@@ -644,16 +852,15 @@ class RatingAddView(CreateAPIView):
 
         serializer = UserRatingSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
 
-        rating = UserRating.objects.last()
-        rating.lab = lab
-        rating.save(update_fields=['lab'])
+        with transaction.atomic():
+            rating = serializer.save(lab=lab)
+            LabRatingSummary.objects.record_rating(lab, rating.rating)
 
         return Response(serializer.data, content_type="application/json")
 
 
-class ResultAddView(CreateAPIView):
+class ResultAddView(HashingUploadMixin, CreateAPIView):
     permission_classes = [AllowAny]
     serializer_class = ResultSerializer
 
@@ -665,11 +872,18 @@ class ResultAddView(CreateAPIView):
 
             app = Appointment.objects.get(pk=param)
 
-        except Appointment.DoesNotExist:
+        except (Appointment.DoesNotExist, ValueError):
             return Response({'Failure': 'Appointment you are trying to add result for does not exist.'},
                             status.HTTP_404_NOT_FOUND)
 
-        upload_pdf.delay(param, request.data)
+        serializer = ResultSerializer(data={'appointment': app.id, 'pdf': request.data.get('pdf')})
+        serializer.is_valid(raise_exception=True)
+
+        # The storage backend copies the file in chunks, the event is stored with the Result and
+        # published to RabbitMQ by the outbox relay.
+        with transaction.atomic():
+            result = serializer.save()
+            OutboxEvent.objects.enqueue_result_created(result)
 
         return Response("Result added successfully.")
 
@@ -695,7 +909,8 @@ class AppointmentUpdateView(GenericAPIView):
         else:
             serializer = AppointmentSerializer(instance=appointment, data=request.data)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
 
             return Response(data=serializer.validated_data, content_type="application/json",
                             status=status.HTTP_202_ACCEPTED)
@@ -704,4 +919,5 @@ class AppointmentUpdateView(GenericAPIView):
 @receiver(post_save, sender=Appointment)
 def appointment_saved(sender, instance, created, **kwargs):
     if instance.date is not None:
-        request_updated.delay(instance.id)
+        OutboxEvent.objects.enqueue_appointment_update(instance)
+
@@ -3,6 +3,7 @@
 set -e
 
 ./manage.py migrate
+./manage.py update_lab_search_vectors
 ./manage.py collectstatic --noinput
 
 exec tail -f /dev/null
@@ -0,0 +1,5 @@
+#!/bin/sh
+
+set -e
+
+exec ./manage.py relay_outbox
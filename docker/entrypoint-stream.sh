@@ -0,0 +1,5 @@
+#!/bin/sh
+
+set -e
+
+exec uvicorn src.asgi:application --host 0.0.0.0 --port 8000 --workers 2 --no-access-log
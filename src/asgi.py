@@ -0,0 +1,24 @@
+"""
+ASGI config, serving the notification stream next to the Django application.
+Run with: uvicorn src.asgi:application
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "src.config.local")
+
+django_application = get_asgi_application()
+
+from bhealthapp.notification_stream import notification_stream  # noqa: E402, needs the apps loaded
+
+NOTIFICATION_STREAM_PATH = '/api/v1/notification_stream'
+
+
+async def application(scope, receive, send):
+    # Django 3.2 can not stream asynchronously, the Server-Sent Events are sent by a plain ASGI app
+    if scope['type'] == 'http' and scope['path'].rstrip('/') == NOTIFICATION_STREAM_PATH:
+        await notification_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
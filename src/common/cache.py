@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+# One local layer per process and configuration, shared by the threads of a process like
+# LocMemCache's _caches. Keyed by pid as well, so a forked worker starts its own listener.
+_layers = {}
+_layers_lock = threading.Lock()
+
+
+class LocalLRU:
+    """
+    Bounded in-memory LRU of pickled values. `generation` moves on every invalidation, a value
+    read from Redis is only kept if no invalidation arrived while it was being fetched.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return MISSING
+            expires, value = item
+            if expires < time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key, value, generation):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def evict(self, keys):
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+
+class LocalLayer:
+    """
+    The LocalLRU of a process together with the thread listening for invalidations on the
+    Redis channel. The LRU is only used while the subscription is confirmed, after a
+    disconnect it is cleared and bypassed until the listener has subscribed again.
+    """
+
+    def __init__(self, remote_alias, channel, max_entries, timeout):
+        self.remote_alias = remote_alias
+        self.channel = channel
+        self.lru = LocalLRU(max_entries, timeout)
+        self.origin = uuid.uuid4().hex
+        self.listening = False
+        self.thread = threading.Thread(target=self.listen, name=f'cache-invalidation-{channel}', daemon=True)
+        self.thread.start()
+
+    def redis(self):
+        return caches[self.remote_alias].client.get_client(write=True)
+
+    def publish(self, keys):
+        self.redis().publish(self.channel, json.dumps({'origin': self.origin, 'keys': keys}))
+
+    def listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis().pubsub()
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        # anything cached before now may have missed its invalidation
+                        self.lru.clear()
+                        self.listening = True
+                    elif message['type'] == 'message':
+                        self.receive(json.loads(message['data']))
+            except Exception:
+                logger.warning('Cache invalidation listener on %s disconnected', self.channel, exc_info=True)
+            finally:
+                self.listening = False
+                self.lru.clear()
+                if pubsub is not None:
+                    pubsub.close()
+            time.sleep(1)
+
+    def receive(self, message):
+        if message['origin'] == self.origin:
+            return
+        if message['keys'] is None:
+            self.lru.clear()
+        else:
+            self.lru.evict(message['keys'])
+
+
+class LayeredCache(BaseCache):
+    """
+    Keeps recently read values in a per-process LRU in front of a shared django-redis cache.
+
+    Reads try the LRU first. Every write goes to Redis, drops the key locally and is
+    published on CHANNEL, so the other processes drop their copies as soon as the message
+    arrives. Local copies also expire after LOCAL_TIMEOUT seconds, which bounds how long a
+    value that expired or was evicted in Redis is still served.
+
+    OPTIONS:
+        REMOTE: alias of the django-redis cache holding the values
+        CHANNEL: pub/sub channel for invalidations
+        MAX_ENTRIES: size of the LRU of each process
+        LOCAL_TIMEOUT: seconds a value is kept locally
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.remote_alias = options.get('REMOTE', 'redis')
+        self.channel = options.get('CHANNEL', 'cache-invalidation')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+
+    @property
+    def remote(self):
+        return caches[self.remote_alias]
+
+    @property
+    def layer(self):
+        key = (os.getpid(), self.remote_alias, self.channel)
+        layer = _layers.get(key)
+        if layer is None:
+            with _layers_lock:
+                layer = _layers.get(key)
+                if layer is None:
+                    layer = _layers[key] = LocalLayer(self.remote_alias, self.channel, self._max_entries, self.local_timeout)
+        return layer
+
+    def invalidate(self, keys):
+        self.layer.lru.evict(keys)
+        self.layer.publish(keys)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version)
+        self.validate_key(local_key)
+        layer = self.layer
+        if not layer.listening:
+            return self.remote.get(key, default, version=version)
+
+        value = layer.lru.get(local_key)
+        if value is not MISSING:
+            return value
+
+        generation = layer.lru.generation
+        value = self.remote.get(key, MISSING, version=version)
+        if value is MISSING:
+            return default
+        layer.lru.set(local_key, value, generation)
+        return value
+
+    def get_many(self, keys, version=None):
+        layer = self.layer
+        if not layer.listening:
+            return self.remote.get_many(keys, version=version)
+
+        found = {}
+        for key in keys:
+            value = layer.lru.get(self.make_key(key, version))
+            if value is not MISSING:
+                found[key] = value
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            generation = layer.lru.generation
+            fetched = self.remote.get_many(missing, version=version)
+            for key, value in fetched.items():
+                layer.lru.set(self.make_key(key, version), value, generation)
+            found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        if self.layer.listening and self.layer.lru.get(self.make_key(key, version)) is not MISSING:
+            return True
+        return self.remote.has_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.remote.add(key, value, timeout, version=version)
+        if added:
+            self.invalidate([self.make_key(key, version)])
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.remote.set(key, value, timeout, version=version)
+        self.invalidate([self.make_key(key, version)])
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self.remote.set_many(data, timeout, version=version)
+        self.invalidate([self.make_key(key, version) for key in data])
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.remote.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.remote.incr(key, delta, version=version)
+        self.invalidate([self.make_key(key, version)])
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.remote.delete(key, version=version)
+        self.invalidate([self.make_key(key, version)])
+        return bool(deleted)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        if keys:
+            self.remote.delete_many(keys, version=version)
+            self.invalidate([self.make_key(key, version) for key in keys])
+
+    def clear(self):
+        self.remote.clear()
+        self.layer.lru.clear()
+        self.layer.publish(None)
@@ -29,6 +29,7 @@ INSTALLED_APPS = (
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'jet',
     'django.contrib.admin',
     # Third party apps
@@ -108,6 +109,24 @@ CELERY_TIMEZONE = 'UTC'
 CELERY_IMPORTS = [
     'bhealthapp.tasks',
 ]
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-lab-rating-summaries': {
+        'task': 'bhealthapp.tasks.reconcile_lab_rating_summaries',
+        'schedule': timedelta(hours=1),
+    },
+    'reconcile-notification-counters': {
+        'task': 'bhealthapp.tasks.reconcile_notification_counters',
+        'schedule': timedelta(hours=1),
+    },
+    'relay-outbox': {
+        'task': 'bhealthapp.tasks.relay_outbox',
+        'schedule': timedelta(seconds=10),
+    },
+    'generate-thumbnails': {
+        'task': 'src.files.tasks.generate_thumbnails',
+        'schedule': timedelta(seconds=30),
+    },
+}
 
 # Postgres
 DATABASES = {
@@ -142,10 +161,54 @@ STATICFILES_FINDERS = (
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',
 )
 
+# Cache
+# Shared by every process when CACHE_REDIS_URL is set, Django's per-process memory cache otherwise.
+# Each process keeps up to CACHE_LOCAL_MAX_ENTRIES recently read values in memory for at most
+# CACHE_LOCAL_TIMEOUT seconds, writes are broadcast over Redis pub/sub so every worker drops its copy.
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'src.common.cache.LayeredCache',
+            'OPTIONS': {
+                'REMOTE': 'redis',
+                'CHANNEL': 'cache-invalidation',
+                'MAX_ENTRIES': int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', 5000)),
+                'LOCAL_TIMEOUT': int(os.getenv('CACHE_LOCAL_TIMEOUT', 60)),
+            },
+        },
+        'redis': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        },
+    }
+# serialized lab, profile, appointment and result detail payloads, invalidated on save
+DETAIL_CACHE_TIMEOUT = int(os.getenv('DETAIL_CACHE_TIMEOUT', 60 * 60))
+
 # Media files
 MEDIA_ROOT = join(os.path.dirname(BASE_DIR), 'media')
 MEDIA_URL = '/media/'
 
+# result PDFs are only sent through api/v1/result_download after an ownership check:
+# 'django' streams them with Range support, 'x-accel' hands off to nginx's internal location,
+# 's3' redirects to a short lived presigned URL
+RESULT_DOWNLOAD_BACKEND = os.environ.get('RESULT_DOWNLOAD_BACKEND', 'django')
+RESULT_DOWNLOAD_ACCEL_PREFIX = os.environ.get('RESULT_DOWNLOAD_ACCEL_PREFIX', '/protected/media/')
+RESULT_DOWNLOAD_URL_EXPIRE = int(os.environ.get('RESULT_DOWNLOAD_URL_EXPIRE', 300))
+
+# booking: slots start every APPOINTMENT_SLOT_STEP minutes inside the lab's opening hours,
+# labs without LabOpeningHours rows are open 08:00-16:00 on weekdays
+APPOINTMENT_SLOT_STEP = int(os.environ.get('APPOINTMENT_SLOT_STEP', 15))
+APPOINTMENT_BOOKING_MAX_DAYS = int(os.environ.get('APPOINTMENT_BOOKING_MAX_DAYS', 90))
+LAB_DEFAULT_OPENING_HOURS = {weekday: [('08:00', '16:00')] for weekday in range(5)}
+
+# profile pictures are rendered to these bounding boxes (px) as WebP and JPEG once per upload
+PROFILE_PICTURE_SIZES = (64, 128, 360)
+
+# uploaded files get their thumbnails from a celery worker, this many per claimed batch,
+# a claim not finished within the timeout (s) is picked up by another worker
+THUMBNAIL_BATCH_SIZE = int(os.environ.get('THUMBNAIL_BATCH_SIZE', 20))
+THUMBNAIL_CLAIM_TIMEOUT = int(os.environ.get('THUMBNAIL_CLAIM_TIMEOUT', 600))
+
 # Headers
 USE_X_FORWARDED_HOST = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -368,4 +431,29 @@ RABBITMQ_USER = os.environ.get('RABBITMQ_USER', 'guest')
 RABBITMQ_PASSWORD = os.environ.get('RABBITMQ_PASSWORD', 'guest')
 RABBITMQ_VHOST = os.environ.get('RABBITMQ_VHOST', '/')
 RABBITMQ_EXCHANGE = os.environ.get('RABBITMQ_EXCHANGE', 'my_exchange')
+RABBITMQ_PUBLISHER_POOL_SIZE = int(os.environ.get('RABBITMQ_PUBLISHER_POOL_SIZE', 4))
+
+# events are written to the outbox table and relayed to RabbitMQ in batches
+OUTBOX_RELAY_BATCH_SIZE = int(os.environ.get('OUTBOX_RELAY_BATCH_SIZE', 500))
+
+# consumers ack and write notifications per batch
+CONSUMER_PREFETCH_COUNT = int(os.environ.get('CONSUMER_PREFETCH_COUNT', 200))
+CONSUMER_BATCH_SIZE = int(os.environ.get('CONSUMER_BATCH_SIZE', 100))
+CONSUMER_BATCH_TIMEOUT = float(os.environ.get('CONSUMER_BATCH_TIMEOUT', 0.5))
+CONSUMER_ENGINE = os.environ.get('CONSUMER_ENGINE', 'blocking')
+CONSUMER_ASYNC_CONCURRENCY = int(os.environ.get('CONSUMER_ASYNC_CONCURRENCY', 4))
+# consumer processes per queue started by ./manage.py run_consumers
+CONSUMER_WORKERS = {
+    'results': int(os.environ.get('CONSUMER_WORKERS_RESULTS', 1)),
+    'requests': int(os.environ.get('CONSUMER_WORKERS_REQUESTS', 1)),
+    'appointment_updates': int(os.environ.get('CONSUMER_WORKERS_APPOINTMENT_UPDATES', 2)),
+}
+
+# Server-Sent Events at api/v1/notification_stream, served by src.asgi. The consumers NOTIFY
+# NOTIFICATION_STREAM_CHANNEL, every stream process LISTENs on one connection and fans out.
+NOTIFICATION_STREAM_CHANNEL = os.environ.get('NOTIFICATION_STREAM_CHANNEL', 'notifications')
+NOTIFICATION_STREAM_HEARTBEAT = float(os.environ.get('NOTIFICATION_STREAM_HEARTBEAT', 20))
+NOTIFICATION_STREAM_QUEUE_SIZE = int(os.environ.get('NOTIFICATION_STREAM_QUEUE_SIZE', 100))
+NOTIFICATION_STREAM_REPLAY_LIMIT = int(os.environ.get('NOTIFICATION_STREAM_REPLAY_LIMIT', 500))
+NOTIFICATION_STREAM_CONNECT_TIMEOUT = float(os.environ.get('NOTIFICATION_STREAM_CONNECT_TIMEOUT', 5))
 
@@ -25,6 +25,7 @@ AWS_DEFAULT_ACL = 'public-read'
 AWS_AUTO_CREATE_BUCKET = True
 AWS_QUERYSTRING_AUTH = False
 MEDIA_URL = "/media/"
+RESULT_DOWNLOAD_BACKEND = os.getenv('RESULT_DOWNLOAD_BACKEND', 's3')
 
 # https://developers.google.com/web/fundamentals/performance/optimizing-content-efficiency/http-caching#cache-control
 # Response can be cached by browser and any intermediary caches (i.e. it is "public") for up to 1 day
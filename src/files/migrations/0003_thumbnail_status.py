@@ -0,0 +1,35 @@
+# Generated by Django 3.2.12 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import src.files.storage
+
+
+def mark_existing_thumbnails(apps, schema_editor):
+    # Files without a thumbnail stay pending and are picked up by generate_thumbnails.
+    File = apps.get_model('files', 'File')
+    File.objects.exclude(thumbnail__isnull=True).exclude(thumbnail='').update(thumbnail_status=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='thumbnail_status',
+            field=models.PositiveSmallIntegerField(
+                choices=[(0, 'Pending'), (1, 'Ready'), (2, 'Failed'), (3, 'Not an image')], default=0
+            ),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='thumbnail',
+            field=models.ImageField(
+                blank=True, null=True, storage=src.files.storage.content_addressed_storage, upload_to='thumbnails'
+            ),
+        ),
+        migrations.RunPython(mark_existing_thumbnails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.12 on 2026-10-18 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_thumbnail_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='thumbnail_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
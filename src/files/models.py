@@ -1,39 +1,123 @@
-from django.db import models
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Q
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from easy_thumbnails.exceptions import EasyThumbnailsError
-from easy_thumbnails.files import get_thumbnailer
+from django.utils import timezone
 from PIL import UnidentifiedImageError
 
+from .storage import content_addressed_storage
+from .thumbnails import render_thumbnail
+
+logger = logging.getLogger(__name__)
+
+
+class Blob(models.Model):
+    """
+    A file kept once per content by ContentAddressedMixin, with the number of fields
+    referencing it.
+    """
+
+    key = models.CharField(max_length=100, unique=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class FileManager(models.Manager):
+    def render_thumbnails(self, batch_size=20):
+        """
+        Renders thumbnails for a batch of pending files and returns how many were claimed.
+        The batch is claimed in a short transaction with SKIP LOCKED, so several workers can
+        share the backlog, and rendered after it commits, so no row lock or connection is
+        held while images are decoded. Claims expire after THUMBNAIL_CLAIM_TIMEOUT seconds,
+        the files of a worker that died are picked up again. Files with identical content
+        are decoded once.
+        """
+        claimed_at = timezone.now()
+        expired = claimed_at - timedelta(seconds=settings.THUMBNAIL_CLAIM_TIMEOUT)
+        with transaction.atomic():
+            files = list(
+                self.select_for_update(skip_locked=True)
+                .filter(Q(thumbnail_claimed_at__isnull=True) | Q(thumbnail_claimed_at__lt=expired))
+                .filter(thumbnail_status=File.THUMBNAIL_PENDING)
+                .order_by('id')[:batch_size]
+            )
+            self.filter(pk__in=[file.pk for file in files]).update(thumbnail_claimed_at=claimed_at)
+
+        rendered = {}
+        for file in files:
+            if file.file.name not in rendered:
+                rendered[file.file.name] = self._render(file)
+            status, thumbnail = rendered[file.file.name]
+
+            if thumbnail is not None:
+                thumbnail.seek(0)
+                file.thumbnail.save(thumbnail.name, thumbnail, save=False)
+            claim = self.filter(pk=file.pk, thumbnail_status=File.THUMBNAIL_PENDING, thumbnail_claimed_at=claimed_at)
+            if not claim.update(thumbnail=file.thumbnail.name, thumbnail_status=status) and file.thumbnail:
+                # The file is gone or another worker took over the expired claim.
+                file.thumbnail.delete(save=False)
+
+        return len(files)
+
+    def _render(self, file):
+        try:
+            with file.file.open('rb') as source:
+                return File.THUMBNAIL_READY, render_thumbnail(source, File.THUMBNAIL_SIZE)
+        except UnidentifiedImageError:
+            return File.THUMBNAIL_NONE, None
+        except Exception:
+            logger.exception('Rendering thumbnail of file %s failed', file.id)
+            return File.THUMBNAIL_FAILED, None
+
 
 class File(models.Model):
     THUMBNAIL_SIZE = (360, 360)
 
-    file = models.FileField(blank=False, null=False)
-    thumbnail = models.ImageField(blank=True, null=True)
+    THUMBNAIL_PENDING = 0
+    THUMBNAIL_READY = 1
+    THUMBNAIL_FAILED = 2
+    THUMBNAIL_NONE = 3
+
+    THUMBNAIL_STATUS_CHOICES = (
+        (THUMBNAIL_PENDING, 'Pending'),
+        (THUMBNAIL_READY, 'Ready'),
+        (THUMBNAIL_FAILED, 'Failed'),
+        (THUMBNAIL_NONE, 'Not an image'),
+    )
+
+    file = models.FileField(blank=False, null=False, storage=content_addressed_storage)
+    thumbnail = models.ImageField(blank=True, null=True, upload_to='thumbnails', storage=content_addressed_storage)
+    thumbnail_status = models.PositiveSmallIntegerField(choices=THUMBNAIL_STATUS_CHOICES, default=THUMBNAIL_PENDING)
+    thumbnail_claimed_at = models.DateTimeField(blank=True, null=True)
     author = models.ForeignKey('bhealthapp.User', related_name='files', on_delete=models.DO_NOTHING)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = FileManager()
+
 
 @receiver(post_delete, sender=File)
 def auto_delete_file_on_delete(sender, instance, **kwargs):
+    # save=False, the instance is already gone. Identical uploads share one blob, which is
+    # only removed with its last reference.
     if instance.file:
-        instance.file.delete()
+        instance.file.delete(save=False)
 
     if instance.thumbnail:
-        instance.thumbnail.delete()
+        instance.thumbnail.delete(save=False)
 
 
 @receiver(post_save, sender=File)
-def generate_thumbnail(sender, instance=None, created=False, **kwargs):
-    # avoid recursion
-    if created is False:
+def queue_thumbnail(sender, instance=None, created=False, **kwargs):
+    if not created:
         return
 
-    thumbnailer = get_thumbnailer(instance.file.name, relative_name='thumbnail')
-    try:
-        thumbnail = thumbnailer.get_thumbnail({'size': File.THUMBNAIL_SIZE}, save=False)
-    except (UnidentifiedImageError, EasyThumbnailsError):
-        return
-    else:
-        instance.thumbnail.save(name=f'small_{instance.file.name}', content=thumbnail)
+    from .tasks import generate_thumbnails
+
+    # The upload returns right away, clients poll thumbnail_status.
+    transaction.on_commit(lambda: generate_thumbnails.delay())
@@ -6,7 +6,8 @@ from .models import File
 class FileSerializer(serializers.ModelSerializer):
     class Meta:
         model = File
-        fields = ('file', 'thumbnail', 'created_at', 'id')
+        fields = ('file', 'thumbnail', 'thumbnail_status', 'created_at', 'id')
+        read_only_fields = ('thumbnail', 'thumbnail_status')
 
     def create(self, validated_data):
         user = self.context['request'].user
@@ -0,0 +1,114 @@
+import hashlib
+import os
+
+from django.core.files.storage import get_storage_class
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import F
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams the upload to a temporary file and hashes each chunk as it arrives, so the
+    storage does not read the file a second time to find its content address.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+def content_hash(content):
+    sha256 = getattr(content, 'sha256', None)
+    if sha256:
+        return sha256
+
+    sha256 = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    content.seek(0)
+    return sha256.hexdigest()
+
+
+class ContentAddressedMixin:
+    """
+    Stores each distinct file once under its SHA-256 and counts the fields that point
+    at it. Deleting a name only removes the bytes once the last reference is gone, after
+    the deleting transaction commits. Names outside prefix (files saved before this
+    storage) are handled by the base storage as before.
+    """
+
+    prefix = 'cas'
+
+    def is_blob(self, name):
+        return name.startswith(self.prefix + '/')
+
+    def get_available_name(self, name, max_length=None):
+        # The final name depends on the content, see _save. The base _save asks again when
+        # the file for a key already exists, handing back the same key would retry forever.
+        if self.is_blob(name) and super().exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        sha256 = content_hash(content)
+        extension = os.path.splitext(name)[1].lower()
+        key = f'{self.prefix}/{sha256[:2]}/{sha256}{extension}'
+
+        with transaction.atomic():
+            blob, created = Blob.objects.select_for_update().get_or_create(
+                key=key,
+                defaults={'sha256': sha256, 'size': content.size},
+            )
+            if created and super().exists(key):
+                # Left behind by an upload whose transaction rolled back, maybe half written.
+                super().delete(key)
+            if not super().exists(key):
+                try:
+                    super()._save(key, content)
+                except FileExistsError:
+                    # Same key, same content.
+                    pass
+            Blob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+
+        return key
+
+    def delete(self, name):
+        if not self.is_blob(name):
+            return super().delete(name)
+
+        from .models import Blob
+
+        released = Blob.objects.filter(key=name, refcount__gt=0).update(refcount=F('refcount') - 1)
+        if released:
+            transaction.on_commit(lambda: self.collect(name))
+
+    def collect(self, name):
+        """
+        Removes an unreferenced blob. The row lock keeps a concurrent upload of the same
+        content from reusing the file while it is being deleted.
+        """
+        from .models import Blob
+
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(key=name, refcount=0).first()
+            if blob is not None:
+                super().delete(name)
+                blob.delete()
+
+
+def content_addressed_storage(**kwargs):
+    storage_class = get_storage_class()
+    return type(f'ContentAddressed{storage_class.__name__}', (ContentAddressedMixin, storage_class), {})(**kwargs)
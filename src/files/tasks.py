@@ -0,0 +1,37 @@
+import logging
+
+from celery import shared_task
+from django.apps import apps
+from django.conf import settings
+from easy_thumbnails.files import generate_all_aliases
+
+from .models import File
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_thumbnails(max_batches=50):
+    """
+    Renders pending thumbnails until none are left or `max_batches` batches were done.
+    Uploads queue a run on commit, the beat schedule picks up anything they missed.
+    """
+    rendered = 0
+    for _ in range(max_batches):
+        count = File.objects.render_thumbnails(batch_size=settings.THUMBNAIL_BATCH_SIZE)
+        if not count:
+            break
+        rendered += count
+
+    return f"Rendered {rendered} thumbnails"
+
+
+@shared_task
+def generate_aliases(model, pk, field_name):
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is None:
+        return "Missing"
+
+    generate_all_aliases(getattr(instance, field_name), include_global=True)
+
+    return "Done"
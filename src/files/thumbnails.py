@@ -0,0 +1,53 @@
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+FORMATS = {'jpeg': ('JPEG', {'quality': 85, 'optimize': True}), 'webp': ('WEBP', {'quality': 80, 'method': 4})}
+
+
+def render_thumbnail(file, size):
+    """
+    Returns a JPEG (PNG for images with transparency) no larger than `size`.
+
+    draft() lets the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding, and
+    reducing_gap does the rest of the downscale with cheap block reduction before
+    resampling, so large photos are never decoded at full resolution.
+    Raises PIL.UnidentifiedImageError for files that are not images.
+    """
+    with Image.open(file) as image:
+        image.draft('RGB', size)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size, reducing_gap=2.0)
+
+        output = BytesIO()
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image.save(output, 'PNG', optimize=True)
+            extension = 'png'
+        else:
+            image.convert('RGB').save(output, 'JPEG', quality=85, optimize=True)
+            extension = 'jpg'
+
+    return ContentFile(output.getvalue(), name=f'thumbnail.{extension}')
+
+
+def render_variants(file, sizes, formats=('webp', 'jpeg')):
+    """
+    Renders square-bounded variants of an image for every size and format in one decode.
+    Returns {(size, format): bytes}. Sizes are rendered from the largest down, each from
+    the previous one, so only the first resize works on the decoded original.
+    """
+    variants = {}
+    with Image.open(file) as image:
+        image.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+        for size in sorted(sizes, reverse=True):
+            image.thumbnail((size, size), reducing_gap=2.0)
+            for name in formats:
+                image_format, options = FORMATS[name]
+                output = BytesIO()
+                image.save(output, image_format, **options)
+                variants[size, name] = output.getvalue()
+
+    return variants
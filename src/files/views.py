@@ -3,10 +3,23 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
 
 from .serializers import FileSerializer
+from .storage import HashingUploadHandler
 from .models import File
 
 
-class FilesViewset(mixins.CreateModelMixin, viewsets.GenericViewSet):
+class HashingUploadMixin:
+    """
+    Spools uploads to a temporary file in chunks instead of holding them in memory, hashing
+    them on the way. The handler is installed before DRF wraps the request, since the CSRF
+    check of SessionAuthentication reads request.POST and parses the body.
+    """
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [HashingUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+
+class FilesViewset(HashingUploadMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     # MultiPartParser AND FormParser
     # https://www.django-rest-framework.org/api-guide/parsers/#multipartparser
     # "You will typically want to use both FormParser and MultiPartParser
@@ -16,6 +29,10 @@ class FilesViewset(mixins.CreateModelMixin, viewsets.GenericViewSet):
     serializer_class = FileSerializer
     permissions = {'default': (IsAuthenticated,)}
 
+    def get_queryset(self):
+        # Authors poll their uploads here until thumbnail_status leaves pending.
+        return super().get_queryset().filter(author=self.request.user)
+
     def create(self, request, *args, **kwargs):
         """
         Create a MyModel
@@ -12,11 +12,13 @@ from rest_framework_simplejwt.views import (
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from src.files.urls import files_router
 from bhealthapp.views import UserCreate, LabView, LabListView, LabServiceListView, ResultListView, \
     UpcomingAppointmentsLabView, UpcomingAppointmentsUserView, PastAppointmentsLabView, \
     PastAppointmentsUserView, WeRecommendView, ProfileView, PatientsView, ResultView, RequestsView, LabAddView, \
     LabRemoveView, UserLogin, LabCreate, RatingAddView, ResultAddView, UserUpdateView, LabUpdateView, \
-    AddAppointmentView, AppointmentView, NotificationListView, AppointmentUpdateView
+    AddAppointmentView, AppointmentView, NotificationListView, AppointmentUpdateView, ResultDownloadView, \
+    AvailableSlotsView, UnreadNotificationsView, NotificationBulkUpdateView
 
 schema_view = get_schema_view(
     openapi.Info(title="Pastebin API", default_version='v1'),
@@ -41,9 +43,18 @@ urlpatterns = [
                   url(r'api/v1/login', UserLogin.as_view(), name='login'),
                   url(r'^api/v1/labs', LabListView.as_view(), name='labs'),
                   url(r'^api/v1/notifications', NotificationListView.as_view(), name='notifications'),
+                  url(r'^api/v1/unread_notifications', UnreadNotificationsView.as_view(), name='unread_notifications'),
+                  url(r'^api/v1/read_notifications', NotificationBulkUpdateView.as_view(), name='read_notifications'),
+                  url(r'^api/v1/confirm_notifications',
+                      NotificationBulkUpdateView.as_view(changes={'is_confirmed': True, 'is_declined': False}),
+                      name='confirm_notifications'),
+                  url(r'^api/v1/decline_notifications',
+                      NotificationBulkUpdateView.as_view(changes={'is_confirmed': False, 'is_declined': True}),
+                      name='decline_notifications'),
                   url(r'^api/v1/lab_services', LabServiceListView.as_view(), name='lab_services'),
                   url(r'^api/v1/edit_profile_user', UserUpdateView.as_view(), name='edit_profile_user'),
                   url(r'^api/v1/edit_profile_lab', LabUpdateView.as_view(), name='edit_profile_lab'),
+                  url(r'^api/v1/available_slots', AvailableSlotsView.as_view(), name='available_slots'),
                   url(r'^api/v1/add_appointment', AddAppointmentView.as_view(), name='add_appointment'),
                   url(r'^api/v1/update_appointment', AppointmentUpdateView.as_view(), name='update_appointment'),
                   url(r'^api/v1/results', ResultListView.as_view(), name='results_per_lab'),
@@ -61,10 +72,12 @@ urlpatterns = [
                   url(r'^api/v1/add_lab', LabAddView.as_view(), name='add_lab'),
                   url(r'^api/v1/remove_lab', LabRemoveView.as_view(), name='remove_lab'),
                   url('api/v1/we_recommend', WeRecommendView.as_view(), name='top_labs'),
+                  url(r'^api/v1/result_download', ResultDownloadView.as_view(), name='download_result'),
                   url('api/v1/result', ResultView.as_view(), name='get_result'),
                   url('api/v1/profile', ProfileView.as_view(), name='get_profile'),
                   url('api/v1/add_rating', RatingAddView.as_view(), name='add_rating'),
                   url('api/v1/add_result', ResultAddView.as_view(), name='add_result'),
+                  path('api/v1/', include(files_router.urls)),
                   url(r'^api/v1/password_reset/',
                       include('django_rest_passwordreset.urls', namespace='password_reset')),
                   # auth